@@ -0,0 +1,64 @@
+"""
+Benchmark for get_all_invitations_with_details().
+
+Builds synthetic storage files of increasing size and times the join of invitations with
+their groups. With a single-pass join the time per invitation should stay (roughly) constant.
+
+Run from the repository root:  python -m benchmarks.bench_invitation_details
+"""
+
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from services import storage
+
+SIZES = [1_000, 10_000, 50_000, 100_000]
+GROUP_COUNT = 20
+REPEAT = 3
+
+
+def make_storage(path: str, n_invitations: int) -> None:
+    groups = [{
+        "id": str(uuid.uuid4()),
+        "name": f"Groep {i}",
+        "redirect_url": "https://example.org/",
+        "redirect_text": "Example"
+    } for i in range(GROUP_COUNT)]
+    invitations = [{
+        "invitation_id": uuid.uuid4().hex,
+        "guest_id": f"guest{i}",
+        "group_id": groups[i % GROUP_COUNT]['id'],
+        "invitation_mail_address": f"guest{i}@example.org",
+        "datetime_invited": "2025-09-04T09:50:18.460062Z",
+        "datetime_accepted": "2025-09-05T10:00:00.000000Z" if i % 3 == 0 else "",
+        "eppn": "",
+        "eduid_props": {}
+    } for i in range(n_invitations)]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"groups": groups, "invitations": invitations}, f)
+
+
+def main() -> None:
+    print(f"{'invitations':>12} {'total (ms)':>12} {'per row (us)':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in SIZES:
+            path = os.path.join(tmp_dir, f'storage-{n}.json')
+            make_storage(path, n)
+            storage.configure_storage("json", path)
+            storage.get_all_invitations_with_details()  # warm the cache
+
+            best = float('inf')
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                rows = storage.get_all_invitations_with_details()
+                best = min(best, time.perf_counter() - start)
+            assert len(rows) == n
+
+            print(f"{n:>12} {best * 1000:>12.1f} {best / n * 1e6:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
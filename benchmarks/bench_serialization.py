@@ -0,0 +1,83 @@
+"""
+Benchmark for JSON serialisation of storage files and API list responses.
+
+Compares the old path (json.dumps with indent=4 for storage.json; FastAPI's jsonable_encoder
++ json.dumps for responses, if FastAPI is installed) with services.serialization, which uses
+orjson when it is installed.
+
+Run from the repository root:  python -m benchmarks.bench_serialization
+"""
+
+import json
+import time
+
+from benchmarks.bench_invitation_details import GROUP_COUNT
+from services import serialization
+from services.storage.records import Group, Invitation, InvitationDetails
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+SIZES = [10_000, 100_000]
+REPEAT = 3
+
+
+def make_data(n_invitations: int):
+    groups = [Group(id=f"group-{i}", name=f"Groep {i}", redirect_url="https://example.org/",
+                    redirect_text="Example") for i in range(GROUP_COUNT)]
+    invitations = [Invitation(
+        invitation_id=f"{i:032x}",
+        guest_id=f"guest{i}",
+        group_id=groups[i % GROUP_COUNT].id,
+        invitation_mail_address=f"guest{i}@example.org",
+        datetime_invited="2025-09-04T09:50:18.460062Z",
+        datetime_accepted="2025-09-05T10:00:00.000000Z" if i % 3 == 0 else "",
+        revision=i
+    ) for i in range(n_invitations)]
+    return groups, invitations
+
+
+def best_of(func) -> float:
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    print(f"serializer: {serialization.BACKEND}"
+          f"{'' if jsonable_encoder else ' (FastAPI not installed: old API path without jsonable_encoder)'}")
+    print(f"{'invitations':>12} {'case':<22} {'before (ms)':>12} {'after (ms)':>12} {'speed-up':>9}")
+    for n in SIZES:
+        groups, invitations = make_data(n)
+        snapshot = {'groups': [g.to_dict() for g in groups], 'invitations': [i.to_dict() for i in invitations]}
+        group_names = {group.id: group.name for group in groups}
+        details = [InvitationDetails(inv, group_names[inv.group_id]) for inv in invitations]
+        encoded = json.dumps(snapshot)
+
+        def old_response():
+            rows = [row.to_dict() for row in details]
+            if jsonable_encoder is not None:
+                rows = jsonable_encoder(rows)
+            return json.dumps(rows, ensure_ascii=False).encode('utf-8')
+
+        cases = [
+            ('storage write', lambda: json.dumps(snapshot, indent=4, ensure_ascii=False).encode('utf-8'),
+             lambda: serialization.dumps(snapshot)),
+            ('storage write (pretty)', lambda: json.dumps(snapshot, indent=4, ensure_ascii=False).encode('utf-8'),
+             lambda: serialization.dumps(snapshot, pretty=True)),
+            ('storage load', lambda: json.loads(encoded), lambda: serialization.loads(encoded)),
+            ('GET /api/invitations', old_response,
+             lambda: serialization.dumps([row.to_dict() for row in details])),
+        ]
+        for name, before, after in cases:
+            before_ms, after_ms = best_of(before), best_of(after)
+            print(f"{n:>12} {name:<22} {before_ms:>12.1f} {after_ms:>12.1f} {before_ms / after_ms:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
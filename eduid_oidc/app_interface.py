@@ -1,58 +1,157 @@
 # eduID integratie: OIDC -> app
 
 import json
-from typing import Any, Dict, Optional
+import os
+import secrets
+import threading
+from typing import Any, Dict, Optional, Tuple
 
-from nicegui import ui
+from nicegui import app, ui
 
 from services.logging import logger
+from services.metrics import metrics
 from services.session_manager import session_manager
-from services.storage import update_invitation
+from services.storage import async_storage
+from services.ttl_cache import TTLCache
 
 from .oidc_protocol import (
+    ID_TOKEN_ALGORITHMS,
     build_auth_url,
-    exchange_code,
+    close_http_client,
+    exchange_code_async,
     generate_pkce,
-    get_userinfo,
-    load_well_known_config,
+    get_userinfo_async,
+    id_token_header,
+    validate_id_token,
 )
+from .jwks_cache import JWKSCache
+from .provider_cache import ProviderMetadataCache
+
+CONFIG_FILE = 'config.json'
+
+# where a login flow takes the user's claims from: the validated id_token (no extra request),
+# or the userinfo endpoint. With 'id_token' userinfo is still fetched if REQUIRED_CLAIMS are missing.
+CLAIMS_FROM_ID_TOKEN = 'id_token'
+CLAIMS_FROM_USERINFO = 'userinfo'
+REQUIRED_CLAIMS = ('sub', 'eduperson_principal_name')
+# id_token claims that describe the token rather than the user; not stored as user info
+TOKEN_CLAIMS = ('iss', 'aud', 'azp', 'exp', 'iat', 'nbf', 'jti', 'nonce', 'at_hash', 'c_hash', 'auth_time', 'sid')
+
+# (mtime, client config) of CONFIG_FILE; provider metadata cache per .well-known URL
+_client_config: Optional[Tuple[float, Dict[str, Any]]] = None
+_providers: Dict[str, ProviderMetadataCache] = {}
+_providers_lock = threading.Lock()
+# signing keys per jwks_uri (used on the event loop only)
+_signing_keys: Dict[str, JWKSCache] = {}
+
+# pending login flows by their random 'state': code_verifier, nonce, claims_source and browser id.
+# Kept in memory only, so abandoned logins expire and are evicted instead of staying in user storage.
+FLOW_TTL = 600
+MAX_PENDING_FLOWS = 10_000
+_pending_flows = TTLCache(maxsize=MAX_PENDING_FLOWS, ttl=FLOW_TTL)
+
+
+def load_client_config() -> Dict[str, Any]:
+    """Client settings from config.json, re-read only when the file has changed"""
+    global _client_config
+    mtime = os.stat(CONFIG_FILE).st_mtime
+    if _client_config is None or _client_config[0] != mtime:
+        with open(CONFIG_FILE, 'r') as f:
+            _client_config = (mtime, json.load(f))
+    return _client_config[1]
+
+
+def _provider(well_known_url: str) -> ProviderMetadataCache:
+    with _providers_lock:
+        provider = _providers.get(well_known_url)
+        if provider is None:
+            provider = _providers[well_known_url] = ProviderMetadataCache(well_known_url)
+        return provider
 
 
 def load_eduid_config() -> Dict[str, Any]:
-    with open('config.json', 'r') as f:
-        config = json.load(f)
+    """Client config merged with the (cached) .well-known configuration; no network call once warm"""
+    config = load_client_config()
+    return {**config, **_provider(config['DOTWELLKNOWN']).get()}
 
-    # load .well-known configuration
-    well_known_config = load_well_known_config(config['DOTWELLKNOWN'])
-    config.update(well_known_config)
 
-    return config
+async def load_eduid_config_async() -> Dict[str, Any]:
+    """load_eduid_config() for use on the event loop"""
+    config = load_client_config()
+    return {**config, **(await _provider(config['DOTWELLKNOWN']).get_async())}
 
 
-def start_oidc_login(user_state: Dict[str, Any], login_hint: Optional[str] = None, acr_values: Optional[str] = None, force_login: bool = False):
+def prewarm_eduid_config() -> None:
+    """Start loading the provider metadata in the background, so the first login does not wait for it"""
+    try:
+        config = load_client_config()
+    except (OSError, ValueError) as e:
+        logger.warning(f"eduID config not loaded: {e}")
+        return
+    _provider(config['DOTWELLKNOWN']).refresh_in_background()
+
+
+async def close_eduid_config() -> None:
+    with _providers_lock:
+        for provider in _providers.values():
+            provider.close()
+    await close_http_client()
+
+
+async def _id_token_claims(config: Dict[str, Any], id_token: str, nonce: Optional[str]) -> Dict[str, Any]:
+    """Validated claims of the id_token, checked against the provider's (cached) signing keys"""
+    jwks_uri = config['jwks_uri']
+    keys = _signing_keys.get(jwks_uri)
+    if keys is None:
+        keys = _signing_keys[jwks_uri] = JWKSCache(jwks_uri)
+    header = id_token_header(id_token)
+    key = await keys.get_signing_key(header.get('kid'))
+    supported = config.get('id_token_signing_alg_values_supported') or ['RS256']
+    return validate_id_token(
+        id_token,
+        key.key,
+        algorithms=[alg for alg in supported if alg in ID_TOKEN_ALGORITHMS],
+        issuer=config['issuer'],
+        client_id=config['CLIENT_ID'],
+        nonce=nonce
+    )
+
+
+async def start_oidc_login(user_state: Dict[str, Any], login_hint: Optional[str] = None, acr_values: Optional[str] = None,
+                           force_login: bool = False, claims_source: str = CLAIMS_FROM_ID_TOKEN):
     """
     Initiate OIDC login flow and redirect to authorization server.
+    Async, so a cold provider metadata cache is filled without blocking the event loop.
 
     Args:
-        user_state: dictionary to carry oidc state data
+        user_state: user storage; only cleaned of flow data left there by earlier versions
         login_hint: login hint for directing authentication to specific identity provider
         acr_values: optional ACR values to request specific authentication strength
         force_login: whether to force re-authentication (prompt=login)
+        claims_source: CLAIMS_FROM_ID_TOKEN or CLAIMS_FROM_USERINFO (see above)
     """
 
     hint_info = f" with login_hint: {login_hint}" if login_hint else ""
     acr_info = f" with ACR: {acr_values}" if acr_values else ""
     force_info = " (force_login=True)" if force_login else ""
     logger.info(f"Starting OIDC login process{hint_info}{acr_info}{force_info}")
-    config = load_eduid_config()
 
     try:
+        config = await load_eduid_config_async()
+
         # Generate PKCE parameters
         code_verifier, code_challenge = generate_pkce()
         logger.debug(f"Generated PKCE with code_verifier: {code_verifier[:10]}...")
 
-        # Store code_verifier in user state under eduid_oidc namespace
-        user_state['eduid_oidc'] = {'code_verifier': code_verifier}
+        # Register the flow under a random state; only the state travels via the browser
+        state, nonce = secrets.token_urlsafe(32), secrets.token_urlsafe(32)
+        _pending_flows.set(state, {
+            'code_verifier': code_verifier,
+            'nonce': nonce,
+            'claims_source': claims_source,
+            'browser_id': app.storage.browser['id'],
+        })
+        user_state.pop('eduid_oidc', None)
 
         # Build authorization URL
         prompt = "login" if force_login else None
@@ -64,7 +163,9 @@ def start_oidc_login(user_state: Dict[str, Any], login_hint: Optional[str] = Non
             code_challenge=code_challenge,
             acr_values=acr_values,
             prompt=prompt,
-            login_hint=login_hint
+            login_hint=login_hint,
+            state=state,
+            nonce=nonce
         )
 
         logger.info(f"Authorization URL generated successfully, redirecting to: {auth_url}")
@@ -76,31 +177,32 @@ def start_oidc_login(user_state: Dict[str, Any], login_hint: Optional[str] = Non
         ui.notify(f'OIDC Error: {error_msg}', type='negative')
 
 
-def complete_eduid_login(code: str, user_state: Dict[str, Any]):
+async def complete_eduid_login(code: str, state: str):
     """
     Complete eduID OIDC login flow and update application state.
 
     Args:
         code: authorization code from callback
-        user_state: dictionary to carry oidc state data
+        state: state from callback, identifies the pending login flow
     """
     logger.info("Completing eduID OIDC flow")
 
-    # retrieve code_verifier from user state
-    if 'eduid_oidc' not in user_state or 'code_verifier' not in user_state['eduid_oidc']:
-        raise Exception("No code_verifier found - login session may have expired")
+    # consume the pending flow: a state can be used once, and only from the browser that started it
+    oidc_state = _pending_flows.pop(state)
+    if oidc_state is None:
+        raise Exception("Unknown or expired login state - login session may have expired")
+    if oidc_state['browser_id'] != app.storage.browser['id']:
+        raise Exception("Login was started in another browser session")
 
-    code_verifier = user_state['eduid_oidc']['code_verifier']
+    code_verifier = oidc_state['code_verifier']
+    claims_source = oidc_state['claims_source']
     logger.debug(f"Retrieved code_verifier: {code_verifier[:10]}...")
 
-    # clean up OIDC state after retrieving
-    del user_state['eduid_oidc']
-
-    config = load_eduid_config()
+    config = await load_eduid_config_async()
 
     # exchange code for token
     logger.debug("Exchanging authorization code for access token")
-    token_data = exchange_code(
+    token_data = await exchange_code_async(
         token_endpoint=config['token_endpoint'],
         client_id=config['CLIENT_ID'],
         client_secret=config['CLIENT_SECRET'],
@@ -109,12 +211,23 @@ def complete_eduid_login(code: str, user_state: Dict[str, Any]):
         code_verifier=code_verifier
     )
 
-    # getting userinfo
-    logger.debug("Retrieving user info from eduID")
-    userinfo = get_userinfo(
-        userinfo_endpoint=config['userinfo_endpoint'],
-        token_data=token_data
-    )
+    userinfo = None
+    if claims_source == CLAIMS_FROM_ID_TOKEN and token_data.get('id_token'):
+        claims = await _id_token_claims(config, token_data['id_token'], oidc_state['nonce'])
+        if all(claims.get(claim) for claim in REQUIRED_CLAIMS):
+            userinfo = {key: value for key, value in claims.items() if key not in TOKEN_CLAIMS}
+            metrics.inc('oidc_claims_from_id_token')
+        else:
+            logger.debug("id_token lacks required claims, falling back to userinfo")
+
+    if userinfo is None:
+        # getting userinfo
+        logger.debug("Retrieving user info from eduID")
+        userinfo = await get_userinfo_async(
+            userinfo_endpoint=config['userinfo_endpoint'],
+            token_data=token_data
+        )
+        metrics.inc('oidc_userinfo_requests')
     logger.info(f"User info retrieved successfully for user: {userinfo.get('sub', '')}")
 
     # update onboarding state
@@ -137,7 +250,7 @@ def complete_eduid_login(code: str, user_state: Dict[str, Any]):
         userinfo_copy = userinfo.copy()
         eppn = userinfo_copy.pop('eduperson_principal_name', '')
 
-        success = update_invitation(
+        success = await async_storage.update_invitation(
             current_invite_code,
             eppn=eppn,
             eduid_props=userinfo_copy
@@ -150,6 +263,7 @@ def complete_eduid_login(code: str, user_state: Dict[str, Any]):
         logger.warning("No current invite_code found in onboarding state during eduID completion")
 
 
-def start_eduid_login(user_state: Dict[str, Any], acr_values: Optional[str] = None, force_login: bool = False):
+async def start_eduid_login(user_state: Dict[str, Any], acr_values: Optional[str] = None, force_login: bool = False):
     """Backward compatibility wrapper for start_oidc_login with eduID hint"""
-    return start_oidc_login(user_state, login_hint="https://login.test.eduid.nl", acr_values=acr_values, force_login=force_login)
+    await start_oidc_login(user_state, login_hint="https://login.test.eduid.nl", acr_values=acr_values,
+                           force_login=force_login)
@@ -0,0 +1,74 @@
+"""
+Cache of a provider's id_token signing keys (JWK Set from its jwks_uri).
+
+Keys are kept for the Cache-Control max-age of the JWK Set (clamped as for the provider metadata).
+A token signed with an unknown 'kid' means the provider rotated its keys: the set is fetched
+again, at most once per MIN_REFETCH_INTERVAL so that forged kids cannot make us hammer the provider.
+If a refetch fails, keys that are still known keep being used.
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional
+
+import jwt
+
+from services.logging import logger
+
+from .oidc_protocol import fetch_jwks_async
+from .provider_cache import DEFAULT_TTL, MAX_TTL, MIN_TTL
+
+MIN_REFETCH_INTERVAL = 10.0
+
+
+class JWKSCache:
+    """Signing keys of one provider, by kid; use on the event loop"""
+
+    def __init__(self, jwks_uri: str):
+        self.jwks_uri = jwks_uri
+        self._keys: Dict[Optional[str], jwt.PyJWK] = {}
+        self._expires = 0.0
+        self._fetched = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_signing_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        """
+        The key with this kid (or the only key, for tokens without kid).
+
+        Raises:
+            jwt.PyJWKClientError: If there is no such key, also after refetching the set
+        """
+        now = time.monotonic()
+        key = self._find(kid)
+        if key is not None and now < self._expires:
+            return key
+        if now - self._fetched >= MIN_REFETCH_INTERVAL:
+            async with self._lock:
+                # another login may have refetched while we waited
+                if self._fetched <= now:
+                    await self._refetch()
+            key = self._find(kid)
+        if key is None:
+            raise jwt.PyJWKClientError(f"No signing key found for kid {kid!r} in {self.jwks_uri}")
+        return key
+
+    def _find(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        return self._keys.get(kid)
+
+    async def _refetch(self) -> None:
+        self._fetched = time.monotonic()
+        try:
+            jwks, max_age = await fetch_jwks_async(self.jwks_uri)
+            key_set = jwt.PyJWKSet([key for key in jwks.get('keys', []) if key.get('use', 'sig') == 'sig'])
+        except Exception as e:
+            if not self._keys:
+                raise
+            logger.warning(f"Refreshing signing keys from {self.jwks_uri} failed, using cached keys: {e}")
+            return
+        ttl = min(max(DEFAULT_TTL if max_age is None else max_age, MIN_TTL), MAX_TTL)
+        self._keys = {key.key_id: key for key in key_set.keys}
+        self._expires = self._fetched + ttl
+        logger.debug(f"Signing keys from {self.jwks_uri} cached for {ttl:.0f}s: {list(self._keys)}")
+
@@ -1,19 +1,43 @@
 # http/s endpoints for eduID OIDC: callback and error pages
 # when eduID login is completed, calls complete_eduid_login with updated session_state
 
-from nicegui import ui
+import asyncio
+import hashlib
+
+from nicegui import app, background_tasks, ui
 from .app_interface import complete_eduid_login
 from services.logging import logger
+from services.metrics import metrics
+from services.ttl_cache import TTLCache
+
+# login completion per (browser, authorization code): a reload or double hit of the callback URL
+# attaches to the running or finished completion instead of redeeming the code again
+COMPLETION_TTL = 600
+_completions = TTLCache(maxsize=10_000, ttl=COMPLETION_TTL)
+
+
+def _completion(code: str, state: str) -> asyncio.Task:
+    """The (possibly already running or finished) task completing the login for this code"""
+    key = (app.storage.browser['id'], hashlib.sha256(code.encode('utf-8')).hexdigest())
+    task = _completions.get(key)
+    if task is not None:
+        metrics.inc('oidc_callback_duplicates')
+        logger.info("OIDC callback for a code that is already being processed, attaching to its result")
+        return task
+    # the task copies the request context, so it completes the login for this browser's user storage
+    task = background_tasks.create(complete_eduid_login(code, state), name='complete_eduid_login')
+    _completions.set(key, task)
+    return task
 
 
 @ui.page('/oidc_callback')
-def oidc_callback(code: str = "", error: str = ""):
+def oidc_callback(code: str = "", state: str = "", error: str = ""):
     """Handle OIDC callback from authorization server"""
     logger.info(f"OIDC callback received - code: {'present' if code else 'missing'}, error: {error}")
 
     ui.page_title('Processing Authentication...')
 
-    with ui.column().classes('max-w-2xl mx-auto p-6 text-center'):
+    with ui.column().classes('max-w-2xl mx-auto p-6 text-center') as container:
         if error:
             logger.error(f"OIDC authorization error received: {error}")
             # Handle authorization error
@@ -23,29 +47,43 @@ def oidc_callback(code: str = "", error: str = ""):
                 '/accept')).classes('bg-blue-500 text-white')
             return
 
-        if not code:
-            logger.error("OIDC callback received without authorization code")
+        if not code or not state:
+            logger.error("OIDC callback received without authorization code or state")
             ui.label('Authentication Error').classes('text-2xl font-bold text-red-600 mb-4')
-            ui.label('No authorization code received').classes('text-lg mb-4')
+            ui.label('No authorization code or state received').classes('text-lg mb-4')
             ui.button('Return to Accept Page', on_click=lambda: ui.navigate.to(
                 '/accept')).classes('bg-blue-500 text-white')
             return
 
         logger.info("Processing OIDC authorization code")
-        # Show loading message
-        ui.label('Processing Authentication...').classes('text-xl mb-4')
-        ui.spinner(size='lg')
+        # Show loading message; the page is sent right away and the result pushed when it is there
+        processing = ui.label('Processing Authentication...').classes('text-xl mb-4')
+        spinner = ui.spinner(size='lg')
 
-        try:
-            # Complete eduID login using app.storage.user
-            from nicegui import app
-            logger.debug("Completing eduID login flow")
+    # Complete eduID login in the background
+    logger.debug("Completing eduID login flow")
+    completion = _completion(code, state)
 
-            # Complete login and update application state
-            complete_eduid_login(code, app.storage.user)
-
-            logger.info("eduID authentication completed successfully")
+    async def show_result():
+        try:
+            # shielded: a closed browser tab must not cancel the login itself
+            await asyncio.shield(completion)
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"eduID authentication failed: {error_msg}")
+            processing.delete()
+            spinner.delete()
+            with container:
+                ui.label('Authentication Failed').classes('text-xl font-bold text-red-600 mb-4')
+                ui.label(f'Error: {error_msg}').classes('text-lg mb-4')
+                ui.button('Return to Accept Page', on_click=lambda: ui.navigate.to(
+                    '/accept')).classes('bg-blue-500 text-white')
+            return
 
+        logger.info("eduID authentication completed successfully")
+        processing.delete()
+        spinner.delete()
+        with container:
             # Success - redirect back to accept page
             ui.label('Authentication Successful!').classes('text-xl font-bold text-green-600 mb-4')
             ui.label('Redirecting...').classes('text-lg mb-4')
@@ -53,14 +91,8 @@ def oidc_callback(code: str = "", error: str = ""):
             # Auto-redirect after a short delay
             ui.timer(2.0, lambda: ui.navigate.to('/accept'), once=True)
 
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"eduID authentication failed: {error_msg}")
-
-            ui.label('Authentication Failed').classes('text-xl font-bold text-red-600 mb-4')
-            ui.label(f'Error: {error_msg}').classes('text-lg mb-4')
-            ui.button('Return to Accept Page', on_click=lambda: ui.navigate.to(
-                '/accept')).classes('bg-blue-500 text-white')
+    # runs once the browser is connected, so the result goes out over the websocket
+    ui.timer(0, show_result, once=True)
 
 
 @ui.page('/oidc_error')
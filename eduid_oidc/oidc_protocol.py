@@ -1,14 +1,76 @@
 """
 Pure OIDC client implementation.
 Generic OIDC protocol functions with no application-specific logic.
+
+The *_async variants share one pooled HTTP/2 client (see get_http_client) and are meant for
+use on the event loop; the blocking variants share one requests session.
 """
 
+import asyncio
 import base64
 import hashlib
 import os
 import re
+import httpx
+import jwt
 import requests
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional
+
+# signature algorithms accepted for id_tokens (never 'none' or HMAC with the client secret)
+ID_TOKEN_ALGORITHMS = ('RS256', 'RS384', 'RS512', 'PS256', 'PS384', 'PS512', 'ES256', 'ES384', 'ES512', 'EdDSA')
+# allowed clock skew in seconds for exp/iat/nbf
+ID_TOKEN_LEEWAY = 60
+
+# (connect, read) timeouts in seconds for all provider requests
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 10.0
+# at most this many async provider requests in flight per process; others wait up to POOL_TIMEOUT
+MAX_CONCURRENT_REQUESTS = 20
+POOL_TIMEOUT = 10.0
+
+_session = requests.Session()
+_http_client: Optional[httpx.AsyncClient] = None
+_request_slots: Optional[asyncio.Semaphore] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    The shared async client: keep-alive connection pool, HTTP/2 where the provider supports it.
+    Created on first use, on the running event loop.
+    """
+    global _http_client, _request_slots
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS, max_keepalive_connections=MAX_CONCURRENT_REQUESTS),
+        )
+        _request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared async client (call from app.on_shutdown)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def _request(method: str, url: str, **kwargs) -> httpx.Response:
+    client = get_http_client()
+    assert _request_slots is not None
+    # with HTTP/2 many requests share one connection, so the pool alone does not bound them
+    try:
+        await asyncio.wait_for(_request_slots.acquire(), POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise httpx.PoolTimeout(f"No free slot for {method} {url}")
+    try:
+        response = await client.request(method, url, **kwargs)
+    finally:
+        _request_slots.release()
+    response.raise_for_status()
+    return response
 
 
 def generate_pkce() -> Tuple[str, str]:
@@ -34,7 +96,9 @@ def build_auth_url(
     scope: str = "openid profile email",
     acr_values: Optional[str] = None,
     prompt: Optional[str] = None,
-    login_hint: Optional[str] = None
+    login_hint: Optional[str] = None,
+    state: Optional[str] = None,
+    nonce: Optional[str] = None
 ) -> str:
     """
     Build OIDC authorization URL.
@@ -48,6 +112,8 @@ def build_auth_url(
         acr_values: Authentication Context Class Reference values
         prompt: OIDC prompt parameter (e.g., 'login' to force re-authentication)
         login_hint: Login hint for directing authentication to specific identity provider
+        state: Opaque value returned in the callback, identifies the login flow
+        nonce: Value the provider puts in the id_token, binds the token to the flow
 
     Returns:
         Authorization URL
@@ -70,6 +136,12 @@ def build_auth_url(
     if login_hint:
         params["login_hint"] = login_hint
 
+    if state:
+        params["state"] = state
+
+    if nonce:
+        params["nonce"] = nonce
+
     param_string = "&".join([f"{k}={requests.utils.quote(str(v))}" for k, v in params.items()])  # type: ignore
     return f"{authorization_endpoint}?{param_string}"
 
@@ -108,11 +180,39 @@ def exchange_code(
         'code_verifier': code_verifier,
     }
 
-    response = requests.post(token_endpoint, data=token_params)
+    response = _session.post(token_endpoint, data=token_params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
     response.raise_for_status()
     return response.json()
 
 
+async def exchange_code_async(
+    token_endpoint: str,
+    client_id: str,
+    client_secret: str,
+    redirect_uri: str,
+    code: str,
+    code_verifier: str
+) -> Dict[str, Any]:
+    """
+    Exchange authorization code for access token, without blocking the event loop.
+    Same arguments and result as exchange_code().
+
+    Raises:
+        httpx.HTTPError: If token exchange fails or times out
+    """
+    token_params = {
+        'grant_type': 'authorization_code',
+        'code': code,
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'redirect_uri': redirect_uri,
+        'code_verifier': code_verifier,
+    }
+
+    response = await _request('POST', token_endpoint, data=token_params)
+    return response.json()
+
+
 def get_userinfo(userinfo_endpoint: str, token_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Get user information using access token.
@@ -127,11 +227,78 @@ def get_userinfo(userinfo_endpoint: str, token_data: Dict[str, Any]) -> Dict[str
     Raises:
         requests.HTTPError: If userinfo request fails
     """
-    response = requests.post(userinfo_endpoint, data=token_data)
+    response = _session.get(userinfo_endpoint, headers=_bearer(token_data), timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
     response.raise_for_status()
     return response.json()
 
 
+async def get_userinfo_async(userinfo_endpoint: str, token_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get user information using access token, without blocking the event loop.
+    Same arguments and result as get_userinfo().
+
+    Raises:
+        httpx.HTTPError: If userinfo request fails or times out
+    """
+    response = await _request('GET', userinfo_endpoint, headers=_bearer(token_data))
+    return response.json()
+
+
+def _bearer(token_data: Dict[str, Any]) -> Dict[str, str]:
+    # only the access token is sent, as Authorization header (RFC 6750)
+    return {'Authorization': f"Bearer {token_data['access_token']}"}
+
+
+def cache_max_age(cache_control: Optional[str]) -> Optional[float]:
+    """
+    Seconds a response may be cached according to its Cache-Control header.
+
+    Returns:
+        max-age (0 for no-cache / no-store), or None if the header does not say
+    """
+    if not cache_control:
+        return None
+    directives = [directive.strip().lower() for directive in cache_control.split(',')]
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0.0
+    for directive in directives:
+        if directive.startswith('max-age='):
+            try:
+                return max(float(directive[len('max-age='):]), 0.0)
+            except ValueError:
+                return None
+    return None
+
+
+def fetch_well_known_config(well_known_url: str) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    Load OIDC configuration from .well-known endpoint, with its cache lifetime.
+
+    Args:
+        well_known_url: .well-known/openid-configuration URL
+
+    Returns:
+        Tuple[OIDC configuration, max-age in seconds from Cache-Control or None]
+
+    Raises:
+        requests.HTTPError: If config request fails
+    """
+    response = _session.get(well_known_url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    response.raise_for_status()
+    return response.json(), cache_max_age(response.headers.get('Cache-Control'))
+
+
+async def fetch_well_known_config_async(well_known_url: str) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    Async variant of fetch_well_known_config().
+
+    Raises:
+        httpx.HTTPError: If config request fails or times out
+    """
+    response = await _request('GET', well_known_url)
+    return response.json(), cache_max_age(response.headers.get('Cache-Control'))
+
+
 def load_well_known_config(well_known_url: str) -> Dict[str, Any]:
     """
     Load OIDC configuration from .well-known endpoint.
@@ -145,6 +312,78 @@ def load_well_known_config(well_known_url: str) -> Dict[str, Any]:
     Raises:
         requests.HTTPError: If config request fails
     """
-    response = requests.get(well_known_url)
-    response.raise_for_status()
-    return response.json()
+    return fetch_well_known_config(well_known_url)[0]
+
+
+async def load_well_known_config_async(well_known_url: str) -> Dict[str, Any]:
+    """Async variant of load_well_known_config()"""
+    return (await fetch_well_known_config_async(well_known_url))[0]
+
+
+async def fetch_jwks_async(jwks_uri: str) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    Load the provider's signing keys (JWK Set) from its jwks_uri.
+
+    Returns:
+        Tuple[JWK Set, max-age in seconds from Cache-Control or None]
+
+    Raises:
+        httpx.HTTPError: If the request fails or times out
+    """
+    response = await _request('GET', jwks_uri)
+    return response.json(), cache_max_age(response.headers.get('Cache-Control'))
+
+
+def id_token_header(id_token: str) -> Dict[str, Any]:
+    """
+    The (unverified) JOSE header of an id_token, to look up its signing key by 'kid'.
+
+    Raises:
+        jwt.InvalidTokenError: If the token is malformed or not signed with an accepted algorithm
+    """
+    header = jwt.get_unverified_header(id_token)
+    if header.get('alg') not in ID_TOKEN_ALGORITHMS:
+        raise jwt.InvalidAlgorithmError(f"id_token algorithm not accepted: {header.get('alg')}")
+    return header
+
+
+def validate_id_token(
+    id_token: str,
+    key: Any,
+    algorithms: List[str],
+    issuer: str,
+    client_id: str,
+    nonce: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Verify an id_token's signature and claims (OIDC Core 3.1.3.7).
+
+    Args:
+        id_token: The id_token from the token response
+        key: Public key of the provider (PyJWK.key) matching the token's kid
+        algorithms: Accepted signature algorithms
+        issuer: Expected 'iss' (the provider's issuer)
+        client_id: Expected audience
+        nonce: Expected 'nonce', if one was sent in the authorization request
+
+    Returns:
+        The token's claims
+
+    Raises:
+        jwt.InvalidTokenError: If the signature or any claim is invalid
+    """
+    claims = jwt.decode(
+        id_token,
+        key,
+        algorithms=algorithms,
+        audience=client_id,
+        issuer=issuer,
+        leeway=ID_TOKEN_LEEWAY,
+        options={'require': ['iss', 'sub', 'aud', 'exp', 'iat']},
+    )
+    audience = claims['aud']
+    if isinstance(audience, list) and len(audience) > 1 and claims.get('azp') != client_id:
+        raise jwt.InvalidAudienceError("id_token azp does not match client_id")
+    if nonce is not None and claims.get('nonce') != nonce:
+        raise jwt.InvalidTokenError("id_token nonce mismatch")
+    return claims
@@ -0,0 +1,113 @@
+"""
+Process-wide cache of OIDC provider metadata (.well-known/openid-configuration).
+
+The document is fetched once and kept for its Cache-Control max-age (clamped to
+[MIN_TTL, MAX_TTL], DEFAULT_TTL without one). A background timer refreshes it shortly before
+it expires, so requests never wait for the provider; if a refresh fails, the stale copy keeps
+being served and the refresh is retried.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.logging import logger
+
+from .oidc_protocol import fetch_well_known_config, fetch_well_known_config_async
+
+DEFAULT_TTL = 3600.0
+MIN_TTL = 60.0
+MAX_TTL = 86400.0
+# refresh when this fraction of the lifetime is left
+REFRESH_MARGIN = 0.1
+RETRY_INTERVAL = 30.0
+
+Fetcher = Callable[[str], Tuple[Dict[str, Any], Optional[float]]]
+
+
+class ProviderMetadataCache:
+    """Metadata of one provider, refreshed in the background"""
+
+    def __init__(self, url: str, fetch: Fetcher = fetch_well_known_config):
+        self.url = url
+        self._fetch = fetch
+        self._metadata: Optional[Dict[str, Any]] = None
+        self._expires = 0.0
+        # guards the cached copy only, never held during a fetch (get_async takes it on the event loop)
+        self._lock = threading.Lock()
+        # held by the background refresh, so at most one runs at a time
+        self._refreshing = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def get(self) -> Dict[str, Any]:
+        """The metadata; fetched now only if there is no copy at all (also not a stale one)"""
+        metadata = self._metadata
+        if metadata is None:
+            return self.refresh()
+        if time.monotonic() >= self._expires:
+            # the timer should have refreshed it: the provider is down, or the timer died
+            self.refresh_in_background()
+        return metadata
+
+    async def get_async(self) -> Dict[str, Any]:
+        """Like get(), but a first fetch does not block the event loop"""
+        if self._metadata is not None:
+            return self.get()
+        metadata, max_age = await fetch_well_known_config_async(self.url)
+        with self._lock:
+            if self._metadata is None:
+                self._store(metadata, max_age)
+            return self._metadata
+
+    def refresh(self) -> Dict[str, Any]:
+        """
+        Fetch the metadata now and schedule the next refresh.
+        On failure the previous copy is returned (and the refresh retried), or the error raised if there is none.
+        """
+        try:
+            metadata, max_age = self._fetch(self.url)
+        except Exception as e:
+            with self._lock:
+                self._schedule(RETRY_INTERVAL)
+                cached = self._metadata
+            if cached is None:
+                raise
+            logger.warning(f"Refreshing OIDC metadata from {self.url} failed, serving cached copy: {e}")
+            return cached
+        with self._lock:
+            self._store(metadata, max_age)
+        return metadata
+
+    def _store(self, metadata: Dict[str, Any], max_age: Optional[float]) -> None:
+        ttl = min(max(DEFAULT_TTL if max_age is None else max_age, MIN_TTL), MAX_TTL)
+        self._metadata = metadata
+        self._expires = time.monotonic() + ttl
+        self._schedule(ttl * (1 - REFRESH_MARGIN))
+        logger.debug(f"OIDC metadata from {self.url} cached for {ttl:.0f}s")
+
+    def refresh_in_background(self) -> None:
+        """Refresh on a background thread, unless one is already running"""
+        if not self._refreshing.acquire(blocking=False):
+            return
+        threading.Thread(target=self._refresh_quietly, name='oidc-metadata', daemon=True).start()
+
+    def _refresh_quietly(self) -> None:
+        # runs with self._refreshing held (see refresh_in_background)
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Loading OIDC metadata from {self.url} failed: {e}")
+        finally:
+            self._refreshing.release()
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self.refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -3,11 +3,15 @@ from nicegui import app, ui
 
 # register routes
 import eduid_oidc.oidc_callback
+from eduid_oidc.app_interface import close_eduid_config, prewarm_eduid_config
 import routes.accept
 import routes.api
 import routes.landing
 import routes.m  # all /m routes
+from services.expiry_sweeper import start_expiry_sweeper, stop_expiry_sweeper
 from services.logging import logger, setup_logging
+from services.storage import close_storage, configure_storage
+from services.storage.retention import configure_retention, start_retention, stop_retention
 
 try:
     settings = json.load(open('settings.json'))
@@ -22,6 +26,30 @@ DTAP, STORAGE_SECRET, LOG_LEVEL, CONSOLE_LOGGING = (
     settings.get('console_logging', False)
 )
 
+configure_storage(
+    backend=settings.get('storage_backend', 'json'),
+    path=settings.get('storage_path') or None,
+    journal=settings.get('storage_journal', False),
+    compact_interval=settings.get('storage_compact_interval', 60),
+    pretty=settings.get('storage_pretty', False),
+    batch_window=settings.get('storage_batch_window_ms', 5) / 1000,
+    batch_max_size=settings.get('storage_batch_max_size', 500)
+)
+configure_retention(
+    archive_path=settings.get('archive_path') or None,
+    accepted_days=settings.get('retention_accepted_days'),
+    pending_days=settings.get('retention_pending_days'),
+    tombstone_days=settings.get('retention_tombstone_days', 30),
+    interval=settings.get('retention_interval_minutes', 60) * 60
+)
+app.on_startup(prewarm_eduid_config)
+app.on_startup(start_retention)
+app.on_startup(lambda: start_expiry_sweeper(settings.get('expiry_sweep_interval_seconds', 60)))
+app.on_shutdown(close_eduid_config)
+app.on_shutdown(stop_retention)
+app.on_shutdown(stop_expiry_sweeper)
+app.on_shutdown(close_storage)
+
 setup_logging(
     log_file='eduidm.log',
     level=LOG_LEVEL,
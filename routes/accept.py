@@ -1,44 +1,92 @@
 # /accept route: self-service page showing onboarding progress
 
+from typing import Optional
+
 from nicegui import app, ui
 
 from eduid_oidc.app_interface import start_eduid_login, start_oidc_login
 from services.logging import logger
+from services.metrics import metrics
+from services.rate_limit import TokenBucketLimiter
 from services.scim_service import scim_provisioning
 from services.session_manager import session_manager
-from services.storage import (
-    find_group_by_id,
-    find_invitation_by_code,
-    mark_invitation_accepted,
-)
+from services.storage import async_storage
+
+
+# failed code attempts per client IP: bursts of 30, then one per 6 seconds; valid codes don't count,
+# so guests behind one NAT address can open their links as often as they like
+code_attempts = TokenBucketLimiter(rate=1 / 6, burst=30)
+
+
+def _client_ip() -> str:
+    request = ui.context.client.request
+    return request.client.host if request is not None and request.client else 'unknown'
 
 
-def process_invite_code(invite_code: str):
+async def process_invite_code(invite_code: str):
     """Check invite code; if valid, add invite code & group details to session state"""
 
-    invitation = find_invitation_by_code(invite_code.strip())
-    if invitation:
-        group = find_group_by_id(invitation['group_id'])
+    invite_code = invite_code.strip()
+    client_ip = _client_ip()
+    if code_attempts.limited(client_ip):
+        logger.warning(f"Too many invite code attempts from {client_ip}")
+        metrics.inc('accept_rate_limited')
+        ui.notify('Te veel pogingen; probeer het over een minuut opnieuw', type='negative')
+        return
+    # codes that were never issued are rejected from memory, without a storage lookup
+    if not await async_storage.invitation_code_may_exist(invite_code):
+        logger.warning(f"Invalid invite_code attempted: {invite_code}")
+        metrics.inc('accept_rejected_unknown')
+        code_attempts.allow(client_ip)
+        ui.notify('Ongeldige uitnodigingscode', type='negative')
+        return
+
+    invitation = await async_storage.find_invitation_by_code(invite_code)
+    if invitation and invitation.is_expired():
+        # checked on expires_at itself, so also before the sweeper has marked it
+        logger.warning(f"Expired invite_code attempted: {invite_code}")
+        metrics.inc('accept_rejected_expired')
+        code_attempts.allow(client_ip)
+        ui.notify('Deze uitnodiging is verlopen', type='negative')
+    elif invitation:
+        group = await async_storage.find_group_by_id(invitation.group_id)
         if group:
             # Update state with all relevant data
             state = session_manager.state
             state['invite_code'] = invite_code
-            state['group_name'] = group['name']
-            state['redirect_url'] = group.get('redirect_url', '')
-            state['redirect_text'] = group.get('redirect_text', '')
+            state['group_name'] = group.name
+            state['redirect_url'] = group.redirect_url
+            state['redirect_text'] = group.redirect_text
             state['steps_completed']['code_entered'] = True
             ui.navigate.to('/accept')
         else:
-            logger.error(f"Group not found for group_id: {invitation['group_id']}")
+            logger.error(f"Group not found for group_id: {invitation.group_id}")
             ui.notify('Ongeldige uitnodigingscode (groep niet gevonden)', type='negative')
     else:
         logger.warning(f"Invalid invite_code attempted: {invite_code}")
+        code_attempts.allow(client_ip)
         ui.notify('Ongeldige uitnodigingscode', type='negative')
 
 
+async def accept_invite_code(invite_code: str) -> Optional[str]:
+    """Mark the invitation accepted; None if that worked, else why not (to show the guest)"""
+    if await async_storage.mark_invitation_accepted(invite_code):
+        return None
+    invitation = await async_storage.find_invitation_by_code(invite_code)
+    if invitation is None:
+        logger.warning(f"Accepting unknown invite_code: {invite_code}")
+        return 'Ongeldige uitnodigingscode'
+    if invitation.datetime_accepted:
+        logger.warning(f"Invite_code already accepted: {invite_code}")
+        return 'Deze uitnodiging is al geaccepteerd'
+    logger.warning(f"Invite_code expired before acceptance: {invite_code}")
+    metrics.inc('accept_rejected_expired')
+    return 'Deze uitnodiging is verlopen'
+
+
 @ui.page('/accept')
 @ui.page('/accept/{invite_code}')
-def accept_invitation(invite_code: str = ""):
+async def accept_invitation(invite_code: str = ""):
     def create_step_card(step_num: int, title: str, is_completed: bool, content_func):
         """Create a step card with conditional content"""
         status_color = 'positive' if is_completed else 'grey'
@@ -57,7 +105,16 @@ def accept_invitation(invite_code: str = ""):
 
     # Update state from invite_code parameter using consolidated logic
     if invite_code:
-        process_invite_code(invite_code)
+        await process_invite_code(invite_code)
+
+    # set datetime_accepted once; it fails if the invitation expired (or was accepted elsewhere) meanwhile
+    accept_error = None
+    if state['steps_completed']['mfa_verified'] and not state.get('invitation_accepted'):
+        accept_error = await accept_invite_code(state['invite_code'])
+        if accept_error:
+            ui.notify(accept_error, type='negative')
+        else:
+            state['invitation_accepted'] = True
 
     suffix = f"{state['group_name']}" if state['group_name'] else ""
     title = f"Uitnodiging - {suffix}" if suffix else "Uitnodiging"
@@ -176,8 +233,9 @@ def accept_invitation(invite_code: str = ""):
         def step4_content():
             # deze stap nog om te bouwen naar check op iDIN?
             # bij voorkeur configureerbare lijst met ACR's...
-            if state['steps_completed']['mfa_verified']:
-                mark_invitation_accepted(state['invite_code'])      # update datetime_accepted
+            if accept_error:
+                ui.label(f'{accept_error}; uw eduID is niet gekoppeld.').classes('text-red-600 mt-2')
+            elif state['steps_completed']['mfa_verified']:
                 with ui.column().classes('mt-2'):
                     ui.label('✓ Uw eduID is nu gekoppeld!').classes('text-green-600 mb-2')
                     redirect_url = state.get('redirect_url', 'https://canvas.uva.nl/')
@@ -188,8 +246,8 @@ def accept_invitation(invite_code: str = ""):
                 ui.label('Voltooi eerst de vorige stappen').classes('text-gray-500 mt-2')
 
         create_step_card(4, 'Stap 4. Toegang naar de applicatie',
-                         state['steps_completed']['completed'], step4_content)
+                         state['steps_completed']['completed'] and not accept_error, step4_content)
 
         # Show SCIM provisioning dialog if flag is set
         if 'show_scim_dialog' in state and state['show_scim_dialog']:
-            scim_provisioning()
+            await scim_provisioning()
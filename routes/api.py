@@ -3,46 +3,286 @@ RESTful API endpoints for eduIDM application.
 Provides JSON API access to invitations and groups data.
 """
 
+import asyncio
+import csv
+import hashlib
+import io
 import json
+from typing import Any, Iterator, List, Optional
 
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from nicegui import app
 
+from services import serialization
+from services.invitation_import import import_invitations_csv
 from services.logging import logger
-from services.storage import (
-    create_invitation,
-    find_group_by_name,
-    get_all_groups,
-    get_all_invitations_with_details,
-)
+from services.metrics import metrics
+from services.storage import async_storage
+from services.storage.storage import EXPORT_FIELDS, ChangesPruned
+from services.ttl_cache import TTLCache
 
 
-# GET /api/invitations - return all invitations
+MAX_PAGE_SIZE = 1000
+MAX_CHANGES_WAIT = 60
+MAX_BATCH_SIZE = 10000
+# longest NDJSON line (one invitation) accepted in a batch
+MAX_LINE_BYTES = 64 * 1024
+
+# Idempotency-Key -> (sha256 of the request body, task creating the response); per process
+IDEMPOTENCY_TTL = 24 * 3600
+_idempotent_requests = TTLCache(maxsize=100_000, ttl=IDEMPOTENCY_TTL)
+
+INVITATION_FIELDS = ['guest_id', 'group_name', 'invitation_mail_address']
+
+
+class JSONBytesResponse(Response):
+    """JSON response encoded with services.serialization (orjson when installed); bytes are sent as-is"""
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else serialization.dumps(content)
+
+
+async def _etag(request: Request) -> str:
+    """Strong ETag for a read of the current storage version with this query string"""
+    version = await async_storage.get_storage_version()
+    query = hashlib.sha1(request.url.query.encode('utf-8')).hexdigest()[:16]
+    return f'"{version}-{query}"'
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 response if the client's If-None-Match matches etag, else None"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return None
+    tags = [tag.strip() for tag in header.split(',')]
+    if '*' in tags or etag in tags or f'W/{etag}' in tags:
+        return Response(status_code=304, headers={'ETag': etag})
+    return None
+
+
+# GET /api/invitations - return invitations, optionally filtered and paginated
 @app.get("/api/invitations")
-async def get_invitations():
-    """GET /api/invitations - return all invitations"""
+async def get_invitations(
+    request: Request,
+    group_name: Optional[str] = None,
+    group_id: Optional[str] = None,
+    status: Optional[str] = None,
+    invited_after: Optional[str] = None,
+    invited_before: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+):
+    """
+    GET /api/invitations - return invitations
+
+    Query parameters (all optional):
+        group_name / group_id: only invitations for this group
+        status: 'accepted', 'pending' or 'expired'
+        invited_after / invited_before: ISO date(time) range on datetime_invited (from inclusive, to exclusive)
+        limit: page size (max 1000); the response is then {"invitations": [...], "next_cursor": ...}
+        cursor: next_cursor from the previous page
+
+    Without limit and cursor the (filtered) list is returned as a plain array, as before.
+    Responses carry an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
     try:
-        invitations = get_all_invitations_with_details()
+        # taken before reading, so a concurrent write at worst costs one extra full response
+        etag = await _etag(request)
+        not_modified = _not_modified(request, etag)
+        if not_modified:
+            metrics.inc('api_not_modified')
+            return not_modified
+        headers = {'ETag': etag}
+
+        paginated = limit is not None or cursor is not None
+        if paginated:
+            limit = limit or MAX_PAGE_SIZE
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+        if group_name is not None:
+            group = await async_storage.find_group_by_name(group_name.strip())
+            if not group or (group_id is not None and group.id != group_id):
+                return JSONBytesResponse({"invitations": [], "next_cursor": None} if paginated else [],
+                                         headers=headers)
+            group_id = group.id
+
+        if not paginated and not any([group_id, status, invited_after, invited_before]):
+            invitations = await async_storage.get_all_invitations_with_details()
+            next_cursor = None
+        else:
+            invitations, next_cursor = await async_storage.query_invitations(
+                group_id=group_id,
+                status=status,
+                invited_after=invited_after,
+                invited_before=invited_before,
+                limit=limit,
+                cursor=cursor
+            )
+
         logger.info(f"API GET /api/invitations - returning {len(invitations)} invitations")
-        return invitations
+        rows = [invitation.to_dict() for invitation in invitations]
+        body = {"invitations": rows, "next_cursor": next_cursor} if paginated else rows
+        # encoded here, bypassing FastAPI's jsonable_encoder pass over every row
+        return JSONBytesResponse(serialization.dumps(body), headers=headers)
+
+    except ValueError as e:
+        logger.warning(f"API GET /api/invitations - invalid parameter: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except HTTPException:
+        raise
+
     except Exception as e:
         logger.error(f"API GET /api/invitations error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+# GET /api/invitations/changes - change feed of invitations and groups
+@app.get("/api/invitations/changes")
+async def get_changes(since: Optional[int] = None, wait: float = 0, limit: int = MAX_PAGE_SIZE):
+    """
+    GET /api/invitations/changes - invitations and groups changed after revision 'since'
+
+    Query parameters:
+        since: revision from the previous response (omitted: everything)
+        wait: if there are no changes yet, wait up to this many seconds (max 60) for one
+        limit: max number of changes (max 1000)
+
+    Returns {"revision": ..., "changes": [{"type", "op", "revision", "data"}, ...], "more": ...};
+    pass revision as the next since. Deleted groups are returned with op "delete".
+    410 if since is older than the tombstone horizon: resync without since.
+    """
+    if since is None:
+        # records stored before revisions existed have revision 0
+        since = -1
+    elif since < 0:
+        raise HTTPException(status_code=400, detail="since must be >= 0")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if not 0 <= wait <= MAX_CHANGES_WAIT:
+        raise HTTPException(status_code=400, detail=f"wait must be between 0 and {MAX_CHANGES_WAIT}")
+    try:
+        result = await async_storage.wait_for_changes(since, wait, limit)
+        logger.info(f"API GET /api/invitations/changes - {len(result['changes'])} changes since {since}")
+        return result
+    except ChangesPruned as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except Exception as e:
+        logger.error(f"API GET /api/invitations/changes error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _ndjson_lines(pages: Iterator[List[dict]]) -> Iterator[bytes]:
+    for page in pages:
+        yield b''.join(serialization.dumps(row) + b'\n' for row in page)
+
+
+def _csv_lines(pages: Iterator[List[dict]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for page in pages:
+        for row in page:
+            row = dict(row, eduid_props=json.dumps(row['eduid_props'], ensure_ascii=False))
+            writer.writerow([row[field] for field in EXPORT_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# GET /api/invitations/export - stream all invitations as NDJSON or CSV
+@app.get("/api/invitations/export")
+async def export_invitations(
+    format: str = 'ndjson',
+    group_name: Optional[str] = None,
+    group_id: Optional[str] = None,
+    status: Optional[str] = None,
+    invited_after: Optional[str] = None,
+    invited_before: Optional[str] = None
+):
+    """
+    GET /api/invitations/export - full export including eppn and eduid_props
+
+    Query parameters: format ('ndjson' or 'csv', in CSV eduid_props is a JSON string),
+    plus the filters of GET /api/invitations. Rows are streamed page by page, oldest first.
+    """
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    try:
+        group = None
+        if group_name is not None:
+            group = await async_storage.find_group_by_name(group_name.strip())
+        if group_name is not None and (not group or (group_id is not None and group.id != group_id)):
+            pages = iter(())
+        else:
+            pages = await async_storage.export_invitations(group_id=group.id if group else group_id,
+                                                           status=status, invited_after=invited_after,
+                                                           invited_before=invited_before)
+    except ValueError as e:
+        logger.warning(f"API GET /api/invitations/export - invalid parameter: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"API GET /api/invitations/export error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    logger.info(f"API GET /api/invitations/export - streaming {format}")
+    # a sync iterator: the response runs it on a worker thread, one page at a time
+    if format == 'csv':
+        body, media_type = _csv_lines(pages), 'text/csv; charset=utf-8'
+    else:
+        body, media_type = _ndjson_lines(pages), 'application/x-ndjson'
+    return StreamingResponse(body, media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="invitations.{format}"'})
+
+
 # POST /api/invitations - create new invitation
 @app.post("/api/invitations")
 async def create_invitation_api(request: Request):
-    """POST /api/invitations - create new invitation"""
+    """
+    POST /api/invitations - create new invitation
+
+    If the guest already has an open (pending, unexpired) invitation for the group, that one is
+    returned instead ("created": false). With an Idempotency-Key header, a repeated request with
+    the same key and body gets the original response without touching storage (also while the
+    first is still running); the same key with a different body is rejected with 422.
+    """
+    body = await request.body()
+    key = request.headers.get('idempotency-key')
+    if not key:
+        return await _create_invitation(body)
+
+    fingerprint = hashlib.sha256(body).hexdigest()
+    entry = _idempotent_requests.get(key)
+    if entry is not None:
+        if entry[0] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was used for a different request")
+        metrics.inc('api_idempotent_replays')
+        return await asyncio.shield(entry[1])
+
+    # shielded: a client that disconnects does not cancel the create its retry will wait for
+    task = asyncio.ensure_future(_create_invitation(body))
+    _idempotent_requests.set(key, (fingerprint, task))
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        # failed requests may be retried with the same key
+        _idempotent_requests.pop(key)
+        raise
+
+
+async def _create_invitation(body: bytes) -> dict:
     try:
         # Parse JSON request body
-        body = await request.body()
         data = json.loads(body.decode('utf-8'))
         logger.info(f"API POST /api/invitations - received data: {data}")
 
         # Validate required fields
-        required_fields = ['guest_id', 'group_name', 'invitation_mail_address']
-        missing_fields = [field for field in required_fields if not data.get(field, '').strip()]
+        missing_fields = _missing_fields(data)
 
         if missing_fields:
             logger.warning(f"API POST /api/invitations - missing fields: {missing_fields}")
@@ -55,7 +295,7 @@ async def create_invitation_api(request: Request):
             )
 
         # Look up group by name to get group_id
-        group = find_group_by_name(data['group_name'].strip())
+        group = await async_storage.find_group_by_name(data['group_name'].strip())
 
         if not group:
             logger.warning(f"API POST /api/invitations - group not found: {data['group_name']}")
@@ -67,23 +307,28 @@ async def create_invitation_api(request: Request):
                 }
             )
 
-        # Create invitation using the found group_id
-        invitation_id = create_invitation(
+        # Create invitation using the found group_id, unless the guest has an open one
+        invitation, created = await async_storage.get_or_create_invitation(
             data['guest_id'].strip(),
-            group['id'],
+            group.id,
             data['invitation_mail_address'].strip()
         )
 
-        logger.info(f"API POST /api/invitations - created invitation: {invitation_id}")
+        if created:
+            logger.info(f"API POST /api/invitations - created invitation: {invitation.invitation_id}")
+        else:
+            metrics.inc('api_invitation_duplicates')
+            logger.info(f"API POST /api/invitations - returning open invitation: {invitation.invitation_id}")
 
         # Return created invitation
         return {
-            "invitation_id": invitation_id,
-            "guest_id": data['guest_id'].strip(),
-            "group_name": data['group_name'].strip(),
-            "group_id": group['id'],
-            "invitation_mail_address": data['invitation_mail_address'].strip(),
-            "message": "Invitation created successfully"
+            "invitation_id": invitation.invitation_id,
+            "guest_id": invitation.guest_id,
+            "group_name": group.name,
+            "group_id": group.id,
+            "invitation_mail_address": invitation.invitation_mail_address,
+            "created": created,
+            "message": "Invitation created successfully" if created else "Open invitation already exists"
         }
 
     except json.JSONDecodeError as e:
@@ -99,14 +344,270 @@ async def create_invitation_api(request: Request):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def _missing_fields(data: dict) -> list:
+    """Required invitation fields that are missing or empty in data"""
+    return [field for field in INVITATION_FIELDS
+            if not isinstance(data.get(field), str) or not data[field].strip()]
+
+
+async def _read_rows(request: Request) -> list:
+    """
+    Rows of a batch request: a JSON array, or NDJSON (one object per line) read as it streams in.
+    Raises HTTPException 413 once an NDJSON body has more than MAX_BATCH_SIZE rows or a line
+    longer than MAX_LINE_BYTES, without reading the rest.
+    """
+    content_type = request.headers.get('content-type', '')
+    if 'ndjson' not in content_type and 'jsonl' not in content_type:
+        rows = serialization.loads(await request.body())
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON array of invitations")
+        return rows
+
+    rows = []
+    buffer = b''
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        if len(buffer) > MAX_LINE_BYTES or any(len(line) > MAX_LINE_BYTES for line in lines):
+            raise HTTPException(status_code=413, detail=f"NDJSON lines may be at most {MAX_LINE_BYTES} bytes")
+        rows.extend(serialization.loads(line) for line in lines if line.strip())
+        if len(rows) > MAX_BATCH_SIZE:
+            # too many rows: stop reading, and don't parse the (probably partial) rest of the line
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} invitations per batch")
+    if buffer.strip():
+        rows.append(serialization.loads(buffer))
+    return rows
+
+
+# POST /api/invitations/batch - create many invitations at once
+@app.post("/api/invitations/batch")
+async def create_invitations_batch(request: Request):
+    """
+    POST /api/invitations/batch - create invitations in bulk
+
+    Body: a JSON array of {guest_id, group_name, invitation_mail_address} objects, or the same
+    objects as NDJSON (Content-Type: application/x-ndjson). All valid rows are created in one
+    storage transaction; invalid rows are reported and skipped.
+
+    Returns {"created": n, "failed": n, "results": [{"index", "invitation_id"} | {"index", "error", ...}]}
+    """
+    try:
+        rows = await _read_rows(request)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        logger.error(f"API POST /api/invitations/batch - JSON decode error: {e}")
+        raise HTTPException(status_code=400, detail="Invalid JSON format")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} invitations per batch")
+
+    try:
+        # resolve each group name once; like find_group_by_name, the first group with a name wins
+        group_ids = {}
+        for group in await async_storage.get_all_groups():
+            group_ids.setdefault(group.name, group.id)
+
+        results = [None] * len(rows)
+        valid = []  # (index, (guest_id, group_id, invitation_mail_address))
+        for index, data in enumerate(rows):
+            if not isinstance(data, dict):
+                results[index] = {"index": index, "error": "Expected a JSON object"}
+                continue
+            missing_fields = _missing_fields(data)
+            if missing_fields:
+                results[index] = {"index": index, "error": "Missing required fields",
+                                  "missing_fields": missing_fields}
+                continue
+            group_id = group_ids.get(data['group_name'].strip())
+            if group_id is None:
+                results[index] = {"index": index, "error": "Group not found",
+                                  "group_name": data['group_name'].strip()}
+                continue
+            valid.append((index, (data['guest_id'].strip(), group_id, data['invitation_mail_address'].strip())))
+
+        invitation_ids = await async_storage.create_invitations([row for _, row in valid]) if valid else []
+        for (index, (guest_id, group_id, _)), invitation_id in zip(valid, invitation_ids):
+            results[index] = {"index": index, "invitation_id": invitation_id,
+                              "guest_id": guest_id, "group_id": group_id}
+
+        metrics.observe('api_invitation_batch_size', len(rows))
+        logger.info(f"API POST /api/invitations/batch - created {len(valid)} of {len(rows)} invitations")
+        return {"created": len(valid), "failed": len(rows) - len(valid), "results": results}
+
+    except Exception as e:
+        logger.error(f"API POST /api/invitations/batch error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# POST /api/invitations/import - create invitations from a CSV upload
+@app.post("/api/invitations/import")
+async def import_invitations(request: Request):
+    """
+    POST /api/invitations/import - create invitations from a CSV request body
+
+    The CSV needs a header row with guest_id, mail (or invitation_mail_address) and group
+    (or group_name). The body is parsed as it streams in and written in chunks.
+
+    Returns {"rows", "created", "failed", "errors": [{"line", "error"}, ...]} (at most 100 errors listed)
+    """
+    try:
+        result = await import_invitations_csv(request.stream())
+        logger.info(f"API POST /api/invitations/import - created {result['created']} of {result['rows']} invitations")
+        return result
+    except ValueError as e:
+        logger.warning(f"API POST /api/invitations/import - invalid CSV: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"API POST /api/invitations/import error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# GET /api/invitations/{invitation_id} - one invitation
+# (registered after the fixed /api/invitations/... paths, which it would otherwise shadow)
+@app.get("/api/invitations/{invitation_id}")
+async def get_invitation(invitation_id: str):
+    """GET /api/invitations/{invitation_id} - one invitation, including eppn and eduid_props"""
+    try:
+        invitation = await async_storage.get_invitation_export(invitation_id)
+    except Exception as e:
+        logger.error(f"API GET /api/invitations/{invitation_id} error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if invitation is None:
+        raise HTTPException(status_code=404, detail="Invitation not found")
+    return JSONBytesResponse(serialization.dumps(invitation))
+
+
+# GET /api/guests/{guest_id} - invitations of a guest
+@app.get("/api/guests/{guest_id}")
+async def get_guest(guest_id: str):
+    """GET /api/guests/{guest_id} - {"guest_id", "invitations": [...]} with eppn and eduid_props"""
+    try:
+        invitations = await async_storage.find_invitations_by_guest_id(guest_id)
+    except Exception as e:
+        logger.error(f"API GET /api/guests/{guest_id} error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if not invitations:
+        raise HTTPException(status_code=404, detail="No invitations for this guest_id")
+    return JSONBytesResponse(serialization.dumps({"guest_id": guest_id, "invitations": invitations}))
+
+
+# GET /api/eppn/{eppn} - invitations accepted with an eduID
+@app.get("/api/eppn/{eppn}")
+async def get_eppn(eppn: str):
+    """GET /api/eppn/{eppn} - {"eppn", "invitations": [...]}: the guest accounts linked to this eduID"""
+    try:
+        invitations = await async_storage.find_invitations_by_eppn(eppn)
+    except Exception as e:
+        logger.error(f"API GET /api/eppn/{eppn} error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if not invitations:
+        raise HTTPException(status_code=404, detail="No invitations for this eppn")
+    return JSONBytesResponse(serialization.dumps({"eppn": eppn, "invitations": invitations}))
+
+
 # GET /api/groups - return all groups
 @app.get("/api/groups")
-async def get_groups():
-    """GET /api/groups - return all groups"""
+async def get_groups(request: Request):
+    """GET /api/groups - return all groups (with ETag / If-None-Match support)"""
     try:
-        groups = get_all_groups()
+        etag = await _etag(request)
+        not_modified = _not_modified(request, etag)
+        if not_modified:
+            metrics.inc('api_not_modified')
+            return not_modified
+        groups = await async_storage.get_all_groups()
         logger.info(f"API GET /api/groups - returning {len(groups)} groups")
-        return groups
+        return JSONBytesResponse(serialization.dumps([group.to_dict() for group in groups]),
+                                 headers={'ETag': etag})
     except Exception as e:
         logger.error(f"API GET /api/groups error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# GET /api/stats - return per-group invitation statistics
+@app.get("/api/stats")
+async def get_stats(request: Request):
+    """GET /api/stats - invited/accepted/pending/expired counts and time-to-accept (seconds) per group and in total"""
+    try:
+        etag = await _etag(request)
+        not_modified = _not_modified(request, etag)
+        if not_modified:
+            metrics.inc('api_not_modified')
+            return not_modified
+        stats = await async_storage.get_invitation_stats()
+        return JSONBytesResponse(serialization.dumps(stats), headers={'ETag': etag})
+    except Exception as e:
+        logger.error(f"API GET /api/stats error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# GET /api/archive - archive segments
+@app.get("/api/archive")
+async def get_archive():
+    """GET /api/archive - {"invitations": total archived, "segments": [...]}"""
+    try:
+        return JSONBytesResponse(serialization.dumps(await async_storage.get_archive_summary()))
+    except Exception as e:
+        logger.error(f"API GET /api/archive error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# GET /api/archive/invitations - search archived invitations
+@app.get("/api/archive/invitations")
+async def get_archived_invitations(
+    invitation_id: Optional[str] = None,
+    guest_id: Optional[str] = None,
+    eppn: Optional[str] = None,
+    group_name: Optional[str] = None,
+    group_id: Optional[str] = None,
+    invited_after: Optional[str] = None,
+    invited_before: Optional[str] = None,
+    limit: int = MAX_PAGE_SIZE
+):
+    """
+    GET /api/archive/invitations - archived invitations (export fields + datetime_archived)
+
+    Query parameters: invitation_id, guest_id, eppn, group_name / group_id, invited_after / invited_before
+    (as for GET /api/invitations) and limit (max 1000). At least one filter is required:
+    archived segments are scanned, not indexed.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if not any([invitation_id, guest_id, eppn, group_name, group_id, invited_after, invited_before]):
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    try:
+        if group_name is not None:
+            group = await async_storage.find_group_by_name(group_name.strip())
+            if not group or (group_id is not None and group.id != group_id):
+                return JSONBytesResponse(b'[]')
+            group_id = group.id
+        rows = await async_storage.query_archive(
+            invitation_id=invitation_id, guest_id=guest_id, eppn=eppn, group_id=group_id,
+            invited_after=invited_after, invited_before=invited_before, limit=limit
+        )
+        logger.info(f"API GET /api/archive/invitations - returning {len(rows)} invitations")
+        return JSONBytesResponse(serialization.dumps(rows))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"API GET /api/archive/invitations error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# POST /api/archive/run - apply the retention rules now
+@app.post("/api/archive/run")
+async def run_archive():
+    """POST /api/archive/run - archive invitations due by the retention rules: {"archived", "segments"}"""
+    try:
+        return JSONBytesResponse(serialization.dumps(await async_storage.archive_invitations()))
+    except Exception as e:
+        logger.error(f"API POST /api/archive/run error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# GET /api/metrics - return storage metrics
+@app.get("/api/metrics")
+async def get_metrics():
+    """GET /api/metrics - return counters and latency/batch size summaries"""
+    return metrics.snapshot()
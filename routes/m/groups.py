@@ -3,13 +3,14 @@
 from nicegui import ui
 
 from services.logging import logger
-from services.storage import create_group, delete_group, get_all_groups, update_group
+from services.storage import async_storage
+from services.storage.stats import format_duration
 from .nav_header import create_navigation_header
 
 TITLE = "Groepen"
 
 @ui.page('/m/groups')
-def groups_page():
+async def groups_page():
     logger.debug("groups page accessed")
 
     ui.page_title(TITLE)
@@ -20,26 +21,43 @@ def groups_page():
         create_navigation_header('groups')
 
         @ui.refreshable
-        def groups_table():
-            page_state['groups'] = get_all_groups()
+        async def groups_table():
+            page_state['groups'] = await async_storage.get_all_groups()
+            stats = await async_storage.get_invitation_stats()
+            group_stats = {row['group_id']: row for row in stats['groups']}
 
             if not page_state['groups']:
                 ui.label('Geen groepen gevonden.').classes('text-gray-500 text-center py-8')
             else:
+                total = stats['total']
+                ui.label(f"{total['invited']} uitgenodigd, {total['accepted']} geaccepteerd, "
+                         f"{total['pending']} openstaand, {total['expired']} verlopen; mediane acceptatietijd "
+                         f"{format_duration(total['accept_seconds']['median'])}").classes('text-gray-600')
+
                 with ui.card().classes('w-full').style('font-size: 12pt;'):
                     # Table headers
                     with ui.row().classes('w-full font-bold border-b pb-2 mb-2'):
-                        ui.label('naam').style('width: 20%;')
-                        ui.label('redirect URL').style('width: 30%;')
-                        ui.label('redirect text').style('width: 30%;')
+                        ui.label('naam').style('width: 16%;')
+                        ui.label('redirect URL').style('width: 22%;')
+                        ui.label('redirect text').style('width: 18%;')
+                        ui.label('uitgenodigd / geaccepteerd / open').style('width: 16%;')
+                        ui.label('mediane acceptatietijd').style('width: 12%;')
 
                     # Table rows
                     for group in page_state['groups']:
+                        row_stats = group_stats.get(group.id)
                         with ui.row().classes('w-full border-b py-2'):
-                            ui.label(group['name']).style('width: 20%;')
-                            ui.label(group['redirect_url']).style('width: 30%;')
-                            ui.label(group['redirect_text']).style('width: 30%;')
-                            with ui.row().classes('gap-2').style('width: 15%;'):
+                            ui.label(group.name).style('width: 16%;')
+                            ui.label(group.redirect_url).style('width: 22%;')
+                            ui.label(group.redirect_text).style('width: 18%;')
+                            if row_stats:
+                                ui.label(f"{row_stats['invited']} / {row_stats['accepted']} / "
+                                         f"{row_stats['pending']}").style('width: 16%;')
+                                ui.label(format_duration(row_stats['accept_seconds']['median'])).style('width: 12%;')
+                            else:
+                                ui.label('-').style('width: 16%;')
+                                ui.label('-').style('width: 12%;')
+                            with ui.row().classes('gap-2').style('width: 8%;'):
                                 ui.button(
                                     icon='edit', color='grey',
                                     on_click=lambda g=group: edit_group_dialog(g, page_state)
@@ -49,7 +67,7 @@ def groups_page():
                                     on_click=lambda g=group: delete_group_dialog(g, page_state)
                                 ).props('flat dense').classes('text-grey-300')
 
-        groups_table()
+        await groups_table()
         ui.button('Nieuwe Groep...', on_click=lambda: add_group_dialog(
             page_state)).classes('mb-4 bg-blue-500 text-white')
 
@@ -57,6 +75,12 @@ def groups_page():
         page_state['refresh_function'] = groups_table.refresh   # type: ignore
 
 
+def _validity_days(dialog_state):
+    """validity_days from the number input: a positive whole number of days, or None"""
+    value = dialog_state['validity_days']
+    return int(value) if value else None
+
+
 def add_group_dialog(page_state):
     """Show the add group dialog"""
     logger.info("Opening add group dialog")
@@ -64,10 +88,11 @@ def add_group_dialog(page_state):
     dialog_state = {
         'name': '',
         'redirect_url': '',
-        'redirect_text': ''
+        'redirect_text': '',
+        'validity_days': None
     }
 
-    def handle_add():
+    async def handle_add():
         logger.info("Processing group creation")
 
         if not dialog_state['name'].strip():
@@ -84,10 +109,11 @@ def add_group_dialog(page_state):
 
         try:
             # Create the group
-            group_id = create_group(
+            group_id = await async_storage.create_group(
                 dialog_state['name'].strip(),
                 dialog_state['redirect_url'].strip(),
-                dialog_state['redirect_text'].strip()
+                dialog_state['redirect_text'].strip(),
+                _validity_days(dialog_state)
             )
             logger.info(f"Group created successfully: {group_id}")
             add_dialog.close()
@@ -121,6 +147,11 @@ def add_group_dialog(page_state):
         # Redirect Text input
         ui.input('Redirect Text', placeholder='Bijv. Canvas (UvA)').bind_value(
             dialog_state, 'redirect_text'
+        ).classes('w-full mb-3')
+
+        # Validity input (empty: invitations do not expire)
+        ui.number('Geldigheid uitnodiging (dagen)', placeholder='Leeg: verloopt niet', min=1, step=1).bind_value(
+            dialog_state, 'validity_days'
         ).classes('w-full mb-4')
 
         # Buttons
@@ -132,17 +163,18 @@ def add_group_dialog(page_state):
 
 
 def edit_group_dialog(group, page_state):
-    logger.info(f"Opening edit group dialog for group: {group['id']}")
+    logger.info(f"Opening edit group dialog for group: {group.id}")
 
     # Dialog state - pre-fill with current values
     dialog_state = {
-        'name': group['name'],
-        'redirect_url': group['redirect_url'],
-        'redirect_text': group['redirect_text']
+        'name': group.name,
+        'redirect_url': group.redirect_url,
+        'redirect_text': group.redirect_text,
+        'validity_days': group.validity_days
     }
 
-    def handle_save():
-        logger.info(f"Processing group update for: {group['id']}")
+    async def handle_save():
+        logger.info(f"Processing group update for: {group.id}")
 
         if not dialog_state['name'].strip():
             ui.notify('Groepsnaam is verplicht', type='negative')
@@ -158,15 +190,16 @@ def edit_group_dialog(group, page_state):
 
         try:
             # Update the group
-            success = update_group(
-                group['id'],
+            success = await async_storage.update_group(
+                group.id,
                 name=dialog_state['name'].strip(),
                 redirect_url=dialog_state['redirect_url'].strip(),
-                redirect_text=dialog_state['redirect_text'].strip()
+                redirect_text=dialog_state['redirect_text'].strip(),
+                validity_days=_validity_days(dialog_state)
             )
 
             if success:
-                logger.info(f"Group updated successfully: {group['id']}")
+                logger.info(f"Group updated successfully: {group.id}")
                 edit_dialog.close()
                 ui.notify(f'Groep "{dialog_state["name"]}" is bijgewerkt', type='positive')
 
@@ -201,6 +234,11 @@ def edit_group_dialog(group, page_state):
         # Redirect Text input
         ui.input('Redirect Text', placeholder='Bijv. Canvas (UvA)').bind_value(
             dialog_state, 'redirect_text'
+        ).classes('w-full mb-3')
+
+        # Validity input (empty: invitations do not expire)
+        ui.number('Geldigheid uitnodiging (dagen)', placeholder='Leeg: verloopt niet', min=1, step=1).bind_value(
+            dialog_state, 'validity_days'
         ).classes('w-full mb-4')
 
         # Buttons
@@ -212,17 +250,17 @@ def edit_group_dialog(group, page_state):
 
 
 def delete_group_dialog(group, page_state):
-    logger.info(f"Opening delete group dialog for group: {group['id']}")
+    logger.info(f"Opening delete group dialog for group: {group.id}")
 
-    def handle_delete():
-        logger.info(f"Processing group deletion for: {group['id']}")
+    async def handle_delete():
+        logger.info(f"Processing group deletion for: {group.id}")
 
         try:
-            success = delete_group(group['id'])
+            success = await async_storage.delete_group(group.id)
             if success:
-                logger.info(f"Group deleted successfully: {group['id']}")
+                logger.info(f"Group deleted successfully: {group.id}")
                 delete_dialog.close()
-                ui.notify(f'Groep "{group["name"]}" is verwijderd', type='positive')
+                ui.notify(f'Groep "{group.name}" is verwijderd', type='positive')
 
                 # Refresh the table
                 if 'refresh_function' in page_state:
@@ -242,7 +280,7 @@ def delete_group_dialog(group, page_state):
     with ui.dialog() as delete_dialog, ui.card().classes('w-96'):
         ui.label('Groep Verwijderen').classes('text-xl font-bold mb-4')
 
-        ui.label(f'Weet je zeker dat je de groep "{group["name"]}" wilt verwijderen?').classes('mb-4')
+        ui.label(f'Weet je zeker dat je de groep "{group.name}" wilt verwijderen?').classes('mb-4')
         ui.label('Deze actie kan niet ongedaan worden gemaakt.').classes('text-red-500 mb-4')
 
         with ui.row().classes('w-full justify-end gap-2'):
@@ -1,11 +1,10 @@
 # /invitations page
 
 from nicegui import ui
-from services.storage import (
-    create_invitation, get_all_invitations_with_details, get_all_groups, find_group_by_id
-)
+from services.storage import async_storage, format_datetime
 from services.logging import logger
 from services.mail_service import create_mail
+from services.invitation_import import import_invitations_csv
 from .nav_header import create_navigation_header
 
 TITLE = "Uitnodigingen"
@@ -30,13 +29,15 @@ def invitations_table(page_state: dict):
                 ui.label('geaccepteerd').style('width:15%;')
 
             # Table rows
-            for invitation in page_state['invitations']:
+            for row in page_state['invitations']:
+                invitation = row.invitation
                 with ui.row().classes('w-full border-b py-2'):
-                    ui.label(invitation['group_name']).style('width:15%;')
-                    ui.label(invitation['invitation_mail_address']).style('width:20%;')
-                    ui.label(invitation['invitation_id']).style('width:25%;')
-                    ui.label(invitation['datetime_invited_formatted']).style('width:15%;')
-                    ui.label(invitation['datetime_accepted_formatted'] or '-').style('width:15%;')
+                    ui.label(row.group_name).style('width:15%;')
+                    ui.label(invitation.invitation_mail_address).style('width:20%;')
+                    ui.label(invitation.invitation_id).style('width:25%;')
+                    ui.label(format_datetime(invitation.datetime_invited)).style('width:15%;')
+                    ui.label(format_datetime(invitation.datetime_accepted)
+                             or ('verlopen' if invitation.datetime_expired else '-')).style('width:15%;')
 
 
 def manual_invite_dialog(page_state):
@@ -52,7 +53,7 @@ def manual_invite_dialog(page_state):
         'selected_group_id': ''
     }
 
-    def create_and_send():
+    async def create_and_send():
         # Validate and create invitation
         if not all([dialog_state['invitation_mail_address'].strip(),
                    dialog_state['guest_id'].strip(),
@@ -65,18 +66,18 @@ def manual_invite_dialog(page_state):
             main_dialog.close()
 
             # Step 2: Create invitation
-            invitation_id = create_invitation(
+            invitation_id = await async_storage.create_invitation(
                 dialog_state['guest_id'].strip(),
                 dialog_state['selected_group_id'],
                 dialog_state['invitation_mail_address'].strip()
             )
 
             # Step 3: Refresh data and table
-            page_state['invitations'] = get_all_invitations_with_details()
+            page_state['invitations'] = await async_storage.get_all_invitations_with_details()
             invitations_table.refresh()
 
             # Step 4: Prepare mail content
-            page_state['mail_content'] = create_mail(invitation_id)
+            page_state['mail_content'] = await create_mail(invitation_id)
             page_state['content_mode'] = 'mail_preview'
 
             # Step 5: Reopen dialog with mail preview
@@ -98,7 +99,7 @@ def manual_invite_dialog(page_state):
                                                                                     'invitation_mail_address').classes('w-full mb-3')
             ui.input('Guest ID', placeholder='guest123').bind_value(dialog_state, 'guest_id').classes('w-full mb-3')
 
-            group_options = {group['id']: group['name'] for group in page_state['groups']}
+            group_options = {group.id: group.name for group in page_state['groups']}
             if group_options:
                 ui.select(options=group_options, label='Selecteer Groep', value=None).bind_value(
                     dialog_state, 'selected_group_id').classes('w-full mb-4')
@@ -123,15 +124,71 @@ def manual_invite_dialog(page_state):
     main_dialog.open()
 
 
+def csv_import_upload(page_state):
+    """Upload of a CSV (guest_id, mail, group) to create invitations in bulk, with progress"""
+    import_state = {'running': False, 'progress': 0.0, 'status': ''}
+
+    async def handle_upload(e):
+        if import_state['running']:
+            ui.notify('Er loopt al een import', type='warning')
+            return
+        content = e.content
+        content.seek(0, 2)
+        size = content.tell() or 1
+        content.seek(0)
+        read = 0
+
+        async def chunks():
+            nonlocal read
+            while chunk := content.read(64 * 1024):
+                read += len(chunk)
+                yield chunk
+
+        async def on_progress(result):
+            import_state['progress'] = read / size
+            import_state['status'] = (f"{result['rows']} rijen verwerkt, {result['created']} aangemaakt, "
+                                      f"{result['failed']} fouten")
+
+        import_state.update(running=True, progress=0.0, status=f'Importeren van {e.name}...')
+        try:
+            result = await import_invitations_csv(chunks(), on_progress)
+        except ValueError as ex:
+            ui.notify(str(ex), type='negative')
+            import_state['status'] = ''
+            return
+        except Exception as ex:
+            logger.error(f"CSV import of {e.name} failed: {ex}")
+            ui.notify(f'Fout: {str(ex)}', type='negative')
+            return
+        finally:
+            import_state['running'] = False
+            upload.reset()
+
+        page_state['invitations'] = await async_storage.get_all_invitations_with_details()
+        invitations_table.refresh()
+        for error in result['errors'][:5]:
+            ui.notify(f"Regel {error['line']}: {error['error']}", type='warning')
+        ui.notify(f"{result['created']} uitnodigingen aangemaakt, {result['failed']} fouten",
+                  type='positive' if not result['failed'] else 'warning')
+
+    with ui.card().classes('w-full mb-4'):
+        ui.label('CSV importeren (kolommen: guest_id, mail, group)').classes('font-bold')
+        upload = ui.upload(on_upload=handle_upload, auto_upload=True, max_files=1) \
+            .props('accept=.csv flat bordered').classes('w-full')
+        ui.linear_progress(show_value=False).bind_value_from(import_state, 'progress') \
+            .bind_visibility_from(import_state, 'running').classes('w-full')
+        ui.label().bind_text_from(import_state, 'status').classes('text-gray-600')
+
+
 @ui.page('/m/invitations')
-def invitations_page():
+async def invitations_page():
     logger.debug("invitations page accessed")
 
     ui.page_title(TITLE)
 
     page_state = {
-        'invitations': get_all_invitations_with_details(),
-        'groups': get_all_groups(),
+        'invitations': await async_storage.get_all_invitations_with_details(),
+        'groups': await async_storage.get_all_groups(),
         'mail_content': None
     }
 
@@ -140,6 +197,7 @@ def invitations_page():
 
         invitations_table(page_state)
         ui.button('Nieuwe uitnodiging...', on_click=lambda: manual_invite_dialog(page_state)).classes('mb-4')
+        csv_import_upload(page_state)
 
         # # Store reference to refresh function for later use
         # page_state['refresh_function'] = invitations_table.refresh
@@ -0,0 +1,49 @@
+# services/expiry_sweeper.py
+# Background asyncio task that marks invitations past their expires_at as expired
+
+import asyncio
+from typing import Optional
+
+from services.logging import logger
+from services.metrics import metrics
+from services.storage import async_storage
+from services.storage.storage import EXPIRY_BATCH_SIZE
+
+_task: Optional[asyncio.Task] = None
+
+
+async def sweep_expired_invitations() -> int:
+    """Expire all due invitations, EXPIRY_BATCH_SIZE per transaction; returns the number expired"""
+    total = 0
+    while True:
+        expired = await async_storage.expire_due_invitations(EXPIRY_BATCH_SIZE)
+        total += expired
+        if expired < EXPIRY_BATCH_SIZE:
+            break
+    if total:
+        metrics.inc('invitations_expired', total)
+        logger.info(f"Expiry: {total} invitations expired")
+    return total
+
+
+async def _sweeper_loop(interval: float) -> None:
+    while True:
+        try:
+            await sweep_expired_invitations()
+        except Exception as e:
+            logger.error(f"Expiry sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_expiry_sweeper(interval: float = 60.0) -> None:
+    """Start the sweeper on the running event loop (call from app.on_startup)"""
+    global _task
+    if _task is None:
+        _task = asyncio.get_running_loop().create_task(_sweeper_loop(interval))
+
+
+def stop_expiry_sweeper() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -0,0 +1,120 @@
+# services/invitation_import.py
+# CSV bulk import of invitations, used by the upload on /m/invitations and POST /api/invitations/import
+
+import codecs
+import csv
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.logging import logger
+from services.metrics import metrics
+from services.storage import async_storage
+
+# valid rows are written to storage in chunks of this size, one transaction per chunk
+IMPORT_CHUNK_SIZE = 5000
+# errors beyond this number are counted but not listed
+MAX_REPORTED_ERRORS = 100
+
+# accepted CSV header names -> invitation field
+_COLUMNS = {
+    'guest_id': 'guest_id',
+    'mail': 'invitation_mail_address',
+    'invitation_mail_address': 'invitation_mail_address',
+    'group': 'group_name',
+    'group_name': 'group_name',
+}
+_REQUIRED = ('guest_id', 'invitation_mail_address', 'group_name')
+
+
+def _parse_header(row: List[str]) -> Dict[str, int]:
+    """Map each invitation field to its column number; ValueError if one is missing"""
+    positions = {}
+    for position, name in enumerate(row):
+        field = _COLUMNS.get(name.strip().lower())
+        if field and field not in positions:
+            positions[field] = position
+    missing = [field for field in _REQUIRED if field not in positions]
+    if missing:
+        raise ValueError(f"CSV header mist kolom(men): {', '.join(missing)}")
+    return positions
+
+
+async def import_invitations_csv(chunks: AsyncIterator[bytes],
+                                 on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+                                 ) -> Dict[str, Any]:
+    """
+    Import invitations from a CSV with a header row (guest_id, mail, group), read incrementally from chunks.
+
+    Rows are validated as they come in; valid rows are created in chunks of IMPORT_CHUNK_SIZE.
+    on_progress is awaited with the running totals after every chunk.
+
+    Returns:
+        {'rows', 'created', 'failed', 'errors': [{'line', 'error'}, ...]}
+
+    Raises:
+        ValueError: no or invalid header
+    """
+    group_ids = {}
+    for group in await async_storage.get_all_groups():
+        group_ids.setdefault(group.name, group.id)
+
+    result = {'rows': 0, 'created': 0, 'failed': 0, 'errors': []}
+    positions: Optional[Dict[str, int]] = None
+    pending: List[Tuple[str, str, str]] = []
+    line_number = 0
+
+    def fail(line: int, error: str) -> None:
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line, 'error': error})
+
+    async def flush(final: bool = False) -> None:
+        while len(pending) >= IMPORT_CHUNK_SIZE or (final and pending):
+            chunk = pending[:IMPORT_CHUNK_SIZE]
+            del pending[:IMPORT_CHUNK_SIZE]
+            await async_storage.create_invitations(chunk)
+            result['created'] += len(chunk)
+            if on_progress:
+                await on_progress(result)
+
+    def parse_lines(lines: List[str]) -> None:
+        nonlocal positions, line_number
+        for row in csv.reader(lines):
+            line_number += 1
+            if not any(value.strip() for value in row):
+                continue
+            if positions is None:
+                positions = _parse_header(row)
+                continue
+            result['rows'] += 1
+            values = {field: row[position].strip() if position < len(row) else ''
+                      for field, position in positions.items()}
+            missing = [field for field in _REQUIRED if not values[field]]
+            if missing:
+                fail(line_number, f"Ontbrekende velden: {', '.join(missing)}")
+                continue
+            group_id = group_ids.get(values['group_name'])
+            if group_id is None:
+                fail(line_number, f"Onbekende groep: {values['group_name']}")
+                continue
+            pending.append((values['guest_id'], group_id, values['invitation_mail_address']))
+
+    # the file is never held as a whole: only complete lines are parsed, the rest waits for the next chunk
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.splitlines(keepends=True)
+        buffer = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        parse_lines(lines)
+        await flush()
+    buffer += decoder.decode(b'', final=True)
+    parse_lines([buffer] if buffer else [])
+    if positions is None:
+        raise ValueError("Leeg CSV-bestand: header ontbreekt")
+    await flush(final=True)
+    if on_progress:
+        await on_progress(result)
+
+    metrics.inc('invitations_imported', result['created'])
+    logger.info(f"CSV import: {result['created']} invitations created, {result['failed']} rows failed")
+    return result
@@ -1,26 +1,26 @@
 # services/mail_service.py
 # not really sending mail yet...
 
-from services.storage import find_invitation_by_code, find_group_by_id
+from services.storage import async_storage
 from services.logging import logger
 
 
-def create_mail(invite_code: str):
+async def create_mail(invite_code: str):
     """Create mail content for invitation (returns mail object, no UI)"""
     logger.info(f"Mail service called for invitation: {invite_code}")
 
-    invitation = find_invitation_by_code(invite_code)
+    invitation = await async_storage.find_invitation_by_code(invite_code)
 
     if not invitation:
         logger.error(f"No invitation found for code: {invite_code}")
         return None
 
     # Get group details
-    group = find_group_by_id(invitation['group_id'])
-    group_name = group.get('name', 'Onbekende groep') if group else 'Onbekende groep'
+    group = await async_storage.find_group_by_id(invitation.group_id)
+    group_name = group.name if group else 'Onbekende groep'
 
     logger.info(
-        f"Creating mail content for guest_id: {invitation.get('guest_id')} to {invitation.get('invitation_mail_address')}")
+        f"Creating mail content for guest_id: {invitation.guest_id} to {invitation.invitation_mail_address}")
 
     # Create mail content
     body = f"""Geachte collega,
@@ -38,7 +38,7 @@ ICT Ondersteuning
 Universitaire PABO Universiteit van Amsterdam"""
 
     mail_content = {
-        'to': invitation.get('invitation_mail_address', 'N/A'),
+        'to': invitation.invitation_mail_address or 'N/A',
         'from': 'icto_upva_someone@uva.nl',
         'subject': f'Uitnodiging als {group_name} voor de Universiteit van Amsterdam',
         'body': body
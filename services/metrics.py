@@ -0,0 +1,133 @@
+"""
+Process-wide metrics: counters and value summaries (count/sum/max and recent percentiles).
+Served as JSON by GET /api/metrics.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+# number of recent observations kept per summary for the percentiles
+_WINDOW = 1000
+
+
+class Metrics:
+    """Thread-safe registry of named counters and summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """Add value to counter name"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one observation (e.g. a latency or a batch size) in summary name"""
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = {'count': 0, 'sum': 0.0, 'max': value,
+                                                   'recent': deque(maxlen=_WINDOW)}
+            summary['count'] += 1
+            summary['sum'] += value
+            summary['max'] = max(summary['max'], value)
+            summary['recent'].append(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All counters and summaries as a JSON-serialisable dict"""
+        with self._lock:
+            summaries = {name: self._summarize(summary) for name, summary in self._summaries.items()}
+            return {'counters': dict(self._counters), 'summaries': summaries}
+
+    @staticmethod
+    def _summarize(summary: Dict[str, Any]) -> Dict[str, Any]:
+        recent: Deque[float] = summary['recent']
+        ordered = sorted(recent)
+
+        def percentile(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            'count': summary['count'],
+            'sum': summary['sum'],
+            'mean': summary['sum'] / summary['count'],
+            'max': summary['max'],
+            'p50': percentile(0.50),
+            'p90': percentile(0.90),
+            'p99': percentile(0.99),
+        }
+
+
+class LogBucketSketch:
+    """
+    Streaming quantiles of positive values with bounded relative error (DDSketch-style):
+    counts per logarithmic bucket, so memory depends on the value range, not the number of
+    values. Values can be removed again. Not thread-safe; guard with the owner's lock.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.02):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float, n: int = 1) -> None:
+        self.count += n
+        if value <= 0:
+            self.zeros += n
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        remaining = self.buckets.get(index, 0) + n
+        if remaining:
+            self.buckets[index] = remaining
+        else:
+            del self.buckets[index]
+
+    def remove(self, value: float) -> None:
+        self.add(value, -1)
+
+    def merge(self, other: 'LogBucketSketch', sign: int = 1) -> None:
+        """Add (sign 1) or remove (sign -1) all values of another sketch with the same accuracy"""
+        self.count += sign * other.count
+        self.zeros += sign * other.zeros
+        for index, n in other.buckets.items():
+            remaining = self.buckets.get(index, 0) + sign * n
+            if remaining:
+                self.buckets[index] = remaining
+            else:
+                del self.buckets[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The counts in JSON form (see from_dict)"""
+        return {'zeros': self.zeros, 'buckets': {str(index): n for index, n in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any], relative_accuracy: float = 0.02) -> 'LogBucketSketch':
+        sketch = cls(relative_accuracy)
+        sketch.zeros = state['zeros']
+        sketch.buckets = {int(index): n for index, n in state['buckets'].items()}
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-quantile (0..1), None if empty"""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+# Create singleton instance
+metrics = Metrics()
@@ -0,0 +1,64 @@
+# services/rate_limit.py
+# Per-client token bucket rate limiting (in memory, per process)
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List
+
+
+class TokenBucketLimiter:
+    """
+    Allows each key (e.g. a client IP) a burst of 'burst' attempts, refilled at 'rate' per second.
+    Memory is bounded: at most max_keys keys are tracked. Keys whose bucket has refilled are dropped,
+    least recently used first; when still full, the least recently used key is evicted (its next
+    attempt gets a fresh bucket).
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000, timer: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._timer = timer
+        # key -> [tokens, time of last update], least recently updated first
+        self._buckets: 'OrderedDict[str, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, now: float) -> List[float]:
+        """key's bucket, refilled up to now (call with the lock held)"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            self._prune(now)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def allow(self, key: str) -> bool:
+        """Take one token for key; False if its bucket is empty"""
+        with self._lock:
+            bucket = self._bucket(key, self._timer())
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def limited(self, key: str) -> bool:
+        """True if key's bucket is empty, without taking a token"""
+        with self._lock:
+            return self._bucket(key, self._timer())[0] < 1
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _prune(self, now: float) -> None:
+        # the least recently updated buckets come first: drop those refilled by now, and the oldest
+        # ones beyond max_keys
+        full_after = self.burst / self.rate
+        while self._buckets:
+            oldest_key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < full_after and len(self._buckets) <= self.max_keys:
+                break
+            del self._buckets[oldest_key]
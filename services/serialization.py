@@ -0,0 +1,37 @@
+# services/serialization.py
+# JSON encoding/decoding for storage files and API responses: orjson when installed, else the stdlib json
+
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+JSONDecodeError = json.JSONDecodeError  # orjson.JSONDecodeError is a subclass
+
+
+def dumps(obj: Any, pretty: bool = False, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Encode obj as UTF-8 JSON bytes: compact, or indented if pretty (for humans reading storage.json).
+    default is called for objects JSON cannot encode, like json.dumps(default=...); with orjson
+    that includes dataclasses, which it would otherwise encode field by field without calling default.
+    """
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if pretty else 0
+        if default is not None:
+            option |= orjson.OPT_PASSTHROUGH_DATACLASS
+        return orjson.dumps(obj, default=default, option=option)
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=default).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=default).encode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """Decode JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,160 @@
+"""
+Append-only archive of invitations moved out of the hot store by the retention rules
+(see storage.archive_invitations).
+
+The archive is a directory of gzip-compressed NDJSON segments, one or more per archiving run,
+plus manifest.json listing every segment with its row count, datetime_invited range, group ids
+and per-group counts (for the statistics, see stats.archived_counts).
+Segments are written once (temp file + rename) and never modified; a query skips segments whose
+manifest entry rules them out and streams the others line by line.
+A segment is first written under a staging name (see stage) and only listed once the archiving
+transaction committed (see publish); staged segments left by a crash are reconciled by retention.
+"""
+
+import gzip
+import os
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from services import serialization
+
+MANIFEST_FILE = 'manifest.json'
+# file name prefix of segments written but not yet listed in the manifest
+STAGING_PREFIX = '.staged-'
+
+
+class InvitationArchive:
+    """Archive segments in a directory (created on the first write)"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _write_file(self, name: str, content: bytes) -> None:
+        """Write a file in the archive directory via a temp file + rename"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(prefix='.archive-', suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, os.path.join(self.directory, name))
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+
+    def segments(self) -> List[Dict[str, Any]]:
+        """Manifest entries, oldest segment first:
+        {'file', 'created', 'count', 'first_invited', 'last_invited', 'group_ids', 'stats'}
+        ('stats' is missing in segments written before it was added)"""
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILE), 'rb') as f:
+                return serialization.loads(f.read())['segments']
+        except FileNotFoundError:
+            return []
+
+    def rows(self, entry: Dict[str, Any], staged: bool = False) -> Iterator[Dict[str, Any]]:
+        """All rows of a segment (staged: of a segment not yet published)"""
+        name = STAGING_PREFIX + entry['file'] if staged else entry['file']
+        with gzip.open(os.path.join(self.directory, name), 'rb') as f:
+            for line in f:
+                yield serialization.loads(line)
+
+    @staticmethod
+    def _entry(name: str, created: datetime, rows: List[Dict[str, Any]], size: int,
+               stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        invited = sorted(row['datetime_invited'] for row in rows)
+        entry = {
+            'file': name,
+            'created': created.isoformat(timespec='seconds'),
+            'count': len(rows),
+            'size': size,
+            'first_invited': invited[0] if invited else '',
+            'last_invited': invited[-1] if invited else '',
+            'group_ids': sorted({row['group_id'] for row in rows}),
+        }
+        if stats is not None:
+            entry['stats'] = stats
+        return entry
+
+    def stage(self, rows: List[Dict[str, Any]], stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Write rows (export dicts, see storage.EXPORT_FIELDS) as a new segment under a staging name;
+        returns its manifest entry (with stats, JSON) for publish or discard
+        """
+        now = datetime.now(timezone.utc)
+        name = f"invitations-{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+        content = gzip.compress(b''.join(serialization.dumps(row) + b'\n' for row in rows))
+        self._write_file(STAGING_PREFIX + name, content)
+        return self._entry(name, now, rows, len(content), stats or {})
+
+    def publish(self, entry: Dict[str, Any]) -> None:
+        """Move a staged segment to its name and list it in the manifest"""
+        os.replace(os.path.join(self.directory, STAGING_PREFIX + entry['file']),
+                   os.path.join(self.directory, entry['file']))
+        # the segment is durable before it is listed, so the manifest never points at a missing file
+        with self._lock:
+            segments = self.segments() + [entry]
+            self._write_file(MANIFEST_FILE, serialization.dumps({'segments': segments}, pretty=True))
+
+    def discard(self, entry: Dict[str, Any]) -> None:
+        """Remove a staged segment"""
+        try:
+            os.unlink(os.path.join(self.directory, STAGING_PREFIX + entry['file']))
+        except FileNotFoundError:
+            pass
+
+    def staged(self) -> List[Dict[str, Any]]:
+        """Manifest entries (without stats) of the staged segments, e.g. left by a crash while archiving"""
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.startswith(STAGING_PREFIX))
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            with gzip.open(path, 'rb') as f:
+                rows = [serialization.loads(line) for line in f]
+            created = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+            entries.append(self._entry(name[len(STAGING_PREFIX):], created, rows, os.path.getsize(path), None))
+        return entries
+
+    def query(self, invitation_id: Optional[str] = None, guest_id: Optional[str] = None,
+              eppn: Optional[str] = None, group_id: Optional[str] = None,
+              invited_from: Optional[str] = None, invited_until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Archived invitations matching all given filters (exact match; invited_from <= datetime_invited
+        < invited_until), oldest segment first. Each invitation is returned once, also if a crash
+        during archiving left it in two segments.
+        """
+        filters = {key: value for key, value in (('invitation_id', invitation_id), ('guest_id', guest_id),
+                                                 ('eppn', eppn), ('group_id', group_id)) if value}
+        # cheap pre-check on the raw line before parsing it
+        needles = [serialization.dumps(value) for value in filters.values()]
+        seen = set()
+        for entry in self.segments():
+            if group_id and group_id not in entry['group_ids']:
+                continue
+            if invited_from and entry['last_invited'] < invited_from:
+                continue
+            if invited_until and entry['first_invited'] >= invited_until:
+                continue
+            with gzip.open(os.path.join(self.directory, entry['file']), 'rb') as f:
+                for line in f:
+                    if not all(needle in line for needle in needles):
+                        continue
+                    row = serialization.loads(line)
+                    if any(row.get(key) != value for key, value in filters.items()):
+                        continue
+                    if invited_from and row['datetime_invited'] < invited_from:
+                        continue
+                    if invited_until and row['datetime_invited'] >= invited_until:
+                        continue
+                    if row['invitation_id'] in seen:
+                        continue
+                    seen.add(row['invitation_id'])
+                    yield row
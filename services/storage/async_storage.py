@@ -0,0 +1,211 @@
+"""
+Async facade for services.storage, for use from async API routes and NiceGUI pages.
+
+Reads run on a small, bounded thread pool so a slow disk or a large storage file never
+blocks the event loop. Invitation writes are handed to the write batcher and awaited
+without occupying a thread.
+
+    from services.storage import async_storage
+    invitation = await async_storage.find_invitation_by_code(code)
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import retention, storage
+from .records import Group, Invitation, InvitationDetails
+
+_MAX_WORKERS = 8
+
+_executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix='storage')
+
+
+async def _run(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking storage function on the storage thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def _write(operation: storage.WriteOperation) -> Any:
+    """Await a write operation; batched like storage's writes, but without blocking a thread"""
+    batcher = await _run(storage.get_write_batcher)
+    if batcher is None:
+        return await _run(operation, storage.get_backend())
+    return await asyncio.wrap_future(batcher.enqueue(operation))
+
+
+# invitations
+
+async def find_invitation_by_code(invite_code: str) -> Optional[Invitation]:
+    return await _run(storage.find_invitation_by_code, invite_code)
+
+
+async def invitation_code_may_exist(invite_code: str) -> bool:
+    # answered on the event loop unless the filter has to be (re)built first
+    may_exist = storage.invitation_code_filter(invite_code)
+    if may_exist is None:
+        return await _run(storage.invitation_code_may_exist, invite_code)
+    return may_exist
+
+
+async def update_invitation(invite_code: str, **updates) -> bool:
+    return await _write(storage.update_invitation_operation(invite_code, updates))
+
+
+async def create_invitation(guest_id: str, group_id: str, invitation_mail_address: str) -> str:
+    """Create a new invitation and return the invitation_id"""
+    return await _write(storage.create_invitation_operation(guest_id, group_id, invitation_mail_address))
+
+
+async def get_or_create_invitation(guest_id: str, group_id: str,
+                                   invitation_mail_address: str) -> Tuple[Invitation, bool]:
+    """The guest's open invitation for this group, or a new one: (invitation, created)"""
+    return await _write(storage.get_or_create_invitation_operation(guest_id, group_id, invitation_mail_address))
+
+
+async def create_invitations(rows: List[Tuple[str, str, str]]) -> List[str]:
+    """Create invitations from (guest_id, group_id, invitation_mail_address) rows in one transaction"""
+    return await _write(storage.create_invitations_operation(rows))
+
+
+async def mark_invitation_accepted(invite_code: str) -> bool:
+    return await _write(storage.mark_invitation_accepted_operation(invite_code))
+
+
+async def get_all_invitations_with_details() -> List[InvitationDetails]:
+    return await _run(storage.get_all_invitations_with_details)
+
+
+async def query_invitations(group_id: Optional[str] = None, status: Optional[str] = None,
+                            invited_after: Optional[str] = None, invited_before: Optional[str] = None,
+                            limit: Optional[int] = None, cursor: Optional[str] = None
+                            ) -> Tuple[List[InvitationDetails], Optional[str]]:
+    return await _run(storage.query_invitations, group_id=group_id, status=status,
+                      invited_after=invited_after, invited_before=invited_before,
+                      limit=limit, cursor=cursor)
+
+
+async def get_invitation_export(invitation_id: str) -> Optional[Dict[str, Any]]:
+    return await _run(storage.get_invitation_export, invitation_id)
+
+
+async def find_invitations_by_guest_id(guest_id: str) -> List[Dict[str, Any]]:
+    return await _run(storage.find_invitations_by_guest_id, guest_id)
+
+
+async def find_invitations_by_eppn(eppn: str) -> List[Dict[str, Any]]:
+    return await _run(storage.find_invitations_by_eppn, eppn)
+
+
+async def export_invitations(group_id: Optional[str] = None, status: Optional[str] = None,
+                             invited_after: Optional[str] = None, invited_before: Optional[str] = None,
+                             page_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+    """storage.export_invitations(); the returned iterator blocks, iterate it on a worker thread"""
+    return await _run(storage.export_invitations, group_id=group_id, status=status,
+                      invited_after=invited_after, invited_before=invited_before, page_size=page_size)
+
+
+# change feed
+
+# long-poll requests waiting for the next commit: (their event loop, future to resolve)
+_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+_waiters_lock = threading.Lock()
+
+
+def _wake_waiters(events: Optional[List[Dict[str, Any]]]) -> None:
+    """Storage change listener; called on the committing thread"""
+    with _waiters_lock:
+        waiters = list(_waiters)
+        _waiters.clear()
+    for loop, future in waiters:
+        loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+storage.add_change_listener(_wake_waiters)
+
+
+async def get_storage_version() -> str:
+    return await _run(storage.get_storage_version)
+
+
+async def get_invitation_stats() -> Dict[str, Any]:
+    return await _run(storage.get_invitation_stats)
+
+
+async def get_changes(since: int, limit: int = storage.MAX_CHANGES) -> Dict[str, Any]:
+    return await _run(storage.get_changes, since, limit)
+
+
+async def wait_for_changes(since: int, timeout: float, limit: int = storage.MAX_CHANGES) -> Dict[str, Any]:
+    """Like get_changes(), but if there are none yet wait up to timeout seconds for the next commit"""
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+    # register before reading, so a commit in between is not missed
+    with _waiters_lock:
+        _waiters.add((loop, waiter))
+    try:
+        result = await get_changes(since, limit)
+        if result['changes'] or timeout <= 0:
+            return result
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return result
+        return await get_changes(since, limit)
+    finally:
+        with _waiters_lock:
+            _waiters.discard((loop, waiter))
+
+
+# expiry
+
+async def expire_due_invitations(limit: int = storage.EXPIRY_BATCH_SIZE) -> int:
+    return await _write(storage.expire_due_operation(limit))
+
+
+# archive
+
+async def archive_invitations() -> Dict[str, Any]:
+    return await _run(retention.archive_invitations)
+
+
+async def query_archive(**filters) -> List[Dict[str, Any]]:
+    return await _run(retention.query_archive, **filters)
+
+
+async def get_archive_summary() -> Dict[str, Any]:
+    return await _run(retention.get_archive_summary)
+
+
+# groups
+
+async def get_all_groups() -> List[Group]:
+    return await _run(storage.get_all_groups)
+
+
+async def find_group_by_id(group_id: str) -> Optional[Group]:
+    return await _run(storage.find_group_by_id, group_id)
+
+
+async def find_group_by_name(group_name: str) -> Optional[Group]:
+    return await _run(storage.find_group_by_name, group_name)
+
+
+async def create_group(name: str, redirect_url: str, redirect_text: str, validity_days: Optional[int] = None) -> str:
+    return await _run(storage.create_group, name, redirect_url, redirect_text, validity_days)
+
+
+async def update_group(group_id: str, **updates) -> bool:
+    return await _run(storage.update_group, group_id, **updates)
+
+
+async def delete_group(group_id: str) -> bool:
+    return await _run(storage.delete_group, group_id)
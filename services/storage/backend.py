@@ -0,0 +1,194 @@
+"""
+Storage backend interface for groups and invitations (as records, see records.py).
+services.storage delegates all reads and writes to one StorageBackend instance,
+selected with configure_storage() (see settings.json: storage_backend).
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from services.logging import logger
+
+from .records import Group, Invitation
+
+INVITATION_STATUSES = ('accepted', 'pending', 'expired')
+
+# position in the (datetime_invited, invitation_id) order of invitations, used for keyset pagination
+InvitationKey = Tuple[str, str]
+
+Record = Union[Group, Invitation]
+
+# Every mutation gets the next storage revision, stored in the record's 'revision' field.
+# After a commit the backend passes the change events to its listeners:
+#   {'type': 'invitation' | 'group', 'op': 'upsert' | 'delete', 'revision': int,
+#    'data': record after the change (None for a delete), 'previous': record before the change or None}
+# A listener called with None must assume everything changed (e.g. storage.json was reloaded).
+ChangeListener = Callable[[Optional[List[Dict[str, Any]]]], None]
+
+
+def change_event(type_: str, op: str, revision: int, data: Optional[Record],
+                 previous: Optional[Record] = None) -> Dict[str, Any]:
+    return {'type': type_, 'op': op, 'revision': revision, 'data': data, 'previous': previous}
+
+
+class StorageBackend(ABC):
+    """
+    Abstract storage of groups and invitations.
+
+    Groups and invitations are exchanged as immutable Group / Invitation records;
+    load() and save() use the dict-shaped storage.json format.
+    Implementations must be safe to call from multiple threads.
+    """
+
+    def __init__(self):
+        self._listeners: List[ChangeListener] = []
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        """Call listener with the change events of every commit"""
+        self._listeners.append(listener)
+
+    def _emit(self, events: Optional[List[Dict[str, Any]]]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                logger.error(f"Storage change listener {listener} failed: {e}")
+
+    # revisions
+
+    @abstractmethod
+    def revision(self) -> int:
+        """Revision of the last committed mutation"""
+
+    @abstractmethod
+    def changes_since(self, revision: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        The current state of every record changed after revision, in revision order (at most limit),
+        as {'type', 'op', 'revision', 'data'} with 'data' in dict form (only the key for a delete)
+        """
+
+    @abstractmethod
+    def prune_tombstones(self, deleted_before: str) -> int:
+        """
+        Forget the tombstones of records deleted before this storage timestamp; returns the number removed.
+        Their deletions are then missing from changes_since() for revisions below tombstone_horizon().
+        """
+
+    @abstractmethod
+    def tombstone_horizon(self) -> int:
+        """Highest revision of a pruned tombstone (0 if none were pruned)"""
+
+    # whole-store access (storage.json format)
+
+    @abstractmethod
+    def load(self) -> Dict[str, Any]:
+        """Return all data as {"groups": [...], "invitations": [...], ...} (dicts, a copy)"""
+
+    @abstractmethod
+    def save(self, data: Dict[str, Any]) -> None:
+        """Replace all data with the given {"groups": [...], "invitations": [...]}"""
+
+    # invitations
+
+    @abstractmethod
+    def get_invitation(self, invitation_id: str) -> Optional[Invitation]:
+        """Return the invitation with this invitation_id, or None"""
+
+    @abstractmethod
+    def list_invitations(self) -> List[Invitation]:
+        """Return all invitations in creation order"""
+
+    @abstractmethod
+    def invitation_ids(self) -> List[str]:
+        """Return the invitation_ids of all invitations (without loading the invitations)"""
+
+    @abstractmethod
+    def query_invitations(self, group_id: Optional[str] = None, status: Optional[str] = None,
+                          invited_from: Optional[str] = None, invited_until: Optional[str] = None,
+                          after: Optional[InvitationKey] = None,
+                          limit: Optional[int] = None) -> List[Invitation]:
+        """
+        Invitations in (datetime_invited, invitation_id) order, filtered on group, status
+        and invited_from <= datetime_invited < invited_until, starting after the key 'after'.
+        Must not materialise more than the returned rows.
+        """
+
+    @abstractmethod
+    def invitations_by_guest_id(self, guest_id: str) -> List[Invitation]:
+        """Invitations for this guest_id in creation order (indexed lookup)"""
+
+    @abstractmethod
+    def invitations_by_eppn(self, eppn: str) -> List[Invitation]:
+        """Invitations accepted with this eppn in creation order (indexed lookup)"""
+
+    @abstractmethod
+    def due_invitations(self, now: str, limit: int) -> List[Invitation]:
+        """Pending invitations with expires_at <= now, soonest first, at most limit (indexed)"""
+
+    @abstractmethod
+    def add_invitation(self, invitation: Invitation) -> None:
+        """Store a new invitation"""
+
+    @abstractmethod
+    def update_invitation(self, invitation_id: str, updates: Dict[str, Any]) -> bool:
+        """Apply updates to an invitation; False if it does not exist"""
+
+    @abstractmethod
+    def delete_invitation(self, invitation_id: str) -> bool:
+        """Remove an invitation (leaving a tombstone for the change feed); False if it does not exist"""
+
+    # groups
+
+    @abstractmethod
+    def get_group(self, group_id: str) -> Optional[Group]:
+        """Return the group with this id, or None"""
+
+    @abstractmethod
+    def get_group_by_name(self, name: str) -> Optional[Group]:
+        """Return the (first) group with this name, or None"""
+
+    @abstractmethod
+    def list_groups(self) -> List[Group]:
+        """Return all groups in creation order"""
+
+    @abstractmethod
+    def add_group(self, group: Group) -> None:
+        """Store a new group"""
+
+    @abstractmethod
+    def update_group(self, group_id: str, updates: Dict[str, Any]) -> bool:
+        """Apply updates to a group; False if it does not exist"""
+
+    @abstractmethod
+    def delete_group(self, group_id: str) -> bool:
+        """Delete a group; False if it does not exist"""
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Group the writes in this block into one atomic, durable commit.
+        Transactions may be nested; only the outermost one commits.
+        """
+        yield
+
+    @contextmanager
+    def read_transaction(self) -> Iterator[None]:
+        """
+        Reads in this block see one consistent state, without holding up writers longer than
+        the backend must (for full scans that must not stall the write path); no writes inside
+        """
+        with self.transaction():
+            yield
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """
+        Part of a transaction that is undone on its own if the block raises;
+        the enclosing transaction continues with the writes made before it
+        """
+        with self.transaction():
+            yield
+
+    def close(self) -> None:
+        """Release resources (files, connections) held by the backend"""
@@ -0,0 +1,127 @@
+"""
+In-memory Bloom filter of invitation_ids, so codes that were never issued are rejected
+without a storage lookup (see routes/accept.py).
+
+The filter answers "certainly not an invitation" or "maybe"; only "maybe" needs the backend.
+It is filled from the change events (new invitations) and rebuilt with one scan after a full
+reload, when it reaches its capacity, or when many of its invitations have been deleted
+(a Bloom filter cannot remove entries).
+"""
+
+import hashlib
+import math
+import threading
+from typing import Any, Dict, List, Optional
+
+from .backend import StorageBackend
+
+# false positive rate at capacity; a false positive only costs a storage lookup
+FALSE_POSITIVE_RATE = 0.001
+MIN_CAPACITY = 10_000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings (double hashing over one blake2b digest)"""
+
+    def __init__(self, capacity: int, false_positive_rate: float = FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class InvitationCodeFilter:
+    """Bloom filter of all invitation_ids in storage. Register apply() as storage change listener."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # one rebuild at a time; never taken by listeners
+        self._rebuild_lock = threading.Lock()
+        self._filter: Optional[BloomFilter] = None
+        self._deleted = 0
+        # while a rebuild scans: the events committed meanwhile, applied on top of the scan
+        self._rebuilding: Optional[List[Dict[str, Any]]] = None
+        # changed by every invalidate(), so a rebuild that overlaps one is not installed
+        self._epoch = 0
+
+    def invalidate(self) -> None:
+        """Rebuild before the next check"""
+        # no lock: listeners may call this while a commit or a rebuild holds it
+        self._epoch += 1
+        self._filter = None
+
+    def apply(self, events: Optional[List[Dict[str, Any]]]) -> None:
+        """Storage change listener; called on the committing thread"""
+        if events is None:
+            self.invalidate()
+            return
+        with self._lock:
+            if self._rebuilding is not None:
+                self._rebuilding += events
+            elif self._filter is not None:
+                self._apply_events(events)
+
+    def _apply_events(self, events: List[Dict[str, Any]]) -> None:
+        bloom = self._filter
+        for event in events:
+            if event['type'] != 'invitation':
+                continue
+            if event['op'] == 'delete':
+                self._deleted += 1
+            elif event['previous'] is None:
+                bloom.add(event['data'].invitation_id)
+        if bloom.count > bloom.capacity or self._deleted > bloom.count // 4:
+            self._filter = None
+
+    def might_exist(self, invitation_id: str) -> Optional[bool]:
+        """False if invitation_id is certainly unknown, True if it may exist, None if the filter needs a rebuild"""
+        bloom = self._filter
+        if bloom is None:
+            return None
+        return invitation_id in bloom
+
+    def rebuild(self, backend: StorageBackend) -> None:
+        """
+        (Re)fill the filter from the backend if needed. Scans in a read transaction, so writers
+        carry on; the events they commit meanwhile are applied on top if newer than the scan.
+        """
+        with self._rebuild_lock:
+            if self._filter is not None:
+                return
+            with self._lock:
+                self._rebuilding = []
+                epoch = self._epoch
+            try:
+                with backend.read_transaction():
+                    revision = backend.revision()
+                    invitation_ids = backend.invitation_ids()
+            except BaseException:
+                with self._lock:
+                    self._rebuilding = None
+                raise
+            bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(invitation_ids)))
+            for invitation_id in invitation_ids:
+                bloom.add(invitation_id)
+            with self._lock:
+                events, self._rebuilding = self._rebuilding, None
+                if self._epoch != epoch:
+                    # storage was reloaded during the scan: the next check rebuilds again
+                    return
+                self._filter = bloom
+                self._deleted = 0
+                self._apply_events([event for event in events if event['revision'] > revision])
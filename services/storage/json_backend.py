@@ -0,0 +1,739 @@
+"""
+JSON file storage backend: the whole store lives in one storage.json,
+cached in memory with hash indexes.
+
+Optionally runs in journal mode: every mutation is appended as one compact JSON line to
+storage.json.journal (write cost proportional to the change), and a background compactor
+periodically folds the journal into a new storage.json snapshot (temp file + rename).
+On load the snapshot is read and the journal replayed on top of it.
+"""
+
+import bisect
+import dataclasses
+import heapq
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from services import serialization
+from services.logging import logger
+
+from .backend import InvitationKey, StorageBackend, change_event
+from .records import Group, Invitation, utc_timestamp
+
+# how often (seconds) a warm cache checks storage.json for edits made outside this process
+_STAT_INTERVAL = 1.0
+
+
+def _record_to_json(value: Any) -> Dict[str, Any]:
+    """Serialisation default: records in mutation records are journaled as dicts"""
+    if isinstance(value, (Group, Invitation)):
+        return value.to_dict()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+class JsonFileBackend(StorageBackend):
+    """
+    In-memory copy of storage.json (as Group / Invitation records) with hash indexes on
+    invitation_id, group id and group name.
+
+    The file is parsed once; after that lookups are served from memory. The cache is reloaded
+    when the file's mtime/size changes (storage.json may be edited by hand) and is kept up to
+    date directly by our own writes.
+    """
+
+    def __init__(self, storage_file: str, journal: bool = False, compact_interval: float = 60.0,
+                 pretty: bool = False):
+        super().__init__()
+        self.storage_file = storage_file
+        # indent storage.json for reading/editing by hand (slower, larger)
+        self.pretty = pretty
+        self.journal = journal
+        self.journal_file = storage_file + '.journal'
+        # journal being folded into a new snapshot; replayed too if we crashed halfway
+        self.compacting_file = storage_file + '.journal.compacting'
+        self.compact_interval = compact_interval
+        self.lock = threading.RLock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+        self._loaded = False
+        self._journal_handle = None
+        self._journal_entries = 0
+        # snapshots are numbered when serialised (under self.lock); a snapshot older than the one
+        # on disk is never written, e.g. a compaction that finishes after a newer save()
+        self._snapshot_generation = 0
+        self._written_generation = 0
+        self._tx_depth = 0
+        # mutations of the open transaction, not yet persisted: records, their change events and
+        # how to undo them in the cache, (type, key, previous record, tombstone count, revision) before
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_events: List[Dict[str, Any]] = []
+        self._undo: List[Tuple[str, str, Any, int, int]] = []
+        self._stop_compactor = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        # everything in storage.json except the groups and invitations (revision, tombstones)
+        self.data: Dict[str, Any] = {}
+        # records by key, in creation order
+        self.invitations: Dict[str, Invitation] = {}
+        self.groups: Dict[str, Group] = {}
+        self.groups_by_name: Dict[str, Group] = {}
+        # guest_id / eppn -> invitation_ids (dicts used as insertion-ordered sets)
+        self.by_guest_id: Dict[str, Dict[str, None]] = {}
+        self.by_eppn: Dict[str, Dict[str, None]] = {}
+        # sorted invitation keys per (group_id or None, status or None), for filtered paging
+        self.ordered: Dict[Tuple[Optional[str], Optional[str]], List[InvitationKey]] = {}
+        # (expires_at, invitation_id) of pending invitations; entries of invitations that were
+        # accepted, expired or deleted since are dropped when they reach the top
+        self.expiry_heap: List[Tuple[str, str]] = []
+        self._revision = 0
+        # (type, id) -> revision of its last change, ordered by revision
+        self.change_log: 'OrderedDict[Tuple[str, str], int]' = OrderedDict()
+
+    # cache maintenance
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.storage_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _rebuild_group_indexes(self) -> None:
+        # first group wins on duplicate names, like the linear scan did
+        self.groups_by_name = {}
+        for group in self.groups.values():
+            self.groups_by_name.setdefault(group.name, group)
+
+    @staticmethod
+    def _order_indexes(invitation: Invitation) -> List[Tuple[Optional[str], Optional[str]]]:
+        """The sorted indexes an invitation belongs to"""
+        group_id, status = invitation.group_id, invitation.status
+        return [(None, None), (None, status), (group_id, None), (group_id, status)]
+
+    def _index_invitation(self, invitation: Invitation) -> None:
+        key = invitation.key
+        for index in self._order_indexes(invitation):
+            bisect.insort(self.ordered.setdefault(index, []), key)
+
+    def _index_lookups(self, invitation: Invitation) -> None:
+        self.by_guest_id.setdefault(invitation.guest_id, {})[invitation.invitation_id] = None
+        if invitation.eppn:
+            self.by_eppn.setdefault(invitation.eppn, {})[invitation.invitation_id] = None
+
+    def _unindex_lookups(self, invitation: Invitation) -> None:
+        for index, value in ((self.by_guest_id, invitation.guest_id), (self.by_eppn, invitation.eppn)):
+            ids = index.get(value)
+            if ids is not None:
+                ids.pop(invitation.invitation_id, None)
+                if not ids:
+                    del index[value]
+
+    def _unindex_invitation(self, invitation: Invitation) -> None:
+        key = invitation.key
+        for index in self._order_indexes(invitation):
+            keys = self.ordered.get(index, [])
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def _index_expiry(self, invitation: Invitation, previous: Optional[Invitation]) -> None:
+        if invitation.expires_at and invitation.status == 'pending' and (
+                previous is None or previous.expires_at != invitation.expires_at):
+            heapq.heappush(self.expiry_heap, (invitation.expires_at, invitation.invitation_id))
+
+    def _put_invitation(self, invitation: Invitation, previous: Optional[Invitation]) -> None:
+        """Store a new version of an invitation, moving it between sorted indexes only if needed"""
+        self.invitations[invitation.invitation_id] = invitation
+        self._index_expiry(invitation, previous)
+        if previous is None:
+            self._index_invitation(invitation)
+            self._index_lookups(invitation)
+            return
+        if (previous.key, self._order_indexes(previous)) != (invitation.key, self._order_indexes(invitation)):
+            self._unindex_invitation(previous)
+            self._index_invitation(invitation)
+        if (previous.guest_id, previous.eppn) != (invitation.guest_id, invitation.eppn):
+            self._unindex_lookups(previous)
+            self._index_lookups(invitation)
+
+    def _load_data(self, data: Dict[str, Any]) -> None:
+        """Replace the cache with the contents of a storage.json dict"""
+        self.groups = {}
+        for group in data.get('groups', []):
+            group = Group.from_dict(group)
+            self.groups[group.id] = group
+        self.invitations = {}
+        for invitation in data.get('invitations', []):
+            invitation = Invitation.from_dict(invitation)
+            self.invitations[invitation.invitation_id] = invitation
+        self.data = {key: value for key, value in data.items() if key not in ('groups', 'invitations')}
+        self._rebuild_indexes()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """The cache in storage.json format"""
+        return {
+            'groups': [group.to_dict() for group in self.groups.values()],
+            'invitations': [invitation.to_dict() for invitation in self.invitations.values()],
+            **self.data
+        }
+
+    def _rebuild_indexes(self) -> None:
+        self.ordered = {}
+        for invitation in self.invitations.values():
+            for index in self._order_indexes(invitation):
+                self.ordered.setdefault(index, []).append(invitation.key)
+        for keys in self.ordered.values():
+            keys.sort()
+        self.by_guest_id = {}
+        self.by_eppn = {}
+        for invitation in self.invitations.values():
+            self._index_lookups(invitation)
+        self.expiry_heap = [(invitation.expires_at, invitation.invitation_id)
+                            for invitation in self.invitations.values()
+                            if invitation.expires_at and invitation.status == 'pending']
+        heapq.heapify(self.expiry_heap)
+        self._rebuild_group_indexes()
+
+        self.data.setdefault('tombstones', [])
+        # tombstones from before deleted_at existed count from now, so they are pruned a horizon later
+        loaded_at = utc_timestamp()
+        for tombstone in self.data['tombstones']:
+            tombstone.setdefault('deleted_at', loaded_at)
+        changes = [(inv.revision, 'invitation', inv.invitation_id) for inv in self.invitations.values()]
+        changes += [(group.revision, 'group', group.id) for group in self.groups.values()]
+        changes += [(t['revision'], t['type'], t['id']) for t in self.data['tombstones']]
+        changes.sort()
+        self.change_log = OrderedDict(((type_, key), revision) for revision, type_, key in changes)
+        self._revision = max([self.data.get('revision', 0)] + [revision for revision, _, _ in changes[-1:]])
+        self.data['revision'] = self._revision
+
+    def _refresh(self) -> None:
+        """(Re)load storage.json if it is not loaded yet or has changed on disk"""
+        now = time.monotonic()
+        if self._loaded and now - self._last_check < _STAT_INTERVAL:
+            return
+        with self.lock:
+            if self._tx_depth:
+                # never swap the cache under an open transaction; checked again when it is done
+                return
+            self._last_check = now
+            signature = self._file_signature()
+            if self._loaded and signature == self._signature:
+                return
+            try:
+                with open(self.storage_file, 'rb') as f:
+                    data = serialization.loads(f.read())
+            except FileNotFoundError:
+                data = {"groups": [], "invitations": []}
+            self._signature = signature
+            self._loaded = True
+            self._load_data(data)
+            if self.journal:
+                self._journal_entries = 0
+                self._replay_journal()
+                self._start_compactor()
+            self._emit(None)
+
+    def _write(self) -> None:
+        """Atomically write the cached data to storage.json and remember the new file signature"""
+        with self.lock:
+            self._write_snapshot(*self._serialize_snapshot())
+
+    def _serialize_snapshot(self) -> Tuple[bytes, int]:
+        """The cache in storage.json format and its snapshot generation (call with self.lock held)"""
+        self._snapshot_generation += 1
+        return serialization.dumps(self._snapshot(), pretty=self.pretty), self._snapshot_generation
+
+    def _write_snapshot(self, content: bytes, generation: int) -> bool:
+        """
+        Write storage.json via a temp file + rename, so a crash never leaves a truncated file;
+        False (nothing written) if a newer snapshot was written in the meantime
+        """
+        directory = os.path.dirname(os.path.abspath(self.storage_file))
+        fd, tmp_file = tempfile.mkstemp(prefix='.storage-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            # replace and take the new signature together: a _refresh() in between would see a
+            # changed file and reload it as if it had been edited outside this process
+            with self.lock:
+                if generation < self._written_generation:
+                    os.unlink(tmp_file)
+                    return False
+                os.replace(tmp_file, self.storage_file)
+                self._written_generation = generation
+                self._signature = self._file_signature()
+                self._last_check = time.monotonic()
+            return True
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.unlink(tmp_file)
+            raise
+
+    # mutations: applied to the cache, persisted to the journal or as a full snapshot
+
+    def _changed(self, type_: str, key: str, revision: int) -> None:
+        self.change_log[(type_, key)] = revision
+        self.change_log.move_to_end((type_, key))
+        self._revision = max(self._revision, revision)
+        self.data['revision'] = self._revision
+
+    def _apply(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Apply one mutation record to the cache and return its change event (None if nothing changed);
+        replaying a record twice has no further effect
+        """
+        op, revision = record['op'], record.get('revision', 0)
+        if op == 'add_invitation':
+            invitation = record['invitation']
+            if isinstance(invitation, dict):
+                invitation = Invitation.from_dict(invitation)
+            invitation = dataclasses.replace(invitation, revision=revision)
+            previous = self.invitations.get(invitation.invitation_id)
+            self._put_invitation(invitation, previous)
+            self._changed('invitation', invitation.invitation_id, revision)
+            return change_event('invitation', 'upsert', revision, invitation, previous)
+        elif op == 'update_invitation':
+            previous = self.invitations.get(record['invitation_id'])
+            if previous is not None:
+                invitation = previous.updated({**record['updates'], 'revision': revision})
+                self._put_invitation(invitation, previous)
+                self._changed('invitation', invitation.invitation_id, revision)
+                return change_event('invitation', 'upsert', revision, invitation, previous)
+            return None
+        elif op == 'delete_invitation':
+            invitation_id = record['invitation_id']
+            previous = self.invitations.pop(invitation_id, None)
+            if previous is not None:
+                self._unindex_invitation(previous)
+                self._unindex_lookups(previous)
+                self.data['tombstones'].append({'type': 'invitation', 'id': invitation_id, 'revision': revision,
+                                                'deleted_at': record.get('deleted_at') or utc_timestamp()})
+                self._changed('invitation', invitation_id, revision)
+                return change_event('invitation', 'delete', revision, None, previous)
+            return None
+        elif op == 'add_group':
+            group = record['group']
+            if isinstance(group, dict):
+                group = Group.from_dict(group)
+            group = dataclasses.replace(group, revision=revision)
+            previous = self.groups.get(group.id)
+            self.groups[group.id] = group
+            if previous is not None:
+                self._rebuild_group_indexes()
+            else:
+                self.groups_by_name.setdefault(group.name, group)
+            self._changed('group', group.id, revision)
+            return change_event('group', 'upsert', revision, group, previous)
+        elif op == 'update_group':
+            previous = self.groups.get(record['group_id'])
+            if previous is not None:
+                group = previous.updated({**record['updates'], 'revision': revision})
+                self.groups[group.id] = group
+                # group name may have changed
+                self._rebuild_group_indexes()
+                self._changed('group', group.id, revision)
+                return change_event('group', 'upsert', revision, group, previous)
+            return None
+        elif op == 'delete_group':
+            group_id = record['group_id']
+            previous = self.groups.pop(group_id, None)
+            if previous is not None:
+                self._rebuild_group_indexes()
+                self.data['tombstones'].append({'type': 'group', 'id': group_id, 'revision': revision,
+                                                'deleted_at': record.get('deleted_at') or utc_timestamp()})
+                self._changed('group', group_id, revision)
+                return change_event('group', 'delete', revision, None, previous)
+            return None
+        else:
+            raise ValueError(f"Unknown storage operation: {op}")
+
+    def _mutate(self, record: Dict[str, Any]) -> None:
+        """
+        Stamp a mutation record with the next revision and apply it to the cache;
+        it is persisted at the end of the (possibly implicit) transaction
+        """
+        with self.transaction():
+            record['revision'] = self._revision + 1
+            tombstones, revision = len(self.data['tombstones']), self._revision
+            event = self._apply(record)
+            if event is None:
+                return
+            changed = event['data'] or event['previous']
+            key = changed.invitation_id if event['type'] == 'invitation' else changed.id
+            self._pending.append(record)
+            self._pending_events.append(event)
+            self._undo.append((event['type'], key, event['previous'], tombstones, revision))
+
+    def _rollback(self, mark: int) -> None:
+        """Undo the cached mutations of the open transaction after the first mark ones"""
+        undo = self._undo[mark:]
+        if not undo:
+            return
+        for type_, key, previous, tombstones, _ in reversed(undo):
+            records = self.invitations if type_ == 'invitation' else self.groups
+            if previous is None:
+                records.pop(key, None)
+            else:
+                # a restored deleted record moves to the end of the creation order
+                records[key] = previous
+            del self.data['tombstones'][tombstones:]
+        self._revision = self.data['revision'] = undo[0][4]
+        del self._pending[mark:], self._pending_events[mark:], self._undo[mark:]
+        self._rebuild_indexes()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Apply all mutations in this block to the cache and persist them with a single write.
+        If the block raises or the write fails, the mutations are undone in the cache as well.
+        """
+        self._refresh()
+        with self.lock:
+            self._tx_depth += 1
+            try:
+                yield
+            except BaseException:
+                if self._tx_depth == 1:
+                    self._rollback(0)
+                raise
+            finally:
+                self._tx_depth -= 1
+            if self._tx_depth or not self._pending:
+                return
+            try:
+                if self.journal:
+                    self._append_journal(self._pending)
+                else:
+                    self._write()
+            except BaseException:
+                self._rollback(0)
+                raise
+            events = self._pending_events
+            self._pending, self._pending_events, self._undo = [], [], []
+            self._emit(events)
+
+    @contextmanager
+    def read_transaction(self) -> Iterator[None]:
+        # the cache is in memory: holding the lock for a scan is short, and no journal write or
+        # snapshot happens (a reload of storage.json still can; its listeners are told)
+        self._refresh()
+        with self.lock:
+            yield
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        with self.transaction():
+            mark = len(self._undo)
+            try:
+                yield
+            except BaseException:
+                self._rollback(mark)
+                raise
+
+    # journal
+
+    def _append_journal(self, records: List[Dict[str, Any]]) -> None:
+        if self._journal_handle is None:
+            self._journal_handle = open(self.journal_file, 'ab')
+            if self._journal_handle.tell() and not self._ends_with_newline(self.journal_file):
+                # terminate a record that was cut off by a crash, so it doesn't swallow the next one
+                self._journal_handle.write(b'\n')
+        lines = b''.join(serialization.dumps(r, default=_record_to_json) + b'\n' for r in records)
+        position = self._journal_handle.tell()
+        try:
+            self._journal_handle.write(lines)
+            self._journal_handle.flush()
+            os.fsync(self._journal_handle.fileno())
+        except BaseException:
+            self._discard_journal_tail(position)
+            raise
+        self._journal_entries += len(records)
+
+    def _discard_journal_tail(self, position: int) -> None:
+        """Cut a failed append off the journal, so it is not replayed on the next load"""
+        handle, self._journal_handle = self._journal_handle, None
+        try:
+            # may flush (part of) the failed records; they are truncated below
+            handle.close()
+        except OSError:
+            pass
+        try:
+            os.truncate(self.journal_file, position)
+        except OSError as e:
+            logger.error(f"Could not remove failed records from {self.journal_file}: {e}")
+
+    @staticmethod
+    def _ends_with_newline(path: str) -> bool:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _replay_journal(self) -> None:
+        for journal_file in (self.compacting_file, self.journal_file):
+            try:
+                with open(journal_file, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = serialization.loads(line)
+                        except serialization.JSONDecodeError:
+                            # only the last line can be incomplete (crash during append)
+                            logger.warning(f"Skipping incomplete journal record in {journal_file}")
+                            continue
+                        self._apply(record)
+                        self._journal_entries += 1
+            except FileNotFoundError:
+                pass
+        if self._journal_entries:
+            logger.info(f"Replayed {self._journal_entries} journal records on top of {self.storage_file}")
+
+    def compact(self) -> None:
+        """Fold the journal into a new storage.json snapshot"""
+        with self.lock:
+            if not self._journal_entries and not os.path.exists(self.compacting_file):
+                return
+            # serialise under the lock, then swap in an empty journal; writers continue on the new one
+            content, generation = self._serialize_snapshot()
+            if self._journal_handle is not None:
+                self._journal_handle.close()
+                self._journal_handle = None
+            if os.path.exists(self.journal_file):
+                if os.path.exists(self.compacting_file):
+                    # left over from an interrupted compaction: already part of self.data
+                    os.unlink(self.compacting_file)
+                os.replace(self.journal_file, self.compacting_file)
+            entries, self._journal_entries = self._journal_entries, 0
+
+        # skipped if save() or prune_tombstones() wrote a newer snapshot meanwhile; that one holds
+        # everything in the compacting file as well
+        self._write_snapshot(content, generation)
+        if os.path.exists(self.compacting_file):
+            os.unlink(self.compacting_file)
+        logger.debug(f"Compacted {entries} journal records into {self.storage_file}")
+
+    def _start_compactor(self) -> None:
+        # compact_interval 0: only compact on close() (e.g. for one-off tools like migrate)
+        if self._compactor is not None or not self.compact_interval:
+            return
+        self._stop_compactor.clear()
+        self._compactor = threading.Thread(target=self._compactor_loop, name='storage-compactor', daemon=True)
+        self._compactor.start()
+
+    def _compactor_loop(self) -> None:
+        while not self._stop_compactor.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Storage compaction failed: {e}")
+
+    # revisions
+
+    def revision(self) -> int:
+        self._refresh()
+        return self._revision
+
+    def prune_tombstones(self, deleted_before: str) -> int:
+        self._refresh()
+        with self.lock:
+            tombstones = self.data['tombstones']
+            pruned = [t for t in tombstones if t['deleted_at'] < deleted_before]
+            if not pruned:
+                return 0
+            self.data['tombstones'] = [t for t in tombstones if t['deleted_at'] >= deleted_before]
+            self.data['tombstone_horizon'] = max([self.tombstone_horizon()] + [t['revision'] for t in pruned])
+            for tombstone in pruned:
+                key = (tombstone['type'], tombstone['id'])
+                if self.change_log.get(key) == tombstone['revision']:
+                    del self.change_log[key]
+            # a full snapshot, also in journal mode (replaying the journal on top of it changes nothing)
+            self._write()
+            return len(pruned)
+
+    def tombstone_horizon(self) -> int:
+        self._refresh()
+        return self.data.get('tombstone_horizon', 0)
+
+    def changes_since(self, revision: int, limit: int) -> List[Dict[str, Any]]:
+        self._refresh()
+        with self.lock:
+            changed = []
+            for (type_, key), changed_revision in reversed(self.change_log.items()):
+                if changed_revision <= revision:
+                    break
+                changed.append((changed_revision, type_, key))
+            changed.reverse()
+
+            changes = []
+            for changed_revision, type_, key in changed[:limit]:
+                record = self.invitations.get(key) if type_ == 'invitation' else self.groups.get(key)
+                if record is not None:
+                    op, data = 'upsert', record.to_dict()
+                else:
+                    op, data = 'delete', {'invitation_id' if type_ == 'invitation' else 'id': key}
+                changes.append({'type': type_, 'op': op, 'revision': changed_revision, 'data': data})
+            return changes
+
+    # whole-store access
+
+    def load(self) -> Dict[str, Any]:
+        self._refresh()
+        with self.lock:
+            return self._snapshot()
+
+    def save(self, data: Dict[str, Any]) -> None:
+        with self.lock:
+            revision = self._revision
+            self._loaded = True
+            self._load_data(data)
+            # revisions never go back, also not when replacing everything
+            self._revision = self.data['revision'] = max(self._revision, revision + 1)
+            try:
+                self._write()
+            except BaseException:
+                # the cache no longer matches storage.json: reload it on next access
+                self._loaded = False
+                raise
+            if self.journal:
+                # the new snapshot supersedes everything in the journal
+                if self._journal_handle is not None:
+                    self._journal_handle.close()
+                    self._journal_handle = None
+                for journal_file in (self.compacting_file, self.journal_file):
+                    if os.path.exists(journal_file):
+                        os.unlink(journal_file)
+                self._journal_entries = 0
+            self._emit(None)
+
+    # invitations
+
+    def get_invitation(self, invitation_id: str) -> Optional[Invitation]:
+        self._refresh()
+        return self.invitations.get(invitation_id)
+
+    def list_invitations(self) -> List[Invitation]:
+        self._refresh()
+        with self.lock:
+            return list(self.invitations.values())
+
+    def invitation_ids(self) -> List[str]:
+        self._refresh()
+        with self.lock:
+            return list(self.invitations)
+
+    def query_invitations(self, group_id: Optional[str] = None, status: Optional[str] = None,
+                          invited_from: Optional[str] = None, invited_until: Optional[str] = None,
+                          after: Optional[InvitationKey] = None,
+                          limit: Optional[int] = None) -> List[Invitation]:
+        self._refresh()
+        with self.lock:
+            keys = self.ordered.get((group_id, status), [])
+            start = 0
+            if after is not None:
+                start = bisect.bisect_right(keys, after)
+            if invited_from:
+                start = max(start, bisect.bisect_left(keys, (invited_from, '')))
+            end = len(keys)
+            if invited_until:
+                end = bisect.bisect_left(keys, (invited_until, ''))
+            if limit is not None:
+                end = min(end, start + limit)
+            return [self.invitations[invitation_id] for _, invitation_id in keys[start:end]]
+
+    def invitations_by_guest_id(self, guest_id: str) -> List[Invitation]:
+        self._refresh()
+        with self.lock:
+            return [self.invitations[invitation_id] for invitation_id in self.by_guest_id.get(guest_id, ())]
+
+    def invitations_by_eppn(self, eppn: str) -> List[Invitation]:
+        self._refresh()
+        with self.lock:
+            return [self.invitations[invitation_id] for invitation_id in self.by_eppn.get(eppn, ())]
+
+    def due_invitations(self, now: str, limit: int) -> List[Invitation]:
+        self._refresh()
+        with self.lock:
+            heap, due, seen = self.expiry_heap, [], set()
+            while heap and heap[0][0] <= now and len(due) < limit:
+                expires_at, invitation_id = heapq.heappop(heap)
+                invitation = self.invitations.get(invitation_id)
+                # an invitation restored by a rollback may have two entries
+                if invitation is not None and invitation.status == 'pending' and invitation.expires_at == expires_at \
+                        and invitation_id not in seen:
+                    seen.add(invitation_id)
+                    due.append(invitation)
+            # still pending until marked expired: keep them indexed
+            for invitation in due:
+                heapq.heappush(heap, (invitation.expires_at, invitation.invitation_id))
+            return due
+
+    def add_invitation(self, invitation: Invitation) -> None:
+        self._refresh()
+        self._mutate({'op': 'add_invitation', 'invitation': invitation})
+
+    def update_invitation(self, invitation_id: str, updates: Dict[str, Any]) -> bool:
+        self._refresh()
+        with self.lock:
+            if invitation_id not in self.invitations:
+                return False
+            self._mutate({'op': 'update_invitation', 'invitation_id': invitation_id, 'updates': updates})
+            return True
+
+    def delete_invitation(self, invitation_id: str) -> bool:
+        self._refresh()
+        with self.lock:
+            if invitation_id not in self.invitations:
+                return False
+            self._mutate({'op': 'delete_invitation', 'invitation_id': invitation_id, 'deleted_at': utc_timestamp()})
+            return True
+
+    # groups
+
+    def get_group(self, group_id: str) -> Optional[Group]:
+        self._refresh()
+        return self.groups.get(group_id)
+
+    def get_group_by_name(self, name: str) -> Optional[Group]:
+        self._refresh()
+        return self.groups_by_name.get(name)
+
+    def list_groups(self) -> List[Group]:
+        self._refresh()
+        with self.lock:
+            return list(self.groups.values())
+
+    def add_group(self, group: Group) -> None:
+        self._refresh()
+        self._mutate({'op': 'add_group', 'group': group})
+
+    def update_group(self, group_id: str, updates: Dict[str, Any]) -> bool:
+        self._refresh()
+        with self.lock:
+            if group_id not in self.groups:
+                return False
+            self._mutate({'op': 'update_group', 'group_id': group_id, 'updates': updates})
+            return True
+
+    def delete_group(self, group_id: str) -> bool:
+        self._refresh()
+        with self.lock:
+            if group_id not in self.groups:
+                return False
+            self._mutate({'op': 'delete_group', 'group_id': group_id, 'deleted_at': utc_timestamp()})
+            return True
+
+    def close(self) -> None:
+        if self._compactor is not None:
+            self._stop_compactor.set()
+            self._compactor.join()
+            self._compactor = None
+        if self.journal and self._loaded:
+            self.compact()
+        if self._journal_handle is not None:
+            self._journal_handle.close()
+            self._journal_handle = None
@@ -0,0 +1,37 @@
+"""
+Copy all groups and invitations from one storage backend to another.
+The backend is derived from the file extension (.json or .sqlite3/.db).
+
+    python -m services.storage.migrate services/storage/storage.json services/storage/storage.sqlite3
+"""
+
+import sys
+
+from .backend import StorageBackend
+from .json_backend import JsonFileBackend
+from .sqlite_backend import SqliteBackend
+
+
+def open_backend(path: str) -> StorageBackend:
+    if path.endswith('.json'):
+        # journal mode, so a journal next to storage.json is replayed (source) or superseded by
+        # the new snapshot (target) instead of being ignored; no background compaction
+        return JsonFileBackend(path, journal=True, compact_interval=0)
+    return SqliteBackend(path)
+
+
+def migrate(source: str, target: str) -> int:
+    """Copy source into target (replacing its contents); returns the number of invitations copied"""
+    data = open_backend(source).load()
+    target_backend = open_backend(target)
+    target_backend.save(data)
+    target_backend.close()
+    return len(data.get('invitations', []))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: python -m services.storage.migrate <source> <target>")
+        sys.exit(1)
+    count = migrate(sys.argv[1], sys.argv[2])
+    print(f"Copied {count} invitations from {sys.argv[1]} to {sys.argv[2]}")
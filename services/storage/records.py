@@ -0,0 +1,150 @@
+"""
+Typed, immutable records for groups and invitations.
+
+Backends keep and return these instead of dicts: slotted objects take a fraction of the
+memory of the equivalent dict, and being frozen they can be handed out from a cache
+without copying. The storage.json / API format stays dict-shaped: use to_dict() and
+from_dict(). Keys without a field are kept in 'extra', so nothing is lost on a round trip.
+"""
+
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, ClassVar, Dict, Optional, Tuple
+
+
+def format_datetime(iso_string: str) -> str:
+    """Format an ISO timestamp from storage for display, e.g. '04-09-2025 09:50'"""
+    if not iso_string:
+        return ''
+    try:
+        # Parse ISO format and convert to readable format
+        dt = datetime.fromisoformat(iso_string.replace('Z', '+00:00'))
+        return dt.strftime('%d-%m-%Y %H:%M')
+    except:  # noqa: E722
+        return iso_string
+
+
+def utc_timestamp(dt: Optional[datetime] = None) -> str:
+    """A naive UTC datetime (default: now) in storage format, e.g. '2025-09-04T09:50:18.460062Z'"""
+    return (dt or datetime.utcnow()).isoformat(timespec='microseconds') + 'Z'
+
+
+def _split(cls, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Split a dict into constructor arguments of cls and the remaining 'extra' keys"""
+    known = {key: value for key, value in data.items() if key in cls.FIELDS}
+    extra = {key: value for key, value in data.items() if key not in cls.FIELDS and key != 'extra'}
+    return known, extra or None
+
+
+@dataclass(frozen=True, slots=True)
+class Group:
+    id: str
+    name: str
+    redirect_url: str = ''
+    redirect_text: str = ''
+    # days an invitation for this group stays valid; None: no expiry
+    validity_days: Optional[int] = None
+    revision: int = 0
+    extra: Optional[Dict[str, Any]] = None
+
+    FIELDS: ClassVar[Tuple[str, ...]] = ('id', 'name', 'redirect_url', 'redirect_text', 'validity_days', 'revision')
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Group':
+        known, extra = _split(cls, data)
+        return cls(**known, extra=extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def updated(self, updates: Dict[str, Any]) -> 'Group':
+        """A copy with updates applied (unknown keys go to extra)"""
+        return Group.from_dict({**self.to_dict(), **updates})
+
+
+@dataclass(frozen=True, slots=True)
+class Invitation:
+    invitation_id: str
+    guest_id: str
+    group_id: str
+    invitation_mail_address: str = ''
+    datetime_invited: str = ''
+    datetime_accepted: str = ''
+    # '' if the invitation does not expire
+    expires_at: str = ''
+    # set by the expiry sweeper once expires_at has passed without acceptance
+    datetime_expired: str = ''
+    eppn: str = ''
+    # None until the invitation is accepted (saves an empty dict per pending invitation)
+    eduid_props: Optional[Dict[str, Any]] = None
+    revision: int = 0
+    extra: Optional[Dict[str, Any]] = None
+
+    FIELDS: ClassVar[Tuple[str, ...]] = ('invitation_id', 'guest_id', 'group_id', 'invitation_mail_address',
+                                         'datetime_invited', 'datetime_accepted', 'expires_at', 'datetime_expired',
+                                         'eppn', 'eduid_props', 'revision')
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Invitation':
+        known, extra = _split(cls, data)
+        # many invitations share a group: keep one copy of its id
+        known['group_id'] = sys.intern(known['group_id'])
+        known['eduid_props'] = known.get('eduid_props') or None
+        return cls(**known, extra=extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        data['eduid_props'] = self.eduid_props or {}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def updated(self, updates: Dict[str, Any]) -> 'Invitation':
+        """A copy with updates applied (unknown keys go to extra)"""
+        return Invitation.from_dict({**self.to_dict(), **updates})
+
+    @property
+    def status(self) -> str:
+        """'accepted', 'expired' or 'pending'"""
+        if self.datetime_accepted:
+            return 'accepted'
+        return 'expired' if self.datetime_expired else 'pending'
+
+    def is_expired(self, now: Optional[str] = None) -> bool:
+        """Not accepted and past expires_at (also before the sweeper has marked it)"""
+        if self.datetime_accepted:
+            return False
+        return bool(self.datetime_expired) or bool(self.expires_at and self.expires_at <= (now or utc_timestamp()))
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """Position in the (datetime_invited, invitation_id) order"""
+        return (self.datetime_invited, self.invitation_id)
+
+
+@dataclass(frozen=True, slots=True)
+class InvitationDetails:
+    """An invitation with the name of its group ('' if the group was deleted)"""
+    invitation: Invitation
+    group_name: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The detail row of GET /api/invitations"""
+        invitation = self.invitation
+        return {
+            'invitation_id': invitation.invitation_id,
+            'guest_id': invitation.guest_id,
+            'group_name': self.group_name,
+            'group_id': invitation.group_id,
+            'invitation_mail_address': invitation.invitation_mail_address,
+            'datetime_invited_formatted': format_datetime(invitation.datetime_invited),
+            'datetime_accepted_formatted': format_datetime(invitation.datetime_accepted),
+            'datetime_invited': invitation.datetime_invited,
+            'datetime_accepted': invitation.datetime_accepted,
+            'expires_at': invitation.expires_at,
+            'datetime_expired': invitation.datetime_expired
+        }
@@ -0,0 +1,274 @@
+"""
+Retention: moves old invitations out of the hot store into the archive (see archive.py),
+so the hot store holds the invitations still being onboarded instead of the whole history.
+
+Rules (see settings.json):
+    retention_accepted_days: archive invitations accepted more than this many days ago
+    retention_pending_days: archive invitations never accepted (pending or expired) and invited more than
+                            this many days ago
+Either rule may be None (off). Each run also prunes the change feed's tombstones (deleted and
+archived records) older than tombstone_days; change-feed clients that last synced before then
+must resync from scratch (see storage.get_changes).
+start_retention() applies them periodically on a background thread; archive_invitations() runs them once.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.logging import logger
+from services.metrics import metrics
+
+from . import storage
+from .archive import InvitationArchive
+from .backend import StorageBackend
+from .records import Invitation
+from .stats import ArchivedCounts, archived_counts
+
+# invitations moved per transaction (and per archive segment)
+RETENTION_BATCH_SIZE = 5000
+
+_settings: Dict[str, Any] = {'archive_path': None, 'accepted_days': None, 'pending_days': None,
+                             'tombstone_days': 30.0, 'interval': 3600.0}
+_archive: Optional[InvitationArchive] = None
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+# archived counts of segments listed without them (written before they were added), by file name
+_segment_counts: Dict[str, ArchivedCounts] = {}
+# one archiving run at a time (a run reconciles the segments staged by earlier ones)
+_run_lock = threading.Lock()
+# held from committing the deletes of an archived batch until its segment is listed in the manifest
+_publish_lock = threading.Lock()
+
+
+def configure_retention(archive_path: Optional[str] = None, accepted_days: Optional[float] = None,
+                        pending_days: Optional[float] = None, tombstone_days: Optional[float] = 30.0,
+                        interval: float = 3600.0) -> None:
+    """
+    Set the retention rules.
+
+    Args:
+        archive_path: archive directory; defaults to archive/ next to storage.json
+        accepted_days: archive accepted invitations this many days after acceptance (None: keep)
+        pending_days: archive pending and expired invitations this many days after invitation (None: keep)
+        tombstone_days: prune change-feed tombstones this many days after the deletion (None: keep)
+        interval: seconds between runs of the background thread
+    """
+    global _archive
+    _settings.update(archive_path=archive_path, accepted_days=accepted_days, pending_days=pending_days,
+                     tombstone_days=tombstone_days, interval=interval)
+    _archive = None
+    _segment_counts.clear()
+
+
+def get_archive() -> InvitationArchive:
+    global _archive
+    if _archive is None:
+        _archive = InvitationArchive(_settings['archive_path'] or os.path.join(storage._MODULE_DIR, 'archive'))
+    return _archive
+
+
+def _cutoff(now: datetime, days: Optional[float]) -> Optional[str]:
+    if days is None:
+        return None
+    return (now - timedelta(days=days)).isoformat(timespec='microseconds') + 'Z'
+
+
+def _candidates(backend: StorageBackend, accepted_before: Optional[str], pending_before: Optional[str],
+                limit: int) -> List[Invitation]:
+    """Up to limit invitations due for archiving, found through the (status, datetime_invited) index"""
+    candidates: List[Invitation] = []
+    if pending_before:
+        for status in ('pending', 'expired'):
+            candidates += backend.query_invitations(status=status, invited_until=pending_before,
+                                                    limit=limit - len(candidates))
+    if accepted_before:
+        # accepted before the cutoff implies invited before it; page through those, checking acceptance
+        after = None
+        while len(candidates) < limit:
+            page = backend.query_invitations(status='accepted', invited_until=accepted_before,
+                                             after=after, limit=RETENTION_BATCH_SIZE)
+            candidates += [invitation for invitation in page if invitation.datetime_accepted < accepted_before]
+            if len(page) < RETENTION_BATCH_SIZE:
+                break
+            after = page[-1].key
+    return candidates[:limit]
+
+
+def prune_tombstones(now: Optional[datetime] = None) -> int:
+    """Prune the tombstones older than tombstone_days; returns the number removed"""
+    deleted_before = _cutoff(now or datetime.utcnow(), _settings['tombstone_days'])
+    if not deleted_before:
+        return 0
+    pruned = storage.get_backend().prune_tombstones(deleted_before)
+    if pruned:
+        metrics.inc('tombstones_pruned', pruned)
+        logger.info(f"Retention: pruned {pruned} tombstones deleted before {deleted_before}")
+    return pruned
+
+
+def _export(backend: StorageBackend, invitations: List[Invitation], archived_at: str) -> List[Dict[str, Any]]:
+    return [{**row, 'datetime_archived': archived_at} for row in storage.export_rows(backend, invitations)]
+
+
+def _reconcile_staged(backend: StorageBackend, archive: InvitationArchive) -> None:
+    """
+    Settle the segments staged by an archiving run that did not finish: publish those whose deletes
+    committed (none of their invitations is in the hot store), remove the others
+    """
+    for entry in archive.staged():
+        rows = list(archive.rows(entry, staged=True))
+        if any(backend.get_invitation(row['invitation_id']) for row in rows):
+            archive.discard(entry)
+            logger.warning(f"Retention: removed staged archive segment {entry['file']}, its batch did not commit")
+        else:
+            entry['stats'] = archived_counts(rows)
+            with _publish_lock:
+                archive.publish(entry)
+            # a rebuild since the commit missed these invitations
+            storage.invalidate_invitation_stats()
+            logger.warning(f"Retention: published staged archive segment {entry['file']}")
+
+
+def reconcile_archive() -> None:
+    """Publish or remove the archive segments left staged by an interrupted archiving run"""
+    with _run_lock:
+        _reconcile_staged(storage.get_backend(), get_archive())
+
+
+def archive_invitations(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Move the invitations due according to the retention rules to the archive.
+    Each batch is staged as a new archive segment (outside the write transaction), then deleted from
+    the hot store in one transaction, and only then listed in the manifest. A batch that changed in
+    between is staged again; a crash after the commit leaves a staged segment that the next run
+    publishes (see reconcile_archive). Archived invitations keep counting in the statistics.
+
+    Tombstones are pruned first (see prune_tombstones).
+
+    Returns:
+        {'archived': number of invitations, 'segments': [manifest entries]}
+    """
+    result: Dict[str, Any] = {'archived': 0, 'segments': []}
+    now = now or datetime.utcnow()
+    prune_tombstones(now)
+    accepted_before = _cutoff(now, _settings['accepted_days'])
+    pending_before = _cutoff(now, _settings['pending_days'])
+    backend = storage.get_backend()
+    archive = get_archive()
+    archived_at = now.isoformat(timespec='microseconds') + 'Z'
+    with _run_lock:
+        _reconcile_staged(backend, archive)
+        while accepted_before or pending_before:
+            with backend.read_transaction():
+                invitations = _candidates(backend, accepted_before, pending_before, RETENTION_BATCH_SIZE)
+                rows = _export(backend, invitations, archived_at)
+            if not invitations:
+                break
+            entry = archive.stage(rows, stats=archived_counts(rows))
+            committed = False
+            try:
+                # the statistics see the deletes when they commit; the archiving block keeps them counted
+                # until the segment is listed, and rebuilds wait for that (see reading_archived_counts)
+                with _publish_lock, storage.archiving_invitations() as archiving:
+                    with backend.transaction():
+                        current = _candidates(backend, accepted_before, pending_before, RETENTION_BATCH_SIZE)
+                        unchanged = _export(backend, current, archived_at) == rows
+                        if unchanged:
+                            archiving.update(invitation.invitation_id for invitation in invitations)
+                            for invitation in invitations:
+                                backend.delete_invitation(invitation.invitation_id)
+                    committed = unchanged
+                    if committed:
+                        archive.publish(entry)
+            finally:
+                # after the commit the staged segment is the only copy: keep it for _reconcile_staged
+                if not committed:
+                    archive.discard(entry)
+            if not committed:
+                continue
+            result['segments'].append(entry)
+            result['archived'] += len(invitations)
+            if len(invitations) < RETENTION_BATCH_SIZE:
+                break
+
+    if result['archived']:
+        metrics.inc('invitations_archived', result['archived'])
+        logger.info(f"Retention: archived {result['archived']} invitations "
+                    f"in {len(result['segments'])} segment(s)")
+    return result
+
+
+def query_archive(invitation_id: Optional[str] = None, guest_id: Optional[str] = None,
+                  eppn: Optional[str] = None, group_id: Optional[str] = None,
+                  invited_after: Optional[str] = None, invited_before: Optional[str] = None,
+                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Archived invitations (EXPORT_FIELDS + datetime_archived) matching all given filters, at most limit"""
+    invited_from = storage.storage_timestamp(invited_after) if invited_after else None
+    invited_until = storage.storage_timestamp(invited_before) if invited_before else None
+    rows = []
+    for row in get_archive().query(invitation_id=invitation_id, guest_id=guest_id, eppn=eppn, group_id=group_id,
+                                   invited_from=invited_from, invited_until=invited_until):
+        if limit is not None and len(rows) >= limit:
+            break
+        rows.append(row)
+    return rows
+
+
+def get_archived_counts() -> List[ArchivedCounts]:
+    """Per-group counts of every archive segment, for the statistics"""
+    archive = get_archive()
+    counts = []
+    for entry in archive.segments():
+        if 'stats' not in entry and entry['file'] not in _segment_counts:
+            _segment_counts[entry['file']] = archived_counts(archive.rows(entry))
+        counts.append(entry['stats'] if 'stats' in entry else _segment_counts[entry['file']])
+    return counts
+
+
+@contextmanager
+def reading_archived_counts() -> Iterator[List[ArchivedCounts]]:
+    """
+    get_archived_counts() for a statistics rebuild, which scans the hot store inside the block:
+    no archived batch is deleted from the hot store but missing from the manifest meanwhile
+    """
+    with _publish_lock:
+        yield get_archived_counts()
+
+
+def get_archive_summary() -> Dict[str, Any]:
+    """{'invitations': total archived, 'segments': [manifest entries]}"""
+    segments = get_archive().segments()
+    return {'invitations': sum(entry['count'] for entry in segments), 'segments': segments}
+
+
+def _retention_loop() -> None:
+    while True:
+        try:
+            archive_invitations()
+        except Exception as e:
+            logger.error(f"Retention run failed: {e}")
+        if _stop.wait(_settings['interval']):
+            return
+
+
+def start_retention() -> None:
+    """Run the retention rules now and then every interval seconds on a background thread (if any are set)"""
+    global _thread
+    reconcile_archive()
+    rules = (_settings['accepted_days'], _settings['pending_days'], _settings['tombstone_days'])
+    if _thread is not None or all(rule is None for rule in rules):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_retention_loop, name='storage-retention', daemon=True)
+    _thread.start()
+
+
+def stop_retention() -> None:
+    global _thread
+    if _thread is not None:
+        _stop.set()
+        _thread.join()
+        _thread = None
@@ -0,0 +1,464 @@
+"""
+SQLite storage backend.
+
+Runs in WAL mode so readers don't block the writer (or each other). Every thread gets its
+own connection; sqlite3 keeps the compiled form of the (constant, parameterised) SQL
+statements below in its per-connection statement cache, so they are prepared only once.
+
+To copy an existing storage.json into a new database see services/storage/migrate.py.
+"""
+
+import dataclasses
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .backend import InvitationKey, StorageBackend, change_event
+from .records import Group, Invitation, utc_timestamp
+
+_TABLES = """
+CREATE TABLE IF NOT EXISTS groups (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    redirect_url TEXT NOT NULL DEFAULT '',
+    redirect_text TEXT NOT NULL DEFAULT '',
+    validity_days INTEGER,
+    revision INTEGER NOT NULL DEFAULT 0,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+
+CREATE TABLE IF NOT EXISTS invitations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    invitation_id TEXT NOT NULL UNIQUE,
+    guest_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    invitation_mail_address TEXT NOT NULL DEFAULT '',
+    datetime_invited TEXT NOT NULL,
+    datetime_accepted TEXT NOT NULL DEFAULT '',
+    expires_at TEXT NOT NULL DEFAULT '',
+    datetime_expired TEXT NOT NULL DEFAULT '',
+    eppn TEXT NOT NULL DEFAULT '',
+    eduid_props TEXT NOT NULL DEFAULT '{}',
+    revision INTEGER NOT NULL DEFAULT 0,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+
+-- deleted records, for the change feed
+CREATE TABLE IF NOT EXISTS tombstones (
+    type TEXT NOT NULL,
+    id TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    deleted_at TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (type, id)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('tombstone_horizon', 0);
+"""
+
+# columns added after the first version of the schema: (table, column, definition)
+_ADDED_COLUMNS = [
+    ('groups', 'revision', "INTEGER NOT NULL DEFAULT 0"),
+    ('invitations', 'revision', "INTEGER NOT NULL DEFAULT 0"),
+    ('groups', 'validity_days', "INTEGER"),
+    ('invitations', 'expires_at', "TEXT NOT NULL DEFAULT ''"),
+    ('invitations', 'datetime_expired', "TEXT NOT NULL DEFAULT ''"),
+    ('tombstones', 'deleted_at', "TEXT NOT NULL DEFAULT ''"),
+]
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_groups_name ON groups (name);
+CREATE INDEX IF NOT EXISTS idx_groups_revision ON groups (revision);
+CREATE INDEX IF NOT EXISTS idx_invitations_group_id ON invitations (group_id, datetime_invited, invitation_id);
+CREATE INDEX IF NOT EXISTS idx_invitations_guest_id ON invitations (guest_id);
+CREATE INDEX IF NOT EXISTS idx_invitations_eppn ON invitations (eppn);
+CREATE INDEX IF NOT EXISTS idx_invitations_datetime_invited ON invitations (datetime_invited, invitation_id);
+CREATE INDEX IF NOT EXISTS idx_invitations_revision ON invitations (revision);
+CREATE INDEX IF NOT EXISTS idx_tombstones_revision ON tombstones (revision);
+-- status indexes for query_invitations: the WHERE clauses repeat its status conditions exactly,
+-- so a status (or group + status) page is read in order from the index instead of scanning the table
+CREATE INDEX IF NOT EXISTS idx_invitations_accepted ON invitations (datetime_invited, invitation_id)
+    WHERE datetime_accepted != '';
+CREATE INDEX IF NOT EXISTS idx_invitations_pending ON invitations (datetime_invited, invitation_id)
+    WHERE datetime_accepted = '' AND datetime_expired = '';
+CREATE INDEX IF NOT EXISTS idx_invitations_expired ON invitations (datetime_invited, invitation_id)
+    WHERE datetime_accepted = '' AND datetime_expired != '';
+CREATE INDEX IF NOT EXISTS idx_invitations_group_accepted ON invitations (group_id, datetime_invited, invitation_id)
+    WHERE datetime_accepted != '';
+CREATE INDEX IF NOT EXISTS idx_invitations_group_pending ON invitations (group_id, datetime_invited, invitation_id)
+    WHERE datetime_accepted = '' AND datetime_expired = '';
+CREATE INDEX IF NOT EXISTS idx_invitations_group_expired ON invitations (group_id, datetime_invited, invitation_id)
+    WHERE datetime_accepted = '' AND datetime_expired != '';
+-- expiry index: only pending invitations that expire
+CREATE INDEX IF NOT EXISTS idx_invitations_expires_at ON invitations (expires_at)
+    WHERE expires_at != '' AND datetime_accepted = '' AND datetime_expired = '';
+"""
+
+# columns of each table; other keys of a record are kept as JSON in the 'extra' column
+_GROUP_COLUMNS = ('id', 'name', 'redirect_url', 'redirect_text', 'validity_days', 'revision')
+_INVITATION_COLUMNS = ('invitation_id', 'guest_id', 'group_id', 'invitation_mail_address',
+                       'datetime_invited', 'datetime_accepted', 'expires_at', 'datetime_expired',
+                       'eppn', 'eduid_props', 'revision')
+_JSON_COLUMNS = ('eduid_props',)
+_DEFAULTS = {'revision': 0, 'validity_days': None}
+
+_SELECT_GROUP = f"SELECT {', '.join(_GROUP_COLUMNS)}, extra FROM groups"
+_SELECT_INVITATION = f"SELECT {', '.join(_INVITATION_COLUMNS)}, extra FROM invitations"
+
+_INSERT_GROUP = (f"INSERT INTO groups ({', '.join(_GROUP_COLUMNS)}, extra) "
+                 f"VALUES ({', '.join('?' * (len(_GROUP_COLUMNS) + 1))})")
+_INSERT_INVITATION = (f"INSERT INTO invitations ({', '.join(_INVITATION_COLUMNS)}, extra) "
+                      f"VALUES ({', '.join('?' * (len(_INVITATION_COLUMNS) + 1))})")
+
+
+def _row_to_record(row: sqlite3.Row, columns) -> Dict[str, Any]:
+    record = {column: row[column] for column in columns}
+    for column in _JSON_COLUMNS:
+        if column in record:
+            record[column] = json.loads(record[column])
+    record.update(json.loads(row['extra']))
+    return record
+
+
+def _record_to_params(record: Dict[str, Any], columns) -> List[Any]:
+    params = []
+    for column in columns:
+        value = record.get(column, _DEFAULTS.get(column, ''))
+        if column in _JSON_COLUMNS:
+            value = json.dumps(value or {}, ensure_ascii=False)
+        params.append(value)
+    extra = {k: v for k, v in record.items() if k not in columns}
+    params.append(json.dumps(extra, ensure_ascii=False))
+    return params
+
+
+class SqliteBackend(StorageBackend):
+    """Groups and invitations in an SQLite database (WAL mode, indexed lookups)"""
+
+    def __init__(self, db_file: str):
+        super().__init__()
+        self.db_file = db_file
+        self._local = threading.local()
+        # held by the writing thread for the duration of a write or transaction
+        self._write_lock = threading.RLock()
+        self._tx_depth = 0
+        # change events of the current write, emitted after commit
+        self._events: List[Dict[str, Any]] = []
+        self._connections: List[sqlite3.Connection] = []
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_TABLES)
+            for table, column, definition in _ADDED_COLUMNS:
+                existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            # tombstones from before deleted_at existed count from now, so they are pruned a horizon later
+            conn.execute("UPDATE tombstones SET deleted_at = ? WHERE deleted_at = ''", (utc_timestamp(),))
+            conn.executescript(_INDEXES)
+
+    def _conn(self) -> sqlite3.Connection:
+        """Connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _writing(self) -> Iterator[sqlite3.Connection]:
+        """Connection for a write; commits at the end unless inside transaction()"""
+        with self._write_lock:
+            conn = self._conn()
+            if self._tx_depth:
+                yield conn
+                return
+            self._events = []
+            with conn:
+                yield conn
+            events, self._events = self._events, []
+            if events:
+                self._emit(events)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self._write_lock:
+            if self._tx_depth:
+                self._tx_depth += 1
+                try:
+                    yield
+                finally:
+                    self._tx_depth -= 1
+                return
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            self._tx_depth = 1
+            self._events = []
+            try:
+                yield
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._tx_depth = 0
+                events, self._events = self._events, []
+            if events:
+                self._emit(events)
+
+    @contextmanager
+    def read_transaction(self) -> Iterator[None]:
+        # a deferred transaction: in WAL mode it reads one snapshot while writers carry on
+        conn = self._conn()
+        if conn.in_transaction:
+            yield
+            return
+        conn.execute("BEGIN DEFERRED")
+        try:
+            yield
+        finally:
+            conn.commit()
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        with self.transaction():
+            conn = self._conn()
+            events = len(self._events)
+            conn.execute("SAVEPOINT batched_write")
+            try:
+                yield
+            except BaseException:
+                conn.execute("ROLLBACK TO batched_write")
+                conn.execute("RELEASE batched_write")
+                del self._events[events:]
+                raise
+            conn.execute("RELEASE batched_write")
+
+    def _next_revision(self, conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        return conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def _fetch_all(self, sql: str, params, columns) -> List[Dict[str, Any]]:
+        return [_row_to_record(row, columns) for row in self._conn().execute(sql, params)]
+
+    def _fetch_invitations(self, sql: str, params) -> List[Invitation]:
+        return [Invitation.from_dict(record) for record in self._fetch_all(sql, params, _INVITATION_COLUMNS)]
+
+    def _fetch_groups(self, sql: str, params) -> List[Group]:
+        return [Group.from_dict(record) for record in self._fetch_all(sql, params, _GROUP_COLUMNS)]
+
+    def _update(self, table: str, key_column: str, key: str, updates: Dict[str, Any], columns) -> bool:
+        with self._writing() as conn:
+            select = _SELECT_GROUP if table == 'groups' else _SELECT_INVITATION
+            row = conn.execute(f"{select} WHERE {key_column} = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            record_class = Group if table == 'groups' else Invitation
+            previous = record_class.from_dict(_row_to_record(row, columns))
+            revision = self._next_revision(conn)
+            record = previous.updated({**updates, 'revision': revision})
+            params = _record_to_params(record.to_dict(), columns)
+            assignments = ', '.join(f"{column} = ?" for column in columns + ('extra',))
+            conn.execute(f"UPDATE {table} SET {assignments} WHERE {key_column} = ?", params + [key])
+            type_ = 'group' if table == 'groups' else 'invitation'
+            self._events.append(change_event(type_, 'upsert', revision, record, previous))
+            return True
+
+    # revisions
+
+    def revision(self) -> int:
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def changes_since(self, revision: int, limit: int) -> List[Dict[str, Any]]:
+        conn = self._conn()
+        changes = []
+        for record in self._fetch_all(f"{_SELECT_INVITATION} WHERE revision > ? ORDER BY revision LIMIT ?",
+                                      (revision, limit), _INVITATION_COLUMNS):
+            changes.append({'type': 'invitation', 'op': 'upsert', 'revision': record['revision'], 'data': record})
+        for record in self._fetch_all(f"{_SELECT_GROUP} WHERE revision > ? ORDER BY revision LIMIT ?",
+                                      (revision, limit), _GROUP_COLUMNS):
+            changes.append({'type': 'group', 'op': 'upsert', 'revision': record['revision'], 'data': record})
+        for row in conn.execute("SELECT type, id, revision FROM tombstones WHERE revision > ? ORDER BY revision LIMIT ?",
+                                (revision, limit)):
+            key_field = 'invitation_id' if row['type'] == 'invitation' else 'id'
+            changes.append({'type': row['type'], 'op': 'delete', 'revision': row['revision'],
+                            'data': {key_field: row['id']}})
+        changes.sort(key=lambda change: change['revision'])
+        return changes[:limit]
+
+    def prune_tombstones(self, deleted_before: str) -> int:
+        with self._writing() as conn:
+            horizon = conn.execute("SELECT max(revision) FROM tombstones WHERE deleted_at < ?",
+                                   (deleted_before,)).fetchone()[0]
+            if horizon is None:
+                return 0
+            pruned = conn.execute("DELETE FROM tombstones WHERE deleted_at < ?", (deleted_before,)).rowcount
+            conn.execute("UPDATE meta SET value = max(value, ?) WHERE key = 'tombstone_horizon'", (horizon,))
+            return pruned
+
+    def tombstone_horizon(self) -> int:
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'tombstone_horizon'").fetchone()[0]
+
+    # whole-store access
+
+    def load(self) -> Dict[str, Any]:
+        tombstones = [dict(row) for row in
+                      self._conn().execute("SELECT type, id, revision, deleted_at FROM tombstones")]
+        return {"groups": self._fetch_all(f"{_SELECT_GROUP} ORDER BY seq", (), _GROUP_COLUMNS),
+                "invitations": self._fetch_all(f"{_SELECT_INVITATION} ORDER BY seq", (), _INVITATION_COLUMNS),
+                "tombstones": tombstones, "revision": self.revision(),
+                "tombstone_horizon": self.tombstone_horizon()}
+
+    def save(self, data: Dict[str, Any]) -> None:
+        with self._writing() as conn:
+            revision = self._next_revision(conn)
+            conn.execute("DELETE FROM groups")
+            conn.execute("DELETE FROM invitations")
+            conn.execute("DELETE FROM tombstones")
+            conn.executemany(_INSERT_GROUP, (_record_to_params(g, _GROUP_COLUMNS)
+                                             for g in data.get('groups', [])))
+            conn.executemany(_INSERT_INVITATION, (_record_to_params(inv, _INVITATION_COLUMNS)
+                                                  for inv in data.get('invitations', [])))
+            conn.executemany("INSERT OR REPLACE INTO tombstones (type, id, revision, deleted_at) VALUES (?, ?, ?, ?)",
+                             ((t['type'], t['id'], t['revision'], t.get('deleted_at') or utc_timestamp())
+                              for t in data.get('tombstones', [])))
+            # revisions never go back, also not when replacing everything
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'revision'",
+                         (max(revision, data.get('revision', 0)),))
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'tombstone_horizon'",
+                         (data.get('tombstone_horizon', 0),))
+        self._emit(None)
+
+    # invitations
+
+    def get_invitation(self, invitation_id: str) -> Optional[Invitation]:
+        invitations = self._fetch_invitations(f"{_SELECT_INVITATION} WHERE invitation_id = ?", (invitation_id,))
+        return invitations[0] if invitations else None
+
+    def list_invitations(self) -> List[Invitation]:
+        return self._fetch_invitations(f"{_SELECT_INVITATION} ORDER BY seq", ())
+
+    def invitation_ids(self) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT invitation_id FROM invitations")]
+
+    def query_invitations(self, group_id: Optional[str] = None, status: Optional[str] = None,
+                          invited_from: Optional[str] = None, invited_until: Optional[str] = None,
+                          after: Optional[InvitationKey] = None,
+                          limit: Optional[int] = None) -> List[Invitation]:
+        conditions, params = [], []
+        if group_id is not None:
+            conditions.append("group_id = ?")
+            params.append(group_id)
+        # written exactly as the WHERE clauses of the status indexes, so those are used
+        if status == 'accepted':
+            conditions.append("datetime_accepted != ''")
+        elif status == 'pending':
+            conditions.append("datetime_accepted = '' AND datetime_expired = ''")
+        elif status == 'expired':
+            conditions.append("datetime_accepted = '' AND datetime_expired != ''")
+        if invited_from:
+            conditions.append("datetime_invited >= ?")
+            params.append(invited_from)
+        if invited_until:
+            conditions.append("datetime_invited < ?")
+            params.append(invited_until)
+        if after is not None:
+            conditions.append("(datetime_invited, invitation_id) > (?, ?)")
+            params.extend(after)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"{_SELECT_INVITATION}{where} ORDER BY datetime_invited, invitation_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._fetch_invitations(sql, params)
+
+    def invitations_by_guest_id(self, guest_id: str) -> List[Invitation]:
+        return self._fetch_invitations(f"{_SELECT_INVITATION} WHERE guest_id = ? ORDER BY seq", (guest_id,))
+
+    def invitations_by_eppn(self, eppn: str) -> List[Invitation]:
+        if not eppn:
+            return []
+        return self._fetch_invitations(f"{_SELECT_INVITATION} WHERE eppn = ? ORDER BY seq", (eppn,))
+
+    def due_invitations(self, now: str, limit: int) -> List[Invitation]:
+        # conditions repeat the partial index's WHERE so it is used
+        return self._fetch_invitations(
+            f"{_SELECT_INVITATION} WHERE expires_at != '' AND datetime_accepted = '' AND datetime_expired = '' "
+            f"AND expires_at <= ? ORDER BY expires_at LIMIT ?", (now, limit))
+
+    def add_invitation(self, invitation: Invitation) -> None:
+        with self._writing() as conn:
+            revision = self._next_revision(conn)
+            invitation = dataclasses.replace(invitation, revision=revision)
+            conn.execute(_INSERT_INVITATION, _record_to_params(invitation.to_dict(), _INVITATION_COLUMNS))
+            self._events.append(change_event('invitation', 'upsert', revision, invitation))
+
+    def update_invitation(self, invitation_id: str, updates: Dict[str, Any]) -> bool:
+        return self._update('invitations', 'invitation_id', invitation_id, updates, _INVITATION_COLUMNS)
+
+    def delete_invitation(self, invitation_id: str) -> bool:
+        with self._writing() as conn:
+            row = conn.execute(f"{_SELECT_INVITATION} WHERE invitation_id = ?", (invitation_id,)).fetchone()
+            if row is None:
+                return False
+            revision = self._next_revision(conn)
+            conn.execute("DELETE FROM invitations WHERE invitation_id = ?", (invitation_id,))
+            conn.execute("INSERT OR REPLACE INTO tombstones (type, id, revision, deleted_at) "
+                         "VALUES ('invitation', ?, ?, ?)", (invitation_id, revision, utc_timestamp()))
+            self._events.append(change_event('invitation', 'delete', revision, None,
+                                             Invitation.from_dict(_row_to_record(row, _INVITATION_COLUMNS))))
+            return True
+
+    # groups
+
+    def get_group(self, group_id: str) -> Optional[Group]:
+        groups = self._fetch_groups(f"{_SELECT_GROUP} WHERE id = ?", (group_id,))
+        return groups[0] if groups else None
+
+    def get_group_by_name(self, name: str) -> Optional[Group]:
+        groups = self._fetch_groups(f"{_SELECT_GROUP} WHERE name = ? ORDER BY seq LIMIT 1", (name,))
+        return groups[0] if groups else None
+
+    def list_groups(self) -> List[Group]:
+        return self._fetch_groups(f"{_SELECT_GROUP} ORDER BY seq", ())
+
+    def add_group(self, group: Group) -> None:
+        with self._writing() as conn:
+            revision = self._next_revision(conn)
+            group = dataclasses.replace(group, revision=revision)
+            conn.execute(_INSERT_GROUP, _record_to_params(group.to_dict(), _GROUP_COLUMNS))
+            self._events.append(change_event('group', 'upsert', revision, group))
+
+    def update_group(self, group_id: str, updates: Dict[str, Any]) -> bool:
+        return self._update('groups', 'id', group_id, updates, _GROUP_COLUMNS)
+
+    def delete_group(self, group_id: str) -> bool:
+        with self._writing() as conn:
+            row = conn.execute(f"{_SELECT_GROUP} WHERE id = ?", (group_id,)).fetchone()
+            if row is None:
+                return False
+            revision = self._next_revision(conn)
+            conn.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+            conn.execute("INSERT OR REPLACE INTO tombstones (type, id, revision, deleted_at) "
+                         "VALUES ('group', ?, ?, ?)", (group_id, revision, utc_timestamp()))
+            self._events.append(change_event('group', 'delete', revision, None,
+                                             Group.from_dict(_row_to_record(row, _GROUP_COLUMNS))))
+            return True
+
+    def close(self) -> None:
+        # connections of other threads are only closed here, hence check_same_thread=False
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        self._local = threading.local()
+
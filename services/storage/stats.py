@@ -0,0 +1,248 @@
+"""
+Per-group invitation statistics, maintained incrementally from the storage change events.
+
+Every commit adjusts the counters of the groups it touched (create, accept, group deletion),
+so reading the statistics costs O(number of groups), independent of the number of invitations.
+Only after a full reload (storage.json replaced, backend switched) are they rebuilt with one scan,
+plus the per-segment counts of archived invitations from the archive manifest (see archived_counts).
+"""
+
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Set
+
+from services.metrics import LogBucketSketch
+
+from .backend import StorageBackend
+from .records import Group, Invitation
+
+# quantiles of the time between invitation and acceptance
+ACCEPT_QUANTILES = {'median': 0.5, 'p90': 0.9}
+
+
+# per-group counts of archived invitations: {group_id: {'invited', 'accepted', 'expired', 'accept_times'}}
+ArchivedCounts = Dict[str, Dict[str, Any]]
+
+
+def _accept_seconds(datetime_invited: str, datetime_accepted: Optional[str]) -> Optional[float]:
+    """Seconds from invitation to acceptance, None if not (validly) accepted"""
+    if not datetime_accepted:
+        return None
+    try:
+        invited = datetime.fromisoformat(datetime_invited.replace('Z', '+00:00'))
+        accepted = datetime.fromisoformat(datetime_accepted.replace('Z', '+00:00'))
+        return max((accepted - invited).total_seconds(), 0.0)
+    except (ValueError, TypeError):
+        return None
+
+
+class _GroupCounters:
+    __slots__ = ('name', 'invited', 'accepted', 'expired', 'accept_times')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.invited = 0
+        self.accepted = 0
+        self.expired = 0
+        self.accept_times = LogBucketSketch()
+
+
+def archived_counts(rows: Iterable[Dict[str, Any]]) -> ArchivedCounts:
+    """Per-group counts of archived invitations (export rows), in JSON form for the archive manifest"""
+    counts: Dict[str, _GroupCounters] = {}
+    for row in rows:
+        counters = counts.setdefault(row['group_id'], _GroupCounters(''))
+        counters.invited += 1
+        if row['datetime_accepted']:
+            counters.accepted += 1
+        elif row.get('datetime_expired'):
+            counters.expired += 1
+        seconds = _accept_seconds(row['datetime_invited'], row['datetime_accepted'])
+        if seconds is not None:
+            counters.accept_times.add(seconds)
+    return {group_id: {'invited': counters.invited, 'accepted': counters.accepted, 'expired': counters.expired,
+                       'accept_times': counters.accept_times.to_dict()}
+            for group_id, counters in counts.items()}
+
+
+class _Counts:
+    """Counters per group and in total"""
+
+    def __init__(self, groups: Iterable[Group] = ()):
+        self.groups: Dict[str, _GroupCounters] = {group.id: _GroupCounters(group.name) for group in groups}
+        self.total = _GroupCounters('')
+
+    def apply_group(self, group: Optional[Group], previous: Optional[Group]) -> None:
+        if group is None:
+            counters = self.groups.pop(previous.id, None)
+            if counters is not None:
+                self.total.invited -= counters.invited
+                self.total.accepted -= counters.accepted
+                self.total.expired -= counters.expired
+                self.total.accept_times.merge(counters.accept_times, -1)
+        elif group.id in self.groups:
+            self.groups[group.id].name = group.name
+        else:
+            self.groups[group.id] = _GroupCounters(group.name)
+
+    def count(self, invitation: Optional[Invitation], sign: int) -> None:
+        """Add (sign 1) or remove (sign -1) an invitation's contribution"""
+        if invitation is None:
+            return
+        counters = self.groups.get(invitation.group_id)
+        if counters is None:
+            return
+        seconds = _accept_seconds(invitation.datetime_invited, invitation.datetime_accepted)
+        for target in (counters, self.total):
+            target.invited += sign
+            if invitation.datetime_accepted:
+                target.accepted += sign
+            elif invitation.datetime_expired:
+                target.expired += sign
+            if seconds is not None:
+                target.accept_times.add(seconds, sign)
+
+    def add_archived(self, counts: ArchivedCounts) -> None:
+        for group_id, archived in counts.items():
+            counters = self.groups.get(group_id)
+            if counters is None:
+                continue
+            accept_times = LogBucketSketch.from_dict(archived['accept_times'])
+            for target in (counters, self.total):
+                target.invited += archived['invited']
+                target.accepted += archived['accepted']
+                target.expired += archived['expired']
+                target.accept_times.merge(accept_times)
+
+
+class InvitationStats:
+    """
+    Invited / accepted / pending / expired counts and time-to-accept quantiles per group and in total,
+    including archived invitations. Invitations of deleted groups are not counted.
+    Register apply() as storage change listener.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # one rebuild at a time; never taken by listeners
+        self._rebuild_lock = threading.Lock()
+        self._counts = _Counts()
+        self._stale = True
+        # while a rebuild scans: the events committed meanwhile, applied on top of the scan
+        self._rebuilding: Optional[List[Dict[str, Any]]] = None
+        # invitation_ids being moved to the archive, one set per running archiving() block
+        self._archiving: List[Set[str]] = []
+
+    def invalidate(self) -> None:
+        """Rebuild on the next read"""
+        # no lock: listeners may call this while a commit or a rebuild holds it
+        self._stale = True
+
+    @contextmanager
+    def archiving(self) -> Iterator[Set[str]]:
+        """
+        Invitations added to the yielded set are being archived: their deletion, committed
+        before the block ends, keeps them counted (the rebuild reads them from the archive)
+        """
+        invitation_ids: Set[str] = set()
+        with self._lock:
+            self._archiving.append(invitation_ids)
+        try:
+            yield invitation_ids
+        finally:
+            with self._lock:
+                self._archiving.remove(invitation_ids)
+
+    def apply(self, events: Optional[List[Dict[str, Any]]]) -> None:
+        """Storage change listener; called on the committing thread"""
+        if events is None:
+            self.invalidate()
+            return
+        with self._lock:
+            # an archived invitation keeps counting: its delete is no change to the statistics
+            events = [event for event in events
+                      if not (event['type'] == 'invitation' and event['op'] == 'delete'
+                              and any(event['previous'].invitation_id in invitation_ids
+                                      for invitation_ids in self._archiving))]
+            if self._rebuilding is not None:
+                self._rebuilding += events
+            elif not self._stale:
+                self._apply_events(self._counts, events)
+
+    @staticmethod
+    def _apply_events(counts: _Counts, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            if event['type'] == 'group':
+                counts.apply_group(event['data'], event['previous'])
+            else:
+                counts.count(event['previous'], -1)
+                counts.count(event['data'], 1)
+
+    def _rebuild(self, backend: StorageBackend,
+                 archived: Callable[[], ContextManager[Iterable[ArchivedCounts]]]) -> None:
+        """
+        Scan the backend in a read transaction, so writers carry on; the events they commit
+        meanwhile are collected and those newer than the scanned revision applied afterwards
+        """
+        with self._lock:
+            # cleared first: an invalidate() during the scan (a reload) makes the next read rebuild again
+            self._stale = False
+            self._rebuilding = []
+        try:
+            with archived() as archived_counts, backend.read_transaction():
+                revision = backend.revision()
+                counts = _Counts(backend.list_groups())
+                for invitation in backend.list_invitations():
+                    counts.count(invitation, 1)
+                for archived_group_counts in archived_counts:
+                    counts.add_archived(archived_group_counts)
+        except BaseException:
+            with self._lock:
+                self._rebuilding = None
+                self._stale = True
+            raise
+        with self._lock:
+            self._apply_events(counts, [event for event in self._rebuilding if event['revision'] > revision])
+            self._counts = counts
+            self._rebuilding = None
+
+    def snapshot(self, backend: StorageBackend,
+                 archived: Callable[[], ContextManager[Iterable[ArchivedCounts]]] = lambda: nullcontext([])
+                 ) -> Dict[str, Any]:
+        """
+        Current statistics (rebuilt from backend and the archived counts first if stale):
+            {'groups': [{'group_id', 'group_name', 'invited', 'accepted', 'pending', 'expired',
+                         'accept_seconds': {'median', 'p90'}}, ...], 'total': {...}}
+        archived() is entered around the scan and yields the counts per archive segment.
+        """
+        if self._stale:
+            with self._rebuild_lock:
+                if self._stale:
+                    self._rebuild(backend, archived)
+        with self._lock:
+            groups = [{'group_id': group_id, 'group_name': counters.name, **self._summary(counters)}
+                      for group_id, counters in self._counts.groups.items()]
+            return {'groups': groups, 'total': self._summary(self._counts.total)}
+
+    @staticmethod
+    def _summary(counters: _GroupCounters) -> Dict[str, Any]:
+        return {
+            'invited': counters.invited,
+            'accepted': counters.accepted,
+            'pending': counters.invited - counters.accepted - counters.expired,
+            'expired': counters.expired,
+            'accept_seconds': {name: counters.accept_times.quantile(q) for name, q in ACCEPT_QUANTILES.items()},
+        }
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """Format a duration for display, e.g. '45 min', '3,5 uur', '2,1 dagen'"""
+    if seconds is None:
+        return '-'
+    if seconds < 3600:
+        return f"{max(round(seconds / 60), 1)} min"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} uur".replace('.', ',')
+    days = seconds / 86400
+    return f"{days:.1f} {'dag' if round(days, 1) == 1 else 'dagen'}".replace('.', ',')
@@ -1,187 +1,564 @@
+import base64
+import dataclasses
 import json
 import os
+import threading
 import uuid
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .backend import INVITATION_STATUSES, ChangeListener, InvitationKey, StorageBackend
+from .code_filter import InvitationCodeFilter
+from .json_backend import JsonFileBackend
+from .records import Group, Invitation, InvitationDetails, format_datetime, utc_timestamp
+from .sqlite_backend import SqliteBackend
+from .stats import InvitationStats
+from .write_batcher import WriteBatcher
 
 # Get the directory where this module is located
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 _STORAGE_FILE = os.path.join(_MODULE_DIR, 'storage.json')
+_SQLITE_FILE = os.path.join(_MODULE_DIR, 'storage.sqlite3')
+
+_BACKENDS = {
+    'json': (JsonFileBackend, _STORAGE_FILE),
+    'sqlite': (SqliteBackend, _SQLITE_FILE),
+}
+
+_backend: Optional[StorageBackend] = None
+_batcher: Optional[WriteBatcher] = None
+_backend_settings: Dict[str, Any] = {'backend': 'json', 'path': None, 'options': {},
+                                     'batch_window': 0.005, 'batch_max_size': 500}
+_backend_lock = threading.Lock()
+
+# bumped whenever all data may have changed (storage.json reloaded or replaced, backend switched)
+_reloads = 0
+# distinguishes storage versions of different processes
+_instance = uuid.uuid4().hex[:8]
+
+
+def _count_reloads(events: Optional[List[Dict[str, Any]]]) -> None:
+    global _reloads
+    if events is None:
+        _reloads += 1
+
+
+# per-group statistics and the filter of issued invitation codes, kept up to date by the change events
+_stats = InvitationStats()
+_code_filter = InvitationCodeFilter()
+
+# kept here so they survive configure_storage()
+_listeners: List[ChangeListener] = [_count_reloads, _stats.apply, _code_filter.apply]
+
+
+def configure_storage(backend: str = 'json', path: Optional[str] = None,
+                      journal: bool = False, compact_interval: float = 60.0, pretty: bool = False,
+                      batch_window: float = 0.005, batch_max_size: int = 500) -> None:
+    """
+    Select the storage backend ('json' or 'sqlite', see settings.json: storage_backend).
+
+    Args:
+        backend: backend name
+        path: storage file; defaults to storage.json / storage.sqlite3 in this directory
+        journal: json backend only: append mutations to a journal instead of rewriting storage.json
+        compact_interval: json backend only: seconds between folding the journal into storage.json
+        pretty: json backend only: write storage.json indented (for debugging) instead of compact
+        batch_window: seconds to collect concurrent invitation writes into one flush (0: no batching)
+        batch_max_size: maximum number of writes per flush
+    """
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    global _reloads
+    options = {'journal': journal, 'compact_interval': compact_interval, 'pretty': pretty} if backend == 'json' else {}
+    close_storage()
+    _stats.invalidate()
+    _code_filter.invalidate()
+    with _backend_lock:
+        _reloads += 1
+        _backend_settings.update(backend=backend, path=path, options=options,
+                                 batch_window=batch_window, batch_max_size=batch_max_size)
+
+
+def get_backend() -> StorageBackend:
+    """The configured storage backend (created on first use)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class, default_path = _BACKENDS[_backend_settings['backend']]
+                backend = backend_class(_backend_settings['path'] or default_path, **_backend_settings['options'])
+                for listener in _listeners:
+                    backend.add_listener(listener)
+                _backend = backend
+    return _backend
+
+
+def add_change_listener(listener: ChangeListener) -> None:
+    """Call listener with the change events of every storage commit (see backend.ChangeListener)"""
+    with _backend_lock:
+        _listeners.append(listener)
+        if _backend is not None:
+            _backend.add_listener(listener)
+
+
+def get_write_batcher() -> Optional[WriteBatcher]:
+    """The write batcher, or None if batching is off (batch_window 0)"""
+    global _batcher
+    if _batcher is None and _backend_settings['batch_window'] > 0:
+        backend = get_backend()
+        with _backend_lock:
+            if _batcher is None:
+                _batcher = WriteBatcher(backend, _backend_settings['batch_window'],
+                                        _backend_settings['batch_max_size'])
+    return _batcher
+
+
+# a write: called with the backend (inside a batch transaction if batching is on), returns the result
+WriteOperation = Callable[[StorageBackend], Any]
+
+
+def _write(operation: WriteOperation) -> Any:
+    """Run a write operation on the backend, coalesced with concurrent writes if batching is on"""
+    batcher = get_write_batcher()
+    if batcher is None:
+        return operation(get_backend())
+    return batcher.submit(operation)
+
+
+def close_storage() -> None:
+    """Flush and close the storage backend (e.g. at application shutdown)"""
+    global _backend, _batcher
+    with _backend_lock:
+        if _batcher is not None:
+            _batcher.close()
+        if _backend is not None:
+            _backend.close()
+        _backend = None
+        _batcher = None
+
 
 # storage.json handlers
 
 def load_storage() -> Dict[str, Any]:
-    """Load storage.json as a dictionary"""
-    try:
-        with open(_STORAGE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"groups": [], "invitations": []}
+    """Return all data as {"groups": [...], "invitations": [...]}; pass it to save_storage() after modifying it"""
+    return get_backend().load()
 
 def save_storage(data: Dict[str, Any]) -> None:
-    """Save dictionary back to storage.json"""
-    with open(_STORAGE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    """Replace all stored data"""
+    get_backend().save(data)
 
 
 # invitation CRUD
 
-def find_invitation_by_code(invite_code: str) -> Optional[Dict[str, Any]]:
-    storage_data = load_storage()
+def find_invitation_by_code(invite_code: str) -> Optional[Invitation]:
+    return get_backend().get_invitation(invite_code)
 
-    for invitation in storage_data.get('invitations', []):
-        if invitation['invitation_id'] == invite_code:
-            return invitation
 
-    return None
+def invitation_code_may_exist(invite_code: str) -> bool:
+    """False if no invitation with this code was ever stored (Bloom filter, no storage lookup once built)"""
+    if _code_filter.might_exist(invite_code) is None:
+        _code_filter.rebuild(get_backend())
+    return _code_filter.might_exist(invite_code) is not False
 
 
-def update_invitation(invite_code: str, **updates) -> bool:
-    storage_data = load_storage()
+def invitation_code_filter(invite_code: str) -> Optional[bool]:
+    """invitation_code_may_exist() if the filter is built (no I/O), else None"""
+    return _code_filter.might_exist(invite_code)
 
-    for invitation in storage_data.get('invitations', []):
-        if invitation['invitation_id'] == invite_code:
-            invitation.update(updates)
-            save_storage(storage_data)
-            return True
-
-    return False
 
+def update_invitation(invite_code: str, **updates) -> bool:
+    return _write(update_invitation_operation(invite_code, updates))
 
-def create_invitation(guest_id: str, group_id: str, invitation_mail_address: str) -> str:
-    """Create a new invitation and return the invitation_id"""
-    storage_data = load_storage()
 
+def _new_invitation(guest_id: str, group_id: str, invitation_mail_address: str) -> Invitation:
     # Generate new invitation ID
     invitation_id = str(uuid.uuid4()).replace('-', '')
 
     # Create invitation record with empty eppn, eduid_props, and datetime_accepted (will be filled when accepted)
-    invitation = {
-        "invitation_id": invitation_id,
-        "guest_id": guest_id,
-        "group_id": group_id,
-        "invitation_mail_address": invitation_mail_address,
-        "datetime_invited": datetime.utcnow().isoformat() + 'Z',
-        "datetime_accepted": "",
-        "eppn": "",
-        "eduid_props": {}
-    }
-    storage_data.setdefault('invitations', []).append(invitation)
-    save_storage(storage_data)
-    return invitation_id
-
-
-def mark_invitation_accepted(invite_code: str):
-    invitation = find_invitation_by_code(invite_code)
-    if invitation and not invitation.get('datetime_accepted', ''):
-        update_invitation(
-            invite_code,
-            datetime_accepted=datetime.utcnow().isoformat() + 'Z',
-        )
-
-
-def get_all_invitations_with_details() -> List[Dict[str, Any]]:
-    storage_data = load_storage()
-    invitations_with_details = []
-
-    def format_datetime(iso_string):
-        if not iso_string:
-            return ''
-        try:
-            # Parse ISO format and convert to readable format
-            dt = datetime.fromisoformat(iso_string.replace('Z', '+00:00'))
-            return dt.strftime('%d-%m-%Y %H:%M')
-        except:  # noqa: E722
-            return iso_string
-
-    for invitation in storage_data.get('invitations', []):
-        # Get group details
-        group = find_group_by_id(invitation['group_id'])
-        group_name = group.get('name', '')  # type: ignore
-
-        # Format dates
-        datetime_invited_formatted = format_datetime(invitation['datetime_invited'])
-        datetime_accepted_formatted = format_datetime(invitation.get('datetime_accepted', ''))
-
-        invitation_detail = {
-            'invitation_id': invitation['invitation_id'],
-            'guest_id': invitation['guest_id'],
-            'group_name': group_name,
-            'group_id': invitation['group_id'],
-            'invitation_mail_address': invitation.get('invitation_mail_address', ''),
-            'datetime_invited_formatted': datetime_invited_formatted,
-            'datetime_accepted_formatted': datetime_accepted_formatted,
-            'datetime_invited': invitation['datetime_invited'],
-            'datetime_accepted': invitation.get('datetime_accepted', '')
-        }
-        invitations_with_details.append(invitation_detail)
-
-    return invitations_with_details
+    return Invitation(
+        invitation_id=invitation_id,
+        guest_id=guest_id,
+        group_id=group_id,
+        invitation_mail_address=invitation_mail_address,
+        datetime_invited=datetime.utcnow().isoformat() + 'Z'
+    )
+
+
+def _with_expiry(backend: StorageBackend, invitation: Invitation,
+                 validity: Optional[Dict[str, Optional[int]]] = None) -> Invitation:
+    """The invitation with expires_at set from its group's validity_days (validity: cache of group_id -> days)"""
+    validity = {} if validity is None else validity
+    if invitation.group_id not in validity:
+        group = backend.get_group(invitation.group_id)
+        validity[invitation.group_id] = group.validity_days if group else None
+    days = validity[invitation.group_id]
+    if not days:
+        return invitation
+    invited = datetime.fromisoformat(invitation.datetime_invited.rstrip('Z'))
+    return dataclasses.replace(invitation, expires_at=utc_timestamp(invited + timedelta(days=days)))
 
 
-# group CRUD
+def create_invitation(guest_id: str, group_id: str, invitation_mail_address: str) -> str:
+    """Create a new invitation and return the invitation_id; it expires after its group's validity_days"""
+    return _write(create_invitation_operation(guest_id, group_id, invitation_mail_address))
 
-def get_all_groups() -> List[Dict[str, Any]]:
-    storage_data = load_storage()
-    return storage_data.get('groups', [])
 
+def _open_invitation(backend: StorageBackend, guest_id: str, group_id: str) -> Optional[Invitation]:
+    """The guest's pending, unexpired invitation for this group, if any (guest_id index)"""
+    for invitation in backend.invitations_by_guest_id(guest_id):
+        if invitation.group_id == group_id and invitation.status == 'pending' and not invitation.is_expired():
+            return invitation
+    return None
 
-def find_group_by_id(group_id: str) -> Optional[Dict[str, Any]]:
-    storage_data = load_storage()
-    for group in storage_data.get('groups', []):
-        if group['id'] == group_id:
-            return group
 
-    return None
+def get_or_create_invitation(guest_id: str, group_id: str, invitation_mail_address: str) -> Tuple[Invitation, bool]:
+    """
+    The guest's open invitation for this group, or a new one: (invitation, created).
+    Makes retried creates safe: (guest_id, group_id, pending) is a natural key.
+    """
+    return _write(get_or_create_invitation_operation(guest_id, group_id, invitation_mail_address))
 
 
-def find_group_by_name(group_name: str) -> Optional[Dict[str, Any]]:
-    storage_data = load_storage()
-    for group in storage_data.get('groups', []):
-        if group['name'] == group_name:
-            return group
+def create_invitations(rows: List[Tuple[str, str, str]]) -> List[str]:
+    """Create invitations from (guest_id, group_id, invitation_mail_address) rows in one transaction"""
+    return _write(create_invitations_operation(rows))
 
-    return None
 
+def mark_invitation_accepted(invite_code: str) -> bool:
+    """Set datetime_accepted unless already accepted or expired; returns whether it was set"""
+    return _write(mark_invitation_accepted_operation(invite_code))
 
-def create_group(name: str, redirect_url: str, redirect_text: str) -> str:
-    storage_data = load_storage()
 
-    group_id = str(uuid.uuid4())
-    group = {
-        "id": group_id,
-        "name": name,
-        "redirect_url": redirect_url,
-        "redirect_text": redirect_text
+def _group_names(backend: StorageBackend) -> Dict[str, str]:
+    return {group.id: group.name for group in backend.list_groups()}
+
+
+def get_all_invitations_with_details() -> List[InvitationDetails]:
+    """All invitations joined with their group name, in a single pass"""
+    backend = get_backend()
+    group_names = _group_names(backend)
+    return [InvitationDetails(invitation, group_names.get(invitation.group_id, ''))
+            for invitation in backend.list_invitations()]
+
+
+def _encode_cursor(key: InvitationKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str) -> InvitationKey:
+    try:
+        datetime_invited, invitation_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (str(datetime_invited), str(invitation_id))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def storage_timestamp(value: str) -> str:
+    """Normalise an ISO date/datetime to the UTC format used in storage, e.g. 2025-09-04T09:50:18.460062Z"""
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat(timespec='microseconds') + 'Z'
+
+
+def query_invitations(group_id: Optional[str] = None, status: Optional[str] = None,
+                      invited_after: Optional[str] = None, invited_before: Optional[str] = None,
+                      limit: Optional[int] = None, cursor: Optional[str] = None
+                      ) -> Tuple[List[InvitationDetails], Optional[str]]:
+    """
+    One page of invitations (with details), oldest first.
+
+    Args:
+        group_id: only invitations for this group
+        status: 'accepted', 'pending' or 'expired'
+        invited_after: only invitations with datetime_invited >= this ISO date/datetime
+        invited_before: only invitations with datetime_invited < this ISO date/datetime
+        limit: page size (None: everything after the cursor)
+        cursor: next_cursor of the previous page
+
+    Returns:
+        (invitations, next_cursor); next_cursor is None on the last page
+
+    Raises:
+        ValueError: invalid status, date or cursor
+    """
+    if status is not None and status not in INVITATION_STATUSES:
+        raise ValueError(f"Invalid status: {status}")
+    backend = get_backend()
+    # fetch one extra row to find out whether there is a next page
+    invitations = backend.query_invitations(
+        group_id=group_id,
+        status=status,
+        invited_from=storage_timestamp(invited_after) if invited_after else None,
+        invited_until=storage_timestamp(invited_before) if invited_before else None,
+        after=_decode_cursor(cursor) if cursor else None,
+        limit=limit + 1 if limit is not None else None
+    )
+    next_cursor = None
+    if limit is not None and len(invitations) > limit:
+        invitations = invitations[:limit]
+        next_cursor = _encode_cursor(invitations[-1].key)
+
+    group_names = _group_names(backend)
+    return [InvitationDetails(invitation, group_names.get(invitation.group_id, ''))
+            for invitation in invitations], next_cursor
+
+
+EXPORT_FIELDS = ['invitation_id', 'guest_id', 'group_id', 'group_name', 'invitation_mail_address',
+                 'datetime_invited', 'datetime_accepted', 'expires_at', 'datetime_expired', 'eppn', 'eduid_props']
+
+
+def _export_row(invitation: Invitation, group_name: str) -> Dict[str, Any]:
+    """An invitation with EXPORT_FIELDS, as returned by the export and lookup API"""
+    return {
+        'invitation_id': invitation.invitation_id,
+        'guest_id': invitation.guest_id,
+        'group_id': invitation.group_id,
+        'group_name': group_name,
+        'invitation_mail_address': invitation.invitation_mail_address,
+        'datetime_invited': invitation.datetime_invited,
+        'datetime_accepted': invitation.datetime_accepted,
+        'expires_at': invitation.expires_at,
+        'datetime_expired': invitation.datetime_expired,
+        'eppn': invitation.eppn,
+        'eduid_props': invitation.eduid_props or {},
     }
-    storage_data.setdefault('groups', []).append(group)
-    save_storage(storage_data)
 
-    return group_id
 
+def export_rows(backend: StorageBackend, invitations: List[Invitation]) -> List[Dict[str, Any]]:
+    """_export_row() for a few invitations, looking up only their own groups"""
+    group_names = {}
+    for group_id in {invitation.group_id for invitation in invitations}:
+        group = backend.get_group(group_id)
+        group_names[group_id] = group.name if group else ''
+    return [_export_row(invitation, group_names[invitation.group_id]) for invitation in invitations]
 
-def update_group(group_id: str, **updates) -> bool:
-    storage_data = load_storage()
 
-    for group in storage_data.get('groups', []):
-        if group['id'] == group_id:
-            group.update(updates)
-            save_storage(storage_data)
-            return True
+def get_invitation_export(invitation_id: str) -> Optional[Dict[str, Any]]:
+    """One invitation with EXPORT_FIELDS, or None"""
+    backend = get_backend()
+    invitation = backend.get_invitation(invitation_id)
+    return export_rows(backend, [invitation])[0] if invitation else None
 
-    return False
 
+def find_invitations_by_guest_id(guest_id: str) -> List[Dict[str, Any]]:
+    """All invitations of a guest with EXPORT_FIELDS (index lookup)"""
+    backend = get_backend()
+    return export_rows(backend, backend.invitations_by_guest_id(guest_id))
 
-def delete_group(group_id: str) -> bool:
-    storage_data = load_storage()
 
-    groups = storage_data.get('groups', [])
-    original_length = len(groups)
+def find_invitations_by_eppn(eppn: str) -> List[Dict[str, Any]]:
+    """All invitations accepted with this eduID eppn, with EXPORT_FIELDS (index lookup)"""
+    backend = get_backend()
+    return export_rows(backend, backend.invitations_by_eppn(eppn))
+
+
+def export_invitations(group_id: Optional[str] = None, status: Optional[str] = None,
+                       invited_after: Optional[str] = None, invited_before: Optional[str] = None,
+                       page_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+    """
+    All (filtered) invitations with EXPORT_FIELDS, oldest first, as an iterator of pages,
+    so exports never hold more than page_size invitations in memory.
+    Takes the same filters as query_invitations(); raises ValueError before iterating.
+    """
+    if status is not None and status not in INVITATION_STATUSES:
+        raise ValueError(f"Invalid status: {status}")
+    invited_from = storage_timestamp(invited_after) if invited_after else None
+    invited_until = storage_timestamp(invited_before) if invited_before else None
+    backend = get_backend()
+    group_names = _group_names(backend)
+
+    def pages() -> Iterator[List[Dict[str, Any]]]:
+        after = None
+        while True:
+            invitations = backend.query_invitations(group_id=group_id, status=status,
+                                                    invited_from=invited_from, invited_until=invited_until,
+                                                    after=after, limit=page_size)
+            if not invitations:
+                return
+            yield [_export_row(invitation, group_names.get(invitation.group_id, '')) for invitation in invitations]
+            if len(invitations) < page_size:
+                return
+            after = invitations[-1].key
+
+    return pages()
+
+
+# change feed
+
+MAX_CHANGES = 1000
+
+
+def get_storage_revision() -> int:
+    return get_backend().revision()
+
+
+def get_storage_version() -> str:
+    """Opaque token that changes whenever any stored data changes (for HTTP ETags)"""
+    revision = get_backend().revision()
+    return f"{_instance}.{_reloads}.{revision}"
+
+
+def get_invitation_stats() -> Dict[str, Any]:
+    """Invited / accepted / pending counts and time-to-accept quantiles per group (see stats.py)"""
+    # imported here: retention imports this module
+    from .retention import reading_archived_counts
+    return _stats.snapshot(get_backend(), reading_archived_counts)
+
 
-    storage_data['groups'] = [g for g in groups if g['id'] != group_id]
+def archiving_invitations():
+    """
+    Context manager for retention: invitations added to the yielded set are moved to the archive,
+    so deleting them (committed inside the block) does not remove them from the statistics
+    """
+    return _stats.archiving()
 
-    if len(storage_data['groups']) < original_length:
-        save_storage(storage_data)
-        return True
 
-    return False
+def invalidate_invitation_stats() -> None:
+    """Rebuild the statistics on the next read, e.g. after the archive changed outside archiving_invitations()"""
+    _stats.invalidate()
+
+
+class ChangesPruned(Exception):
+    """Deletions after the requested revision may have been pruned (see prune_tombstones): resync from scratch"""
+
+
+def get_changes(since: int, limit: int = MAX_CHANGES) -> Dict[str, Any]:
+    """
+    Records changed after revision since: {'revision', 'changes', 'more'}.
+    Pass 'revision' as the next since; 'more' means the limit was hit and there are more changes.
+    Raises ChangesPruned if since is older than the tombstone horizon (a client that has nothing yet,
+    since <= 0, needs no deletions and gets everything).
+    """
+    backend = get_backend()
+    if 0 < since < backend.tombstone_horizon():
+        raise ChangesPruned(f"Changes since revision {since} are no longer available; resync without since")
+    revision = backend.revision()
+    changes = backend.changes_since(since, limit + 1)
+    more = len(changes) > limit
+    if more:
+        changes = changes[:limit]
+        revision = changes[-1]['revision']
+    elif changes:
+        # a write may have committed between reading the revision and the changes
+        revision = max(revision, changes[-1]['revision'])
+    return {'revision': max(revision, since), 'changes': changes, 'more': more}
+
+
+# expiry
+
+EXPIRY_BATCH_SIZE = 1000
+
+
+def expire_due_invitations(limit: int = EXPIRY_BATCH_SIZE) -> int:
+    """Mark up to limit pending invitations past their expires_at as expired (from the expiry index); returns the number"""
+    return _write(expire_due_operation(limit))
+
+
+# write operations, for _write() here and async_storage: the checks run inside the operation,
+# so concurrent writers cannot both pass them
+
+def update_invitation_operation(invite_code: str, updates: Dict[str, Any]) -> WriteOperation:
+    """Apply updates to an invitation; returns False if it does not exist"""
+    return lambda backend: backend.update_invitation(invite_code, updates)
+
+
+def create_invitation_operation(guest_id: str, group_id: str, invitation_mail_address: str) -> WriteOperation:
+    """Add a new invitation (with expiry); returns its invitation_id"""
+    invitation = _new_invitation(guest_id, group_id, invitation_mail_address)
+
+    def operation(backend: StorageBackend) -> str:
+        backend.add_invitation(_with_expiry(backend, invitation))
+        return invitation.invitation_id
+    return operation
+
+
+def get_or_create_invitation_operation(guest_id: str, group_id: str, invitation_mail_address: str) -> WriteOperation:
+    """The guest's open invitation for this group, or a new one; returns (invitation, created)"""
+    invitation = _new_invitation(guest_id, group_id, invitation_mail_address)
+
+    def operation(backend: StorageBackend) -> Tuple[Invitation, bool]:
+        with backend.transaction():
+            existing = _open_invitation(backend, guest_id, group_id)
+            if existing is not None:
+                return existing, False
+            added = _with_expiry(backend, invitation)
+            backend.add_invitation(added)
+        return added, True
+    return operation
+
+
+def mark_invitation_accepted_operation(invite_code: str) -> WriteOperation:
+    """Set datetime_accepted unless already accepted or expired; returns whether it was set"""
+    def operation(backend: StorageBackend) -> bool:
+        with backend.transaction():
+            invitation = backend.get_invitation(invite_code)
+            now = utc_timestamp()
+            if invitation is None or invitation.datetime_accepted or invitation.is_expired(now):
+                return False
+            return backend.update_invitation(invite_code, {'datetime_accepted': now})
+    return operation
+
+
+def create_invitations_operation(rows: List[Tuple[str, str, str]]) -> WriteOperation:
+    """Add invitations for (guest_id, group_id, invitation_mail_address) rows in one transaction; returns their ids"""
+    invitations = [_new_invitation(*row) for row in rows]
+
+    def operation(backend: StorageBackend) -> List[str]:
+        validity: Dict[str, Optional[int]] = {}
+        with backend.transaction():
+            for invitation in invitations:
+                backend.add_invitation(_with_expiry(backend, invitation, validity))
+        return [invitation.invitation_id for invitation in invitations]
+    return operation
+
+
+def expire_due_operation(limit: int) -> WriteOperation:
+    """Mark up to limit due invitations as expired; returns the number"""
+    def operation(backend: StorageBackend) -> int:
+        now = utc_timestamp()
+        with backend.transaction():
+            due = backend.due_invitations(now, limit)
+            for invitation in due:
+                backend.update_invitation(invitation.invitation_id, {'datetime_expired': now})
+        return len(due)
+    return operation
+
+
+# group CRUD
+
+def get_all_groups() -> List[Group]:
+    return get_backend().list_groups()
+
+
+def find_group_by_id(group_id: str) -> Optional[Group]:
+    return get_backend().get_group(group_id)
+
+
+def find_group_by_name(group_name: str) -> Optional[Group]:
+    return get_backend().get_group_by_name(group_name)
+
+
+def create_group(name: str, redirect_url: str, redirect_text: str, validity_days: Optional[int] = None) -> str:
+    group_id = str(uuid.uuid4())
+    group = Group(
+        id=group_id,
+        name=name,
+        redirect_url=redirect_url,
+        redirect_text=redirect_text,
+        validity_days=validity_days
+    )
+    get_backend().add_group(group)
+
+    return group_id
+
+
+def update_group(group_id: str, **updates) -> bool:
+    return get_backend().update_group(group_id, updates)
+
+
+def delete_group(group_id: str) -> bool:
+    return get_backend().delete_group(group_id)
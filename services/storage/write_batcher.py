@@ -0,0 +1,110 @@
+"""
+Group commit for storage writes.
+
+Writes submitted by concurrent callers within a short window (or until the batch is full)
+are applied together in one backend transaction, i.e. persisted with a single flush.
+Each caller blocks until the batch containing its write is durable. Every write runs in its own
+savepoint: one that raises is undone alone and the rest of the batch commits; if the commit
+itself fails, all writes of the batch are undone and every caller gets the error.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from services.logging import logger
+from services.metrics import metrics
+
+from .backend import StorageBackend
+
+# (operation, future, time of submission)
+_Item = Tuple[Callable[[StorageBackend], Any], Future, float]
+
+
+class WriteBatcher:
+    """Coalesces write operations on a StorageBackend into batches, flushed by one background thread"""
+
+    def __init__(self, backend: StorageBackend, window: float = 0.005, max_batch_size: int = 500):
+        self.backend = backend
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue: Deque[_Item] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, operation: Callable[[StorageBackend], Any]) -> Any:
+        """Run operation(backend) in the next batch; returns its result once the batch is durable"""
+        return self.enqueue(operation).result()
+
+    def enqueue(self, operation: Callable[[StorageBackend], Any]) -> Future:
+        """Like submit(), but returns a Future instead of blocking (await it with asyncio.wrap_future)"""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Storage write batcher is closed")
+            self._queue.append((operation, future, time.monotonic()))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='storage-write-batcher', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def close(self) -> None:
+        """Flush pending writes and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # the window starts when the oldest write arrived
+                deadline = self._queue[0][2] + self.window
+                while len(self._queue) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                size = min(len(self._queue), self.max_batch_size)
+                batch = [self._queue.popleft() for _ in range(size)]
+            self._flush(batch)
+
+    def _flush(self, batch: List[_Item]) -> None:
+        start = time.monotonic()
+        results = []
+        try:
+            with self.backend.transaction():
+                for operation, future, _ in batch:
+                    try:
+                        with self.backend.savepoint():
+                            results.append((future, operation(self.backend), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # the batch could not be persisted: the backend has undone all of its writes
+            logger.error(f"Storage batch flush of {len(batch)} writes failed: {e}")
+            metrics.inc('storage_batch_failures')
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        done = time.monotonic()
+        metrics.inc('storage_batch_flushes')
+        metrics.observe('storage_batch_size', len(batch))
+        metrics.observe('storage_batch_flush_seconds', done - start)
+        for (_, _, submitted), (future, result, error) in zip(batch, results):
+            metrics.observe('storage_write_latency_seconds', done - submitted)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,62 @@
+# services/ttl_cache.py
+# Bounded in-memory key/value cache whose entries expire after a time-to-live
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Mapping with at most maxsize entries, each valid for ttl seconds after it was set.
+    When full, the least recently set entry is evicted. Expired entries are dropped on access
+    and, oldest first, on every set(), so memory stays bounded. Thread-safe.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        # key -> (expiry time, value), in order of set()
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= self._timer():
+                del self._entries[key]
+                return default
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value for ttl seconds (default: the cache's ttl)"""
+        with self._lock:
+            now = self._timer()
+            self._entries[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            # entries set earlier usually expire earlier: drop expired ones from the front
+            while self._entries:
+                oldest_key, (expires, _) = next(iter(self._entries.items()))
+                if expires > now and len(self._entries) <= self.maxsize:
+                    break
+                del self._entries[oldest_key]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] <= self._timer():
+                return default
+            return entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_MISSING = object()
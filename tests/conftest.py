@@ -0,0 +1,12 @@
+import pytest
+
+from services.storage import storage
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    """services.storage configured on a fresh backend of each kind (without write batching)"""
+    name = 'storage.json' if request.param == 'json' else 'storage.sqlite3'
+    storage.configure_storage(request.param, str(tmp_path / name), batch_window=0)
+    yield storage
+    storage.close_storage()
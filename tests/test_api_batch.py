@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('nicegui')
+
+from fastapi import HTTPException  # noqa: E402
+
+from routes import api  # noqa: E402
+
+
+class _StreamingRequest:
+    """The parts of a starlette Request that _read_rows uses"""
+
+    def __init__(self, chunks, content_type='application/x-ndjson'):
+        self.headers = {'content-type': content_type}
+        self._chunks = chunks
+        self.chunks_read = 0
+
+    async def stream(self):
+        for chunk in self._chunks:
+            self.chunks_read += 1
+            yield chunk
+
+
+def _read(request):
+    return asyncio.run(api._read_rows(request))
+
+
+def test_ndjson_rows():
+    request = _StreamingRequest([b'{"guest_id": "a"}\n{"gue', b'st_id": "b"}\n', b'{"guest_id": "c"}'])
+    assert _read(request) == [{'guest_id': 'a'}, {'guest_id': 'b'}, {'guest_id': 'c'}]
+
+
+def test_ndjson_too_many_rows_is_413_without_reading_on(monkeypatch):
+    monkeypatch.setattr(api, 'MAX_BATCH_SIZE', 3)
+    # the chunk that crosses the limit ends in the middle of a line
+    request = _StreamingRequest([b'{"i": 1}\n{"i": 2}\n{"i": 3}\n{"i": 4}\n{"i"', b': 5}\n', b'{"i": 6}\n'])
+    with pytest.raises(HTTPException) as error:
+        _read(request)
+    assert error.value.status_code == 413
+    assert request.chunks_read == 1
+
+
+def test_ndjson_line_too_long_is_413(monkeypatch):
+    monkeypatch.setattr(api, 'MAX_LINE_BYTES', 100)
+    request = _StreamingRequest([b'{"guest_id": "' + b'x' * 60, b'x' * 60, b'"}\n'])
+    with pytest.raises(HTTPException) as error:
+        _read(request)
+    assert error.value.status_code == 413
+    assert request.chunks_read == 2
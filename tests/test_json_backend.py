@@ -0,0 +1,51 @@
+import os
+
+from services.storage.json_backend import JsonFileBackend
+from services.storage.records import Group, Invitation
+
+
+def _backend(tmp_path, **options) -> JsonFileBackend:
+    options.setdefault('journal', True)
+    options.setdefault('compact_interval', 0)
+    return JsonFileBackend(str(tmp_path / 'storage.json'), **options)
+
+
+def test_compaction_does_not_overwrite_newer_save(tmp_path):
+    backend = _backend(tmp_path)
+    backend.add_group(Group(id='g1', name='old'))
+    write_snapshot = backend._write_snapshot
+
+    def save_in_between(content, generation):
+        # save() replaces everything after compact() serialised, before it writes
+        backend._write_snapshot = write_snapshot
+        backend.save({'groups': [Group(id='g2', name='new').to_dict()], 'invitations': []})
+        return write_snapshot(content, generation)
+
+    backend._write_snapshot = save_in_between
+    backend.compact()
+    backend.close()
+
+    reopened = _backend(tmp_path)
+    assert [group.id for group in reopened.list_groups()] == ['g2']
+    assert not os.path.exists(reopened.compacting_file)
+    reopened.close()
+
+
+def test_journal_replay_keeps_extra_fields(tmp_path):
+    backend = _backend(tmp_path)
+    backend.add_group(Group(id='g1', name='A', extra={'owner': 'x'}))
+    backend.add_invitation(Invitation(invitation_id='i1', guest_id='guest', group_id='g1',
+                                      datetime_invited='2025-01-01T00:00:00.000000Z', extra={'note': 'n'}))
+    backend._journal_handle.close()
+    backend._journal_handle = None
+
+    replayed = _backend(tmp_path)
+    assert replayed.get_invitation('i1').extra == {'note': 'n'}
+    assert replayed.get_group('g1').extra == {'owner': 'x'}
+    replayed.close()  # compacts the journal into storage.json
+
+    compacted = _backend(tmp_path)
+    assert not os.path.exists(compacted.journal_file)
+    assert compacted.get_invitation('i1').to_dict()['note'] == 'n'
+    assert 'extra' not in compacted.get_invitation('i1').to_dict()
+    compacted.close()
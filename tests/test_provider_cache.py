@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip('requests')
+
+from eduid_oidc import provider_cache  # noqa: E402
+from eduid_oidc.provider_cache import ProviderMetadataCache  # noqa: E402
+
+
+def test_cold_get_async_does_not_wait_for_background_refresh(monkeypatch):
+    release = threading.Event()
+
+    def slow_fetch(url):
+        release.wait(5)
+        return {'issuer': 'background'}, None
+
+    async def fetch_async(url):
+        return {'issuer': 'async'}, None
+
+    monkeypatch.setattr(provider_cache, 'fetch_well_known_config_async', fetch_async)
+    cache = ProviderMetadataCache('https://provider/.well-known/openid-configuration', slow_fetch)
+    cache.refresh_in_background()
+    try:
+        metadata = asyncio.run(asyncio.wait_for(cache.get_async(), 1))
+        assert metadata == {'issuer': 'async'}
+    finally:
+        release.set()
+        with cache._refreshing:
+            cache.close()
+
+
+def test_failed_refresh_serves_cached_copy():
+    responses = [({'issuer': 'first'}, None), RuntimeError('provider down')]
+
+    def fetch(url):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    cache = ProviderMetadataCache('https://provider/.well-known/openid-configuration', fetch)
+    try:
+        assert cache.get() == {'issuer': 'first'}
+        assert cache.refresh() == {'issuer': 'first'}
+    finally:
+        cache.close()
@@ -0,0 +1,52 @@
+from services.rate_limit import TokenBucketLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill():
+    clock = _Clock()
+    limiter = TokenBucketLimiter(rate=1, burst=2, timer=clock)
+    assert limiter.allow('a') and limiter.allow('a')
+    assert not limiter.allow('a')
+    assert limiter.limited('a')
+    clock.now = 1
+    assert limiter.allow('a')
+
+
+def test_tracked_keys_are_capped():
+    clock = _Clock()
+    limiter = TokenBucketLimiter(rate=0.001, burst=1, max_keys=100, timer=clock)
+    for i in range(10_000):
+        limiter.allow(f'key-{i}')
+        assert len(limiter) <= 100
+    # the most recent keys are still limited, the oldest were evicted
+    assert limiter.limited('key-9999')
+    assert not limiter.limited('key-0')
+
+
+def test_refilled_buckets_are_dropped():
+    clock = _Clock()
+    limiter = TokenBucketLimiter(rate=1, burst=2, timer=clock)
+    for i in range(50):
+        limiter.allow(f'key-{i}')
+    clock.now = 10
+    limiter.allow('new')
+    assert len(limiter) == 1
+
+
+def test_recently_used_key_survives_eviction():
+    clock = _Clock()
+    limiter = TokenBucketLimiter(rate=0.001, burst=1, max_keys=3, timer=clock)
+    limiter.allow('busy')
+    limiter.allow('b')
+    limiter.allow('c')
+    assert not limiter.allow('busy')
+    limiter.allow('d')
+    assert limiter.limited('busy')
+    assert len(limiter) == 3
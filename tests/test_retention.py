@@ -0,0 +1,95 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.storage import retention
+
+
+@pytest.fixture
+def archive_dir(store, tmp_path):
+    """Retention archiving every pending invitation (run with LATER), into a fresh archive"""
+    directory = str(tmp_path / 'archive')
+    retention.configure_retention(archive_path=directory, pending_days=0)
+    yield directory
+    retention.configure_retention()
+
+
+LATER = datetime.utcnow() + timedelta(days=1)
+
+
+def _invite(store, count):
+    group_id = store.create_group('Group', 'https://app', 'App')
+    return [store.create_invitation(f'guest-{i}', group_id, f'guest{i}@example.org') for i in range(count)]
+
+
+def _staged(directory):
+    return [name for name in os.listdir(directory) if name.startswith('.staged-')]
+
+
+def test_archive_moves_invitations(store, archive_dir):
+    codes = _invite(store, 3)
+    result = retention.archive_invitations(LATER)
+    assert result['archived'] == 3
+    assert not any(store.find_invitation_by_code(code) for code in codes)
+    assert retention.get_archive_summary()['invitations'] == 3
+    assert store.get_invitation_stats()['total']['invited'] == 3
+    assert _staged(archive_dir) == []
+
+
+def test_archive_failed_commit_keeps_invitations_hot(store, archive_dir, monkeypatch):
+    codes = _invite(store, 3)
+    backend = store.get_backend()
+    delete_invitation = backend.delete_invitation
+    deleted = []
+
+    def failing_delete(invitation_id):
+        if deleted:
+            raise OSError('disk full')
+        deleted.append(invitation_id)
+        return delete_invitation(invitation_id)
+
+    monkeypatch.setattr(backend, 'delete_invitation', failing_delete)
+    with pytest.raises(OSError):
+        retention.archive_invitations(LATER)
+
+    assert all(store.find_invitation_by_code(code) for code in codes)
+    assert retention.get_archive_summary()['invitations'] == 0
+    assert _staged(archive_dir) == []
+    assert store.get_invitation_stats()['total']['invited'] == 3
+    store.invalidate_invitation_stats()
+    assert store.get_invitation_stats()['total']['invited'] == 3
+
+
+def test_archive_failed_publish_is_reconciled(store, archive_dir, monkeypatch):
+    codes = _invite(store, 3)
+    assert store.get_invitation_stats()['total']['invited'] == 3
+    archive = retention.get_archive()
+    monkeypatch.setattr(archive, 'publish', lambda entry: (_ for _ in ()).throw(OSError('disk full')))
+    with pytest.raises(OSError):
+        retention.archive_invitations(LATER)
+    monkeypatch.undo()
+
+    # the deletes committed: the staged segment is the only copy, and is kept
+    assert not any(store.find_invitation_by_code(code) for code in codes)
+    assert len(_staged(archive_dir)) == 1
+    assert store.get_invitation_stats()['total']['invited'] == 3
+
+    retention.reconcile_archive()
+    assert _staged(archive_dir) == []
+    assert retention.get_archive_summary()['invitations'] == 3
+    assert len(retention.query_archive(invitation_id=codes[0])) == 1
+    store.invalidate_invitation_stats()
+    assert store.get_invitation_stats()['total']['invited'] == 3
+
+
+def test_uncommitted_staged_segment_is_discarded(store, archive_dir):
+    codes = _invite(store, 2)
+    backend = store.get_backend()
+    rows = store.export_rows(backend, [backend.get_invitation(code) for code in codes])
+    retention.get_archive().stage(rows)
+
+    retention.reconcile_archive()
+    assert _staged(archive_dir) == []
+    assert retention.get_archive_summary()['invitations'] == 0
+    assert all(store.find_invitation_by_code(code) for code in codes)
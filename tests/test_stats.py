@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from services.storage import storage
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    storage.configure_storage('sqlite', str(tmp_path / 'storage.sqlite3'), batch_window=0)
+    yield storage
+    storage.close_storage()
+
+
+def _pause_during_scan(monkeypatch, backend, method):
+    """Make backend.method wait (mid-scan) until the returned event is set"""
+    scanning, resume = threading.Event(), threading.Event()
+    original = getattr(backend, method)
+
+    def paused(*args, **kwargs):
+        result = original(*args, **kwargs)
+        scanning.set()
+        assert resume.wait(5)
+        return result
+
+    monkeypatch.setattr(backend, method, paused)
+    return scanning, resume
+
+
+def test_stats_rebuild_does_not_block_writers(sqlite_store, monkeypatch):
+    group_id = sqlite_store.create_group('Group', 'https://app', 'App')
+    sqlite_store.create_invitation('guest-1', group_id, 'guest1@example.org')
+    scanning, resume = _pause_during_scan(monkeypatch, sqlite_store.get_backend(), 'list_invitations')
+
+    result = {}
+    rebuild = threading.Thread(target=lambda: result.update(sqlite_store.get_invitation_stats()))
+    rebuild.start()
+    assert scanning.wait(5)
+    # commits while the rebuild scans; not part of the scan, applied afterwards
+    code = sqlite_store.create_invitation('guest-2', group_id, 'guest2@example.org')
+    sqlite_store.mark_invitation_accepted(code)
+    resume.set()
+    rebuild.join(5)
+
+    assert result['total']['invited'] == 2
+    assert result['total']['accepted'] == 1
+    assert sqlite_store.get_invitation_stats() == result
+
+
+def test_code_filter_rebuild_does_not_block_writers(sqlite_store, monkeypatch):
+    group_id = sqlite_store.create_group('Group', 'https://app', 'App')
+    first = sqlite_store.create_invitation('guest-1', group_id, 'guest1@example.org')
+    scanning, resume = _pause_during_scan(monkeypatch, sqlite_store.get_backend(), 'invitation_ids')
+
+    rebuild = threading.Thread(target=sqlite_store.invitation_code_may_exist, args=(first,))
+    rebuild.start()
+    assert scanning.wait(5)
+    second = sqlite_store.create_invitation('guest-2', group_id, 'guest2@example.org')
+    resume.set()
+    rebuild.join(5)
+
+    assert sqlite_store.invitation_code_filter(first) is True
+    assert sqlite_store.invitation_code_filter(second) is True
+    assert sqlite_store.invitation_code_filter('never-issued') is False
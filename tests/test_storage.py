@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _invitation(store, validity_days=None):
+    group_id = store.create_group('Group', 'https://app', 'App', validity_days=validity_days)
+    return store.create_invitation('guest', group_id, 'guest@example.org')
+
+
+def test_accept_sets_datetime_accepted_once(store):
+    code = _invitation(store)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: store.mark_invitation_accepted(code), range(20)))
+    assert results.count(True) == 1
+    assert store.find_invitation_by_code(code).datetime_accepted
+
+
+def test_accept_rejects_expired_invitation(store):
+    code = _invitation(store, validity_days=1)
+    store.update_invitation(code, expires_at='2000-01-01T00:00:00.000000Z')
+    assert store.mark_invitation_accepted(code) is False
+    assert not store.find_invitation_by_code(code).datetime_accepted
+
+
+def test_accept_rejects_unknown_invitation(store):
+    assert store.mark_invitation_accepted('no-such-code') is False